@@ -0,0 +1,76 @@
+import pandas as pd
+
+# Cubo de agregados de un ledger: sumas diarias de ingresos/gastos, opcionalmente por categoría.
+# Se construye una vez por versión del ledger y los gráficos leen de él en O(días), no O(filas).
+MEASURES = ['Ingresos', 'Gastos', 'Cantidad']
+
+
+# Función para agregar transacciones por día (y dimensiones de categoría)
+def _aggregate(df, dims):
+    monto = df['Monto']
+    frame = pd.DataFrame({
+        'Fecha': df['Fecha'].dt.normalize(),
+        **{dim: df[dim] for dim in dims},
+        'Ingresos': monto.where(monto > 0, 0),
+        'Gastos': (-monto).where(monto < 0, 0),
+        'Cantidad': 1
+    })
+    return frame.groupby(['Fecha', *dims], observed=True, sort=True)[MEASURES].sum()
+
+
+# Función para construir el cubo de un ledger
+def build_cube(df, dims=()):
+    dims = tuple(dims)
+    daily = _aggregate(df, dims)
+    total = daily.groupby(level='Fecha').sum() if dims else daily
+    return {'dims': dims, 'daily': daily, 'total': total}
+
+
+# Función para incorporar transacciones nuevas al cubo sin recorrer el historial
+def append_to_cube(cube, new_rows):
+    if new_rows.empty:
+        return cube
+    dims = cube['dims']
+    delta = _aggregate(new_rows, dims)
+    daily = cube['daily'].add(delta, fill_value=0).astype('int64').sort_index()
+    delta_total = delta.groupby(level='Fecha').sum() if dims else delta
+    total = cube['total'].add(delta_total, fill_value=0).astype('int64').sort_index()
+    return {'dims': dims, 'daily': daily, 'total': total}
+
+
+# Función para recortar el cubo a un rango de fechas (índice ordenado: búsqueda binaria)
+def _date_range(frame, start, end):
+    if start is None and end is None:
+        return frame
+    fechas = frame.index.get_level_values('Fecha')
+    lo = 0 if start is None else fechas.searchsorted(pd.Timestamp(start), side='left')
+    hi = len(fechas) if end is None else fechas.searchsorted(pd.Timestamp(end), side='right')
+    return frame.iloc[lo:hi]
+
+
+# Función para obtener ingresos y gastos por día para una lista de días (0 en días sin movimientos)
+def daily_totals(cube, days, start=None, end=None):
+    totals = _date_range(cube['total'], start, end)
+    return totals.reindex(pd.DatetimeIndex(days).normalize(), fill_value=0)
+
+
+# Función para obtener totales mensuales, opcionalmente abiertos por una dimensión
+def monthly_totals(cube, start=None, end=None, dim=None):
+    if dim is None:
+        frame = _date_range(cube['total'], start, end)
+        keys = [frame.index.to_period('M')]
+    else:
+        frame = _date_range(cube['daily'], start, end)
+        keys = [frame.index.get_level_values('Fecha').to_period('M'), frame.index.get_level_values(dim)]
+    monthly = frame.groupby(keys, observed=True).sum()
+    monthly.index.names = ['Mes'] if dim is None else ['Mes', dim]
+    monthly['Neto'] = monthly['Ingresos'] - monthly['Gastos']
+    return monthly
+
+
+# Función para obtener totales por categoría en un rango de fechas
+def category_totals(cube, dim, start=None, end=None):
+    frame = _date_range(cube['daily'], start, end)
+    totals = frame.groupby(level=dim, observed=True).sum()
+    totals['Neto'] = totals['Ingresos'] - totals['Gastos']
+    return totals
@@ -0,0 +1,189 @@
+import os
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from categorias import categorize_ledger
+
+# Detección de transacciones inusuales: montos atípicos y posibles duplicados.
+# Un monto es atípico si se aleja de la mediana móvil de su grupo (Empresa, Categoria_Hijo) más de
+# ANOMALY_THRESHOLD veces la MAD móvil (desviación absoluta mediana). Mediana y MAD se calculan para todas las
+# filas con un groupby-rolling por grupo sobre las ANOMALY_WINDOW transacciones anteriores (la fila no entra en
+# su propia referencia). Un posible duplicado es una transacción con la misma empresa, descripción, monto y fecha
+# que otra. El estado guarda la cola de cada grupo y los hashes de las filas: las filas nuevas del journal se
+# evalúan contra eso sin volver a recorrer el historial.
+
+# Transacciones anteriores del grupo que forman la referencia de cada fila
+ANOMALY_WINDOW = int(os.environ.get("TRILEDGER_ANOMALY_WINDOW", 30))
+
+# Puntaje robusto (desvío / MAD escalada) a partir del cual un monto es atípico
+ANOMALY_THRESHOLD = float(os.environ.get("TRILEDGER_ANOMALY_THRESHOLD", 3.5))
+
+# Historia mínima del grupo para evaluar una fila
+ANOMALY_MIN_HISTORY = 5
+
+# Escala mínima como fracción de la mediana: los montos fijos (un arriendo) tienen MAD 0 y cualquier variación
+# chica daría un puntaje infinito
+MIN_SCALE_FRACTION = 0.05
+
+# Factor que lleva la MAD a la escala de una desviación estándar (distribución normal)
+MAD_SCALE = 1.4826
+
+GROUP_COLUMNS = ['Empresa', 'Categoria_Hijo']
+KEY_COLUMNS = ['Empresa', 'Descripción', 'Monto', 'Fecha']
+OUTLIER_COLUMNS = ['Fecha', 'Empresa', 'Categoria_Hijo', 'Descripción', 'Monto', 'Mediana', 'Puntaje']
+
+
+# Función para armar las columnas que usa la detección (el ledger de SQLite ya trae Categoria_Hijo). El grupo
+# (Empresa, Categoria_Hijo) se reduce a un hash entero: los groupby no vuelven a factorizar textos y el valor es
+# el mismo en el armado completo y en las actualizaciones.
+def _prepare(df):
+    hijo = df['Categoria_Hijo'] if 'Categoria_Hijo' in df.columns else categorize_ledger(df)['Categoria_Hijo']
+    frame = pd.DataFrame({
+        'Fecha': df['Fecha'].to_numpy(),
+        'Empresa': pd.Categorical(df['Empresa']),
+        'Categoria_Hijo': pd.Categorical(hijo),
+        'Descripción': df['Descripción'].to_numpy(),
+        'Monto': df['Monto'].to_numpy(dtype='float64'),
+        'Desvío': np.nan
+    })
+    return frame.assign(Grupo=pd.util.hash_pandas_object(frame[GROUP_COLUMNS], index=False).to_numpy())
+
+
+# Función para la mediana móvil de una columna sobre las filas anteriores de cada grupo, alineada con el frame
+def _rolling_median(frame, column):
+    rolling = frame.groupby('Grupo', sort=False)[column].rolling(
+        ANOMALY_WINDOW, min_periods=ANOMALY_MIN_HISTORY, closed='left'
+    ).median()
+    return rolling.droplevel(0).reindex(frame.index)
+
+
+# Función para calcular mediana, desvío y puntaje robusto de cada fila. Las filas que ya traen su desvío (la cola
+# guardada de cada grupo) lo conservan: así la MAD de las filas nuevas es la misma que con el historial completo.
+def _score(frame):
+    median = _rolling_median(frame, 'Monto')
+    deviation = frame['Desvío'].fillna((frame['Monto'] - median).abs())
+    frame = frame.assign(Mediana=median, Desvío=deviation)
+    mad = _rolling_median(frame, 'Desvío')
+    scale = np.maximum(np.maximum(MAD_SCALE * mad, MIN_SCALE_FRACTION * median.abs()), 1.0)
+    return frame.assign(Puntaje=(frame['Monto'] - median) / scale)
+
+
+# Función para obtener las filas con montos atípicos de un frame ya puntuado
+def _outliers(scored):
+    flagged = scored[scored['Puntaje'].abs() > ANOMALY_THRESHOLD]
+    return flagged[OUTLIER_COLUMNS].astype({'Empresa': object, 'Categoria_Hijo': object}).reset_index(drop=True)
+
+
+# Función para el hash de la clave de duplicado de cada fila (empresa, descripción, monto, fecha)
+def _row_hashes(frame):
+    return pd.util.hash_pandas_object(frame[KEY_COLUMNS], index=False).to_numpy()
+
+
+# Función para armar la tabla de posibles duplicados: una fila por clave repetida, con la cantidad de veces
+def _duplicates(candidates, hashes, counts):
+    position = np.searchsorted(hashes, candidates['Hash'].to_numpy())
+    times = counts[position]
+    duplicates = candidates.assign(Veces=times)[times > 1]
+    return duplicates.drop_duplicates('Hash').sort_values(['Fecha', 'Hash'], ignore_index=True)
+
+
+# Función para concatenar dos tablas omitiendo la vacía (pandas avisa que con ellas cambiará el tipo del resultado)
+def _concat(first, second):
+    if first.empty:
+        return second.reset_index(drop=True)
+    if second.empty:
+        return first
+    return pd.concat([first, second], ignore_index=True)
+
+
+# Función para la cola de cada grupo: las últimas ANOMALY_WINDOW filas, referencia de las filas que lleguen después
+def _tails(scored):
+    return scored.groupby('Grupo', sort=False).tail(ANOMALY_WINDOW)[
+        ['Fecha', 'Empresa', 'Categoria_Hijo', 'Descripción', 'Monto', 'Desvío', 'Grupo']
+    ].reset_index(drop=True)
+
+
+# Función para construir el estado de anomalías de un ledger (ordenado por Fecha dentro de cada empresa, como el
+# consolidado). Los atípicos quedan por Fecha, el mismo orden que dejan las actualizaciones.
+def build_anomalies(df):
+    scored = _score(_prepare(df))
+    row_hashes = _row_hashes(scored)
+    hashes, first, counts = np.unique(row_hashes, return_index=True, return_counts=True)
+    repeated = first[counts > 1]
+    candidates = scored.iloc[repeated][KEY_COLUMNS].assign(Hash=row_hashes[repeated])
+    return {
+        'tails': _tails(scored),
+        'hashes': hashes,
+        'counts': counts,
+        'outliers': _outliers(scored).sort_values('Fecha', kind='mergesort', ignore_index=True),
+        'duplicates': _duplicates(candidates, hashes, counts)
+    }
+
+
+# Función para incorporar las filas nuevas del journal: se puntúan a continuación de la cola de su grupo y sus
+# hashes se suman a los conteos. Las filas ya marcadas no se re-evalúan; el estado anterior no se modifica.
+def update_anomalies(state, new_rows):
+    if new_rows.empty:
+        return state
+    new = _prepare(new_rows).sort_values('Fecha', kind='mergesort', ignore_index=True)
+    tails = state['tails']
+    scored = _score(pd.concat([tails, new], ignore_index=True)).iloc[len(tails):]
+
+    new_hashes = _row_hashes(new)
+    unique_new, new_counts = np.unique(new_hashes, return_counts=True)
+    position = np.searchsorted(state['hashes'], unique_new)
+    found = position < len(state['hashes'])
+    found[found] = state['hashes'][position[found]] == unique_new[found]
+    counts = state['counts'].copy()
+    counts[position[found]] += new_counts[found]
+    hashes = np.insert(state['hashes'], position[~found], unique_new[~found])
+    counts = np.insert(counts, position[~found], new_counts[~found])
+
+    candidates = _concat(state['duplicates'][[*KEY_COLUMNS, 'Hash']], new[KEY_COLUMNS].assign(Hash=new_hashes))
+    return {
+        'tails': _tails(pd.concat([tails, scored], ignore_index=True)),
+        'hashes': hashes,
+        'counts': counts,
+        'outliers': _concat(state['outliers'], _outliers(scored)).sort_values('Fecha', kind='mergesort', ignore_index=True),
+        'duplicates': _duplicates(candidates, hashes, counts)
+    }
+
+
+# Función para recortar una tabla de anomalías a un rango de fechas
+def _in_range(frame, start, end):
+    fechas = frame['Fecha']
+    return frame[(fechas >= pd.Timestamp(start)) & (fechas < pd.Timestamp(end) + pd.Timedelta(days=1))]
+
+
+# Función para mostrar el panel de transacciones inusuales del rango elegido
+def render_anomalies(state, start, end):
+    outliers = _in_range(state['outliers'], start, end)
+    duplicates = _in_range(state['duplicates'], start, end)
+    title = f"🚨 Transacciones inusuales ({len(outliers)} montos atípicos, {len(duplicates)} posibles duplicados)"
+    with st.expander(title, expanded=not (outliers.empty and duplicates.empty)):
+        st.caption(
+            f"Montos a más de {ANOMALY_THRESHOLD:g} MAD de la mediana de las últimas {ANOMALY_WINDOW} transacciones "
+            "de su empresa y subcategoría; duplicados con la misma empresa, descripción, monto y fecha."
+        )
+        if outliers.empty and duplicates.empty:
+            st.success("No hay transacciones inusuales en el rango seleccionado.")
+            return
+        if not outliers.empty:
+            st.markdown("**Montos atípicos**")
+            outliers = outliers.reindex(outliers['Puntaje'].abs().sort_values(ascending=False).index)
+            st.dataframe(
+                outliers.assign(Fecha=outliers['Fecha'].dt.strftime('%d/%m/%Y')).style.format(
+                    {'Monto': '${:,.0f}', 'Mediana': '${:,.0f}', 'Puntaje': '{:+.1f}'}
+                ),
+                use_container_width=True, hide_index=True
+            )
+        if not duplicates.empty:
+            st.markdown("**Posibles duplicados**")
+            st.dataframe(
+                duplicates.drop(columns='Hash').assign(Fecha=duplicates['Fecha'].dt.strftime('%d/%m/%Y')).style.format(
+                    {'Monto': '${:,.0f}'}
+                ),
+                use_container_width=True, hide_index=True
+            )
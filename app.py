@@ -5,6 +5,14 @@ import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import random
 
+import numpy as np
+
+from kpis import KPI_FIELDS, build_kpis, kpi_summary
+from rendimiento import finish_run, render_performance_panel, set_run_page, start_run, timed
+
+# Copy-on-write: los recortes por empresa comparten los datos cacheados y solo se copian si se modifican
+pd.set_option("mode.copy_on_write", True)
+
 # Configuración de la página
 st.set_page_config(
     page_title="Tri-Ledger - Dashboard Financiero",
@@ -13,6 +21,9 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Medición de tiempos de esta ejecución (panel de rendimiento con ?admin=1)
+start_run('app')
+
 # Estilos CSS personalizados
 st.markdown("""
 <style>
@@ -279,25 +290,33 @@ def generate_sample_data():
     
     return companies, transactions_data
 
+# Función para generar los datos y particionarlos por empresa una sola vez (compartido entre sesiones)
+@st.cache_resource
+def load_sample_ledger():
+    companies, transactions_data = generate_sample_data()
+    df = pd.DataFrame(transactions_data)
+    df['Empresa'] = pd.Categorical(df['Empresa'], categories=companies)
+    partitions = {company: group for company, group in df.groupby('Empresa', observed=False)}
+    kpi_state = build_kpis(df, dims=('Empresa',))
+    return companies, df, partitions, kpi_state
+
 # Generar datos
-companies, transactions_data = generate_sample_data()
-df_transactions = pd.DataFrame(transactions_data)
+with timed('load'):
+    companies, df_transactions, company_partitions, kpi_state = load_sample_ledger()
 
 # Inicializar session state para empresa seleccionada
 if 'selected_company' not in st.session_state:
     st.session_state.selected_company = companies[0]  # Seleccionar la primera empresa por defecto
 
-# Función para filtrar datos por empresa
-def filter_data_by_company(df, company):
-    return df[df['Empresa'] == company]
-
-# Filtrar datos por empresa seleccionada
-filtered_df = filter_data_by_company(df_transactions, st.session_state.selected_company)
+# Datos de la empresa seleccionada: búsqueda directa en las particiones, sin volver a filtrar
+filtered_df = company_partitions[st.session_state.selected_company]
 
 # Cálculos financieros
-total_income = filtered_df[filtered_df['Monto'] > 0]['Monto'].sum()
-total_expenses = abs(filtered_df[filtered_df['Monto'] < 0]['Monto'].sum())
-current_balance = total_income - total_expenses
+with timed('aggregate'):
+    kpis = kpi_summary(kpi_state['groups'].get((st.session_state.selected_company,), np.zeros(len(KPI_FIELDS), dtype='int64')))
+total_income = kpis['Ingresos']
+total_expenses = kpis['Gastos']
+current_balance = kpis['Saldo']
 
 # Sidebar
 with st.sidebar:
@@ -306,6 +325,7 @@ with st.sidebar:
     # Navegación
     st.markdown("### Navegación")
     page = st.radio("Seleccionar página", ["Dashboard", "Transacciones", "Reportes"], label_visibility="collapsed")
+    set_run_page(page)
     
     # Filtros
     st.markdown("### Filtros")
@@ -381,56 +401,58 @@ if page == "Dashboard":
         fig = go.Figure()
         
         # Procesar datos reales de las transacciones para los últimos 7 días
-        recent_data = filtered_df.copy()
-        recent_data['Fecha'] = pd.to_datetime(recent_data['Fecha'], format='%d/%m/%Y')
+        with timed('parse'):
+            recent_data = filtered_df.assign(Fecha=pd.to_datetime(filtered_df['Fecha'], format='%d/%m/%Y'))
         
-        # Obtener las fechas de los últimos 7 días
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=6)
+        with timed('aggregate'):
+            # Obtener las fechas de los últimos 7 días
+            end_date = datetime.now()
+            start_date = end_date - timedelta(days=6)
         
-        # Crear rango de fechas
-        date_range = pd.date_range(start=start_date, end=end_date, freq='D')
+            # Crear rango de fechas
+            date_range = pd.date_range(start=start_date, end=end_date, freq='D')
         
-        # Agrupar datos por fecha
-        daily_income = []
-        daily_expenses = []
-        dates_formatted = []
+            # Agrupar datos por fecha
+            daily_income = []
+            daily_expenses = []
+            dates_formatted = []
         
-        for date in date_range:
-            date_str = date.strftime('%d/%m')
-            dates_formatted.append(date_str)
+            for date in date_range:
+                date_str = date.strftime('%d/%m')
+                dates_formatted.append(date_str)
             
-            # Filtrar transacciones para esta fecha
-            day_data = recent_data[recent_data['Fecha'].dt.date == date.date()]
+                # Filtrar transacciones para esta fecha
+                day_data = recent_data[recent_data['Fecha'].dt.date == date.date()]
             
-            # Calcular ingresos y gastos del día
-            day_income = day_data[day_data['Monto'] > 0]['Monto'].sum()
-            day_expenses = abs(day_data[day_data['Monto'] < 0]['Monto'].sum())
+                # Calcular ingresos y gastos del día
+                day_income = day_data[day_data['Monto'] > 0]['Monto'].sum()
+                day_expenses = abs(day_data[day_data['Monto'] < 0]['Monto'].sum())
             
-            daily_income.append(day_income)
-            daily_expenses.append(day_expenses)
-        
-        fig.add_trace(go.Bar(
-            name='Ingresos',
-            x=dates_formatted,
-            y=daily_income,
-            marker_color='#11998e'
-        ))
-        
-        fig.add_trace(go.Bar(
-            name='Gastos',
-            x=dates_formatted,
-            y=daily_expenses,
-            marker_color='#ff416c'
-        ))
-        
-        fig.update_layout(
-            title="Flujo de Caja - Últimos 7 días",
-            xaxis_title="Fecha",
-            yaxis_title="Monto ($)",
-            barmode='group',
-            height=400
-        )
+                daily_income.append(day_income)
+                daily_expenses.append(day_expenses)
+        
+        with timed('figure'):
+            fig.add_trace(go.Bar(
+                name='Ingresos',
+                x=dates_formatted,
+                y=daily_income,
+                marker_color='#11998e'
+            ))
+        
+            fig.add_trace(go.Bar(
+                name='Gastos',
+                x=dates_formatted,
+                y=daily_expenses,
+                marker_color='#ff416c'
+            ))
+        
+            fig.update_layout(
+                title="Flujo de Caja - Últimos 7 días",
+                xaxis_title="Fecha",
+                yaxis_title="Monto ($)",
+                barmode='group',
+                height=400
+            )
         
         st.plotly_chart(fig, use_container_width=True)
     
@@ -496,22 +518,26 @@ elif page == "Reportes":
         
         # Gráfico de torta por empresa
         # Mostrar distribución por tipo de transacción para la empresa seleccionada
-        type_data = filtered_df.groupby('Tipo')['Monto'].sum().reset_index()
-        fig_pie = px.pie(type_data, values='Monto', names='Tipo', title=f"Distribución por Tipo - {st.session_state.selected_company}")
+        with timed('aggregate'):
+            type_data = filtered_df.groupby('Tipo')['Monto'].sum().reset_index()
+        with timed('figure'):
+            fig_pie = px.pie(type_data, values='Monto', names='Tipo', title=f"Distribución por Tipo - {st.session_state.selected_company}")
         st.plotly_chart(fig_pie, use_container_width=True)
     
     with col2:
         st.markdown('<h3 class="section-title">Tendencia Mensual</h3>', unsafe_allow_html=True)
         
         # Gráfico de línea de tendencia
-        monthly_data = filtered_df.copy()
-        monthly_data['Fecha'] = pd.to_datetime(monthly_data['Fecha'], format='%d/%m/%Y')
-        monthly_summary = monthly_data.groupby(monthly_data['Fecha'].dt.to_period('M'))['Monto'].sum().reset_index()
-        monthly_summary['Fecha'] = monthly_summary['Fecha'].astype(str)
+        with timed('parse'):
+            monthly_data = filtered_df.assign(Fecha=pd.to_datetime(filtered_df['Fecha'], format='%d/%m/%Y'))
+        with timed('aggregate'):
+            monthly_summary = monthly_data.groupby(monthly_data['Fecha'].dt.to_period('M'))['Monto'].sum().reset_index()
+            monthly_summary['Fecha'] = monthly_summary['Fecha'].astype(str)
         
         title = f"Tendencia de Flujo de Caja - {st.session_state.selected_company}"
         
-        fig_line = px.line(monthly_summary, x='Fecha', y='Monto', title=title)
+        with timed('figure'):
+            fig_line = px.line(monthly_summary, x='Fecha', y='Monto', title=title)
         st.plotly_chart(fig_line, use_container_width=True)
 
 # Footer
@@ -521,4 +547,9 @@ st.markdown("""
     <p>Tri-Ledger Dashboard - Sistema de Gestión Financiera</p>
     <p>Desarrollado con Streamlit</p>
 </div>
-""", unsafe_allow_html=True) 
\ No newline at end of file
+""", unsafe_allow_html=True) 
+
+# Tiempos de la ejecución y panel de rendimiento (modo administración)
+finish_run()
+with st.sidebar:
+    render_performance_panel('app')
@@ -2,8 +2,34 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+import re
 from datetime import datetime, timedelta
-import os
+
+import ledger_sqlite
+from agregados import append_to_cube, build_cube, category_totals, monthly_totals
+from busqueda import build_search_index, search_frame, update_search_index
+from categorias import CATEGORIAS_PADRE, LEDGER_RULES_HASH
+from derivados import LEDGER, lazy_datasets, node, run_entry
+from exportacion import render_export
+from graficos import cached_figure, figure_key
+from ledger_store import append_company_transaction
+from kpis import append_to_kpis, build_kpis, kpi_summary, kpi_table
+from memoria import register_session, render_memory_report
+from pronostico import build_forecast, render_forecast
+from recategorizacion import (
+    CATEGORIZED_NAME, append_categorized, categorization_pending, categorize_frame, job_status, start_job,
+    start_job_if_rules_changed
+)
+from refresco import (
+    current_snapshot, render_refresh_status, request_refresh, snapshot_datasets, snapshot_entry, start_refresh_worker
+)
+from rendimiento import finish_run, render_performance_panel, set_run_page, start_run, timed
+from tabla_transacciones import default_columns, render_transaction_table
+from temas import get_company_theme, minify_css
+
+# Copy-on-write: los DataFrames de la sesión comparten los arreglos del caché de ledgers; una columna solo se
+# copia si se modifica, así el ledger compartido nunca se altera
+pd.set_option("mode.copy_on_write", True)
 
 # Configuración de la página
 st.set_page_config(
@@ -13,108 +39,11 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Definir categorías jerárquicas
-CATEGORIAS_PADRE = {
-    "Ingresos": {
-        "color": "#10b981",
-        "icon": "📈",
-        "subcategorias": [
-            "Ventas de Paquetes",
-            "Comisiones",
-            "Servicios Turísticos",
-            "Otros Ingresos"
-        ]
-    },
-    "Gastos Operacionales": {
-        "color": "#ef4444", 
-        "icon": "🏢",
-        "subcategorias": [
-            "Arriendo de Oficina",
-            "Servicios Básicos",
-            "Equipos y Tecnología",
-            "Software y Licencias",
-            "Mantenimiento"
-        ]
-    },
-    "Gastos Administrativos": {
-        "color": "#f97316",
-        "icon": "📋",
-        "subcategorias": [
-            "Impuestos",
-            "Tasas Gubernamentales",
-            "Seguros",
-            "Gastos Legales"
-        ]
-    },
-    "Gastos de Personal": {
-        "color": "#8b5cf6",
-        "icon": "👥",
-        "subcategorias": [
-            "Salarios",
-            "Beneficios",
-            "Capacitación",
-            "Viáticos"
-        ]
-    },
-    "Gastos de Marketing": {
-        "color": "#06b6d4",
-        "icon": "📢",
-        "subcategorias": [
-            "Publicidad",
-            "Promociones",
-            "Material Promocional",
-            "Eventos"
-        ]
-    },
-    "Gastos de Viaje": {
-        "color": "#eab308",
-        "icon": "✈️",
-        "subcategorias": [
-            "Transporte",
-            "Alojamiento",
-            "Alimentación",
-            "Actividades"
-        ]
-    }
-}
-
-# Función para obtener el tema CSS según la empresa
-def get_company_theme(company):
-    themes = {
-        "W TRAVEL CHILE": {
-            "primary": "#1e3a8a",
-            "secondary": "#3b82f6", 
-            "accent": "#fbbf24",
-            "light": "#f8fafc",
-            "gradient": "linear-gradient(135deg, #1e3a8a 0%, #3b82f6 100%)",
-            "income_gradient": "linear-gradient(135deg, #059669 0%, #10b981 100%)",
-            "expense_gradient": "linear-gradient(135deg, #dc2626 0%, #ef4444 100%)",
-            "logo": "🌍"
-        },
-        "WOLF TRAVEL CHILE": {
-            "primary": "#166534",
-            "secondary": "#22c55e",
-            "accent": "#ea580c", 
-            "light": "#f0fdf4",
-            "gradient": "linear-gradient(135deg, #166534 0%, #22c55e 100%)",
-            "income_gradient": "linear-gradient(135deg, #059669 0%, #10b981 100%)",
-            "expense_gradient": "linear-gradient(135deg, #dc2626 0%, #ef4444 100%)",
-            "logo": "🐺"
-        },
-        "HELPMETRAVEL SPA": {
-            "primary": "#7c3aed",
-            "secondary": "#a855f7",
-            "accent": "#1e40af",
-            "light": "#faf5ff", 
-            "gradient": "linear-gradient(135deg, #7c3aed 0%, #a855f7 100%)",
-            "income_gradient": "linear-gradient(135deg, #059669 0%, #10b981 100%)",
-            "expense_gradient": "linear-gradient(135deg, #dc2626 0%, #ef4444 100%)",
-            "logo": "🏢"
-        }
-    }
-    return themes.get(company, themes["W TRAVEL CHILE"])
+# Medición de tiempos de esta ejecución (panel de rendimiento con ?admin=1)
+start_run('app_categorias')
 
-# Función para generar CSS dinámico
+# Función para generar CSS dinámico (memoizada por empresa y modo; Streamlit la conserva entre reruns)
+@st.cache_data(show_spinner=False)
 def generate_dynamic_css(company, dark_mode=True):
     theme = get_company_theme(company)
     
@@ -134,7 +63,7 @@ def generate_dynamic_css(company, dark_mode=True):
         hover_bg = "#f8f9fa"
         sidebar_bg = "#f8fafc"
     
-    return f"""
+    return minify_css(f"""
     <style>
         /* Variables CSS dinámicas */
         :root {{
@@ -296,55 +225,74 @@ def generate_dynamic_css(company, dark_mode=True):
             color: var(--text-color) !important;
         }}
     </style>
-    """
-
-# Función para cargar datos desde CSV
-def load_company_data(company):
-    csv_files = {
-        "W TRAVEL CHILE": "w_travel_chile.csv",
-        "WOLF TRAVEL CHILE": "wolf_travel_chile.csv", 
-        "HELPMETRAVEL SPA": "helpmetravel_spa.csv"
-    }
-    
-    csv_file = csv_files.get(company)
-    if csv_file and os.path.exists(csv_file):
-        df = pd.read_csv(csv_file)
-        return df
-    else:
-        st.error(f"Archivo CSV no encontrado para {company}")
-        return pd.DataFrame()
+    """)
 
-# Función para categorizar transacciones
-def categorize_transaction(description, transaction_type):
-    description_lower = description.lower()
-    
-    # Categorizar ingresos
-    if transaction_type == "Ingreso":
-        if any(word in description_lower for word in ['paquete', 'turístico', 'viaje', 'reserva']):
-            return "Ingresos", "Ventas de Paquetes"
-        elif any(word in description_lower for word in ['comisión', 'comision']):
-            return "Ingresos", "Comisiones"
-        elif any(word in description_lower for word in ['servicio', 'tour', 'guía']):
-            return "Ingresos", "Servicios Turísticos"
-        else:
-            return "Ingresos", "Otros Ingresos"
-    
-    # Categorizar gastos
-    else:
-        if any(word in description_lower for word in ['arriendo', 'oficina', 'rent']):
-            return "Gastos Operacionales", "Arriendo de Oficina"
-        elif any(word in description_lower for word in ['servicios', 'básicos', 'luz', 'agua', 'gas']):
-            return "Gastos Operacionales", "Servicios Básicos"
-        elif any(word in description_lower for word in ['equipos', 'computación', 'software', 'audiovisuales']):
-            return "Gastos Operacionales", "Equipos y Tecnología"
-        elif any(word in description_lower for word in ['mantenimiento']):
-            return "Gastos Operacionales", "Mantenimiento"
-        elif any(word in description_lower for word in ['impuestos', 'tasas', 'gubernamentales']):
-            return "Gastos Administrativos", "Impuestos"
-        elif any(word in description_lower for word in ['supermercado', 'provisiones', 'alimentación']):
-            return "Gastos de Viaje", "Alimentación"
-        else:
-            return "Gastos Operacionales", "Otros Gastos"
+# Dimensiones de categoría del cubo y de los KPIs
+CATEGORY_DIMS = ('Categoria_Padre', 'Categoria_Hijo')
+
+# Los derivados categorizados llevan el hash de las reglas: si cambia la taxonomía se recalculan
+CATEGORY_CUBE_NAME = f'cube_categorias_{LEDGER_RULES_HASH}'
+CATEGORY_KPIS_NAME = f'kpis_categorias_{LEDGER_RULES_HASH}'
+PARENT_TOTALS_NAME = f'totales_padre_{LEDGER_RULES_HASH}'
+CHILD_TOTALS_NAME = f'totales_hijo_{LEDGER_RULES_HASH}'
+MONTHLY_PARENT_NAME = f'mensual_padre_{LEDGER_RULES_HASH}'
+FORECAST_NAME = f'pronostico_{LEDGER_RULES_HASH}'
+
+# Índice de búsqueda de descripciones (no depende de las reglas)
+SEARCH_NAME = 'busqueda'
+
+# Función para construir el cubo de agregados diarios por categoría
+def build_category_cube(df):
+    return build_cube(df, dims=CATEGORY_DIMS)
+
+# Función para incorporar al cubo las transacciones nuevas del journal
+def append_to_category_cube(cube, new_rows):
+    return append_to_cube(cube, categorize_frame(new_rows))
+
+# Función para construir el estado de KPIs por categoría padre e hijo
+def build_category_kpis(df):
+    return build_kpis(df, dims=CATEGORY_DIMS)
+
+# Función para incorporar a los KPIs las transacciones nuevas del journal
+def append_category_kpis(state, new_rows):
+    return append_to_kpis(state, categorize_frame(new_rows))
+
+# Función para obtener el monto total (valor absoluto del neto) por categoría
+def category_amounts(cube, dim):
+    return category_totals(cube, dim)['Neto'].abs().rename('Monto').reset_index()
+
+# Función para obtener la evolución mensual del neto por categoría padre (Mes como texto para el gráfico)
+def monthly_parent_amounts(cube):
+    monthly = monthly_totals(cube, dim='Categoria_Padre')['Neto'].rename('Monto').reset_index()
+    return monthly.assign(Mes=monthly['Mes'].astype(str))
+
+# Función para pronosticar el flujo de caja del total y de cada categoría padre en la misma pasada
+def build_parent_forecast(cube):
+    return build_forecast(cube, 'Categoria_Padre')
+
+# Datasets derivados del ledger: cada página pide solo los que muestra y se calculan una vez por versión
+CATEGORY_GRAPH = {
+    CATEGORIZED_NAME: node(categorize_frame, updater=append_categorized, stage='categorize'),
+    CATEGORY_CUBE_NAME: node(build_category_cube, deps=(CATEGORIZED_NAME,), updater=append_to_category_cube),
+    CATEGORY_KPIS_NAME: node(build_category_kpis, deps=(CATEGORIZED_NAME,), updater=append_category_kpis),
+    PARENT_TOTALS_NAME: node(lambda cube: category_amounts(cube, 'Categoria_Padre'), deps=(CATEGORY_CUBE_NAME,)),
+    CHILD_TOTALS_NAME: node(
+        lambda cube: category_amounts(cube, 'Categoria_Hijo').sort_values('Monto', ascending=False, ignore_index=True),
+        deps=(CATEGORY_CUBE_NAME,)
+    ),
+    MONTHLY_PARENT_NAME: node(monthly_parent_amounts, deps=(CATEGORY_CUBE_NAME,)),
+    FORECAST_NAME: node(build_parent_forecast, deps=(CATEGORY_CUBE_NAME,)),
+    SEARCH_NAME: node(build_search_index, updater=update_search_index, stage='index')
+}
+
+# Función para obtener el grafo con SQLite: el ledger ya viene categorizado y el cubo es un GROUP BY
+def sqlite_graph(company):
+    return {
+        **CATEGORY_GRAPH,
+        LEDGER: node(lambda: ledger_sqlite.load_transactions(company), deps=(), stage='load'),
+        CATEGORIZED_NAME: node(lambda df: df, stage='categorize'),
+        CATEGORY_CUBE_NAME: node(lambda: ledger_sqlite.build_cube(company, dims=CATEGORY_DIMS), deps=())
+    }
 
 # Inicializar session state
 if 'selected_company' not in st.session_state:
@@ -356,18 +304,72 @@ if 'selected_category' not in st.session_state:
 if 'dark_mode' not in st.session_state:
     st.session_state.dark_mode = True  # Por defecto en modo oscuro
 
-# Cargar datos de la empresa seleccionada
-df_transactions = load_company_data(st.session_state.selected_company)
+# Backend de datos: CSV (por defecto) o SQLite con TRILEDGER_BACKEND=sqlite
+USE_SQLITE = ledger_sqlite.sqlite_enabled()
 
-# Aplicar categorización si no existe
-if not df_transactions.empty and 'Categoria_Padre' not in df_transactions.columns:
-    df_transactions['Categoria_Padre'] = ''
-    df_transactions['Categoria_Hijo'] = ''
-    
-    for idx, row in df_transactions.iterrows():
-        cat_padre, cat_hijo = categorize_transaction(row['Descripción'], row['Tipo'])
-        df_transactions.at[idx, 'Categoria_Padre'] = cat_padre
-        df_transactions.at[idx, 'Categoria_Hijo'] = cat_hijo
+# Acceso perezoso a los datasets de la empresa seleccionada. Con CSV se lee la última instantánea del hilo
+# de refresco; con SQLite cada dataset se consulta a lo sumo una vez por ejecución.
+with timed('load'):
+    if USE_SQLITE:
+        snapshot = None
+        datasets = lazy_datasets(run_entry(), sqlite_graph(st.session_state.selected_company))
+    else:
+        start_refresh_worker()
+        snapshot = current_snapshot()
+        datasets = snapshot_datasets(snapshot, st.session_state.selected_company, CATEGORY_GRAPH)
+
+# Si cambió la taxonomía, un trabajo en segundo plano re-categoriza el historial y publica el ledger categorizado
+# de cada empresa; mientras prepara el de la empresa elegida, las páginas muestran su avance en vez de categorizar
+auto_job = None if USE_SQLITE else start_job_if_rules_changed()
+recategorizing = categorization_pending(auto_job, snapshot_entry(snapshot, st.session_state.selected_company))
+
+# Ledger de la empresa (sin categorizar: la página Transacciones pide el categorizado)
+if datasets is not None:
+    df_transactions = datasets(LEDGER)
+else:
+    st.error(f"Archivo CSV no encontrado para {st.session_state.selected_company}")
+    df_transactions = pd.DataFrame()
+
+# Función para armar la clave de caché de un gráfico con la empresa, versión de datos, tema y modo actuales
+def chart_key(name, *params):
+    version = None if snapshot is None else snapshot['version']
+    return figure_key(
+        name, st.session_state.selected_company, version,
+        get_company_theme(st.session_state.selected_company)['primary'], st.session_state.dark_mode, *params
+    )
+
+# Función para mostrar la exportación del ledger categorizado de la empresa actual con los filtros de categoría
+def render_ledger_export(frame, name, filters=(), rows=None):
+    company = st.session_state.selected_company
+    version = None if snapshot is None else snapshot['version']
+    file_name = '_'.join(re.sub(r'\W+', '_', part.lower()).strip('_') for part in (name, company, *filters))
+    render_export(frame, file_name, f"categorias_exportar_{name}", (company, *filters), version, rows)
+
+# Función para mostrar el avance de un trabajo en curso (se refresca sola cada segundo mientras corre; al terminar
+# vuelve a ejecutar la página, que ya no monta el fragmento)
+@st.fragment(run_every=1)
+def show_running_progress(job_id):
+    job = job_status(job_id)
+    if job is None or job['status'] != "running":
+        st.rerun()
+    fraction = job['done'] / job['total'] if job['total'] else 0.0
+    st.progress(fraction, text=f"Re-categorizando {job['current'] or '...'}: {job['done']:,} de {job['total']:,} descripciones")
+
+# Función para mostrar el estado de la re-categorización masiva
+def show_recategorization_progress(job_id):
+    job = job_status(job_id)
+    if job is None:
+        return
+    if job['status'] == "running":
+        show_running_progress(job_id)
+    elif job['status'] == "done":
+        seconds = job['finished'] - job['started']
+        st.success(
+            f"✅ {job['rows']:,} transacciones re-categorizadas en {seconds:.1f} s "
+            f"({job['rows'] / seconds if seconds else 0:,.0f} filas/s)"
+        )
+    else:
+        st.error(f"❌ Error al re-categorizar: {job['error']}")
 
 # Aplicar CSS dinámico
 st.markdown(generate_dynamic_css(st.session_state.selected_company, st.session_state.dark_mode), unsafe_allow_html=True)
@@ -400,6 +402,7 @@ with st.sidebar:
     # Navegación
     st.markdown("### 📊 Navegación")
     page = st.radio("Seleccionar página", ["Dashboard", "Categorías", "Transacciones", "Reportes"], label_visibility="collapsed")
+    set_run_page(page)
     
     # Filtros
     st.markdown("### 🔍 Filtros")
@@ -421,7 +424,12 @@ with st.sidebar:
         st.rerun()
 
 # Contenido principal
-if page == "Dashboard":
+if recategorizing:
+    st.markdown('<h1 class="main-header">🔄 Actualizando Categorías</h1>', unsafe_allow_html=True)
+    st.info("La taxonomía cambió: se están re-categorizando las transacciones de todas las empresas.")
+    show_recategorization_progress(auto_job)
+
+elif page == "Dashboard":
     # Header principal
     theme = get_company_theme(st.session_state.selected_company)
     st.markdown(f"""
@@ -439,9 +447,10 @@ if page == "Dashboard":
     
     if not df_transactions.empty:
         # Cálculos financieros por categorías
-        total_income = df_transactions[df_transactions['Monto'] > 0]['Monto'].sum()
-        total_expenses = abs(df_transactions[df_transactions['Monto'] < 0]['Monto'].sum())
-        current_balance = total_income - total_expenses
+        kpis = kpi_summary(datasets(CATEGORY_KPIS_NAME)['total'])
+        total_income = kpis['Ingresos']
+        total_expenses = kpis['Gastos']
+        current_balance = kpis['Saldo']
         
         # Métricas principales
         st.markdown("### 💰 Resumen Financiero")
@@ -481,42 +490,47 @@ if page == "Dashboard":
             st.markdown('<h3 class="section-title">📊 Distribución por Categorías Padre</h3>', unsafe_allow_html=True)
             
             # Gráfico de categorías padre
-            category_data = df_transactions.groupby('Categoria_Padre')['Monto'].sum().reset_index()
-            category_data['Monto'] = category_data['Monto'].apply(lambda x: abs(x))
+            def build_parent_pie_figure():
+                category_data = datasets(PARENT_TOTALS_NAME)
+                
+                fig_pie = px.pie(
+                    category_data,
+                    values='Monto',
+                    names='Categoria_Padre',
+                    title="Distribución por Categorías Padre",
+                    color_discrete_map={
+                        'Ingresos': '#10b981',
+                        'Gastos Operacionales': '#ef4444',
+                        'Gastos Administrativos': '#f97316',
+                        'Gastos de Personal': '#8b5cf6',
+                        'Gastos de Marketing': '#06b6d4',
+                        'Gastos de Viaje': '#eab308'
+                    }
+                )
+                return fig_pie
             
-            fig_pie = px.pie(
-                category_data,
-                values='Monto',
-                names='Categoria_Padre',
-                title="Distribución por Categorías Padre",
-                color_discrete_map={
-                    'Ingresos': '#10b981',
-                    'Gastos Operacionales': '#ef4444',
-                    'Gastos Administrativos': '#f97316',
-                    'Gastos de Personal': '#8b5cf6',
-                    'Gastos de Marketing': '#06b6d4',
-                    'Gastos de Viaje': '#eab308'
-                }
-            )
+            fig_pie = cached_figure(chart_key('padre_torta'), build_parent_pie_figure)
             st.plotly_chart(fig_pie, use_container_width=True)
         
         with col2:
             st.markdown('<h3 class="section-title">📊 Top 5 Subcategorías</h3>', unsafe_allow_html=True)
             
             # Gráfico de subcategorías
-            subcategory_data = df_transactions.groupby('Categoria_Hijo')['Monto'].sum().reset_index()
-            subcategory_data['Monto'] = subcategory_data['Monto'].apply(lambda x: abs(x))
-            subcategory_data = subcategory_data.sort_values('Monto', ascending=False).head(5)
+            def build_top_children_figure():
+                subcategory_data = datasets(CHILD_TOTALS_NAME).head(5)
+                
+                fig_bars = px.bar(
+                    subcategory_data,
+                    x='Categoria_Hijo',
+                    y='Monto',
+                    title="Top 5 Subcategorías por Monto",
+                    color='Monto',
+                    color_continuous_scale='viridis'
+                )
+                fig_bars.update_layout(xaxis={'tickangle': 45})
+                return fig_bars
             
-            fig_bars = px.bar(
-                subcategory_data,
-                x='Categoria_Hijo',
-                y='Monto',
-                title="Top 5 Subcategorías por Monto",
-                color='Monto',
-                color_continuous_scale='viridis'
-            )
-            fig_bars.update_layout(xaxis={'tickangle': 45})
+            fig_bars = cached_figure(chart_key('top_subcategorias'), build_top_children_figure)
             st.plotly_chart(fig_bars, use_container_width=True)
 
 elif page == "Categorías":
@@ -559,26 +573,41 @@ elif page == "Categorías":
         with col1:
             # Resumen por categoría padre
             st.markdown("#### Por Categoría Padre")
-            category_summary = df_transactions.groupby('Categoria_Padre').agg({
-                'Monto': ['sum', 'count']
-            }).reset_index()
-            category_summary.columns = ['Categoría Padre', 'Total', 'Cantidad']
+            category_summary = kpi_table(datasets(CATEGORY_KPIS_NAME), 'Categoria_Padre')[['Neto', 'Cantidad', 'Promedio']].reset_index()
+            category_summary.columns = ['Categoría Padre', 'Total', 'Cantidad', 'Promedio']
             category_summary['Total'] = category_summary['Total'].apply(lambda x: f"${abs(x):,.0f}")
+            category_summary['Promedio'] = category_summary['Promedio'].apply(lambda x: f"${x:,.0f}")
             st.dataframe(category_summary, use_container_width=True)
         
         with col2:
             # Resumen por subcategoría
             st.markdown("#### Por Subcategoría")
-            subcategory_summary = df_transactions.groupby(['Categoria_Padre', 'Categoria_Hijo']).agg({
-                'Monto': ['sum', 'count']
-            }).reset_index()
-            subcategory_summary.columns = ['Categoría Padre', 'Subcategoría', 'Total', 'Cantidad']
+            subcategory_summary = kpi_table(datasets(CATEGORY_KPIS_NAME))[['Neto', 'Cantidad', 'Promedio']].reset_index()
+            subcategory_summary.columns = ['Categoría Padre', 'Subcategoría', 'Total', 'Cantidad', 'Promedio']
             subcategory_summary['Total'] = subcategory_summary['Total'].apply(lambda x: f"${abs(x):,.0f}")
+            subcategory_summary['Promedio'] = subcategory_summary['Promedio'].apply(lambda x: f"${x:,.0f}")
             st.dataframe(subcategory_summary, use_container_width=True)
+    
+    # Re-categorización masiva (en segundo plano, con un pool de procesos)
+    st.markdown("### 🔄 Re-categorizar Historial")
+    st.markdown("Tras cambiar la taxonomía, vuelve a categorizar todas las transacciones de las tres empresas.")
+    
+    if st.button("🔄 Re-categorizar todo el historial"):
+        st.session_state.recategorize_job = start_job()
+    
+    show_recategorization_progress(st.session_state.get('recategorize_job'))
 
 elif page == "Transacciones":
     st.markdown('<h1 class="main-header">📝 Transacciones por Categorías</h1>', unsafe_allow_html=True)
     
+    if 'flash_message' in st.session_state:
+        st.success(st.session_state.pop('flash_message'))
+        st.balloons()
+    
+    # Solo esta página necesita el ledger categorizado fila por fila
+    if datasets is not None:
+        df_transactions = datasets(CATEGORIZED_NAME)
+    
     if not df_transactions.empty:
         # Formulario para nueva transacción
         with st.expander("➕ Agregar Nueva Transacción", expanded=False):
@@ -623,13 +652,25 @@ elif page == "Transacciones":
                 st.info(f"**Cuenta Destino:** {cuenta_destino if cuenta_destino else 'No especificada'}")
             
             if st.button("💾 Guardar Transacción", type="primary"):
-                # Aquí se procesaría la transacción
-                st.success("✅ Transacción guardada exitosamente!")
-                st.balloons()
+                if not description.strip() or amount <= 0:
+                    st.error("❌ Ingresa una descripción y un monto mayor a 0")
+                else:
+                    # Se agrega al journal de la empresa; el ledger en caché lo incorpora en la próxima lectura
+                    if USE_SQLITE:
+                        ledger_sqlite.insert_transaction(company, description.strip(), transaction_type, date, amount)
+                    else:
+                        append_company_transaction(company, description.strip(), transaction_type, date, amount)
+                        # Quien guarda espera (acotado) la instantánea que ya incluye su transacción
+                        request_refresh(timeout=5)
+                    st.session_state.flash_message = "✅ Transacción guardada exitosamente!"
+                    st.rerun()
         
         # Filtros de categorías
         st.markdown("### 🔍 Filtros de Categorías")
         
+        # Búsqueda en las descripciones (sin distinguir acentos ni mayúsculas; cada palabra puede ser un prefijo)
+        query = st.text_input("🔎 Buscar en descripciones", key="categorias_busqueda", placeholder="Ej.: comision, venta paq")
+        
         col1, col2 = st.columns(2)
         
         with col1:
@@ -651,38 +692,43 @@ elif page == "Transacciones":
             else:
                 subcategoria_filtro = "Todas"
         
-        # Aplicar filtros
-        df_filtrado = df_transactions.copy()
-        
-        if categoria_padre_filtro != "Todas":
-            df_filtrado = df_filtrado[df_filtrado['Categoria_Padre'] == categoria_padre_filtro]
-        
-        if subcategoria_filtro != "Todas":
-            df_filtrado = df_filtrado[df_filtrado['Categoria_Hijo'] == subcategoria_filtro]
+        # Aplicar filtros (en SQLite se resuelven con el índice por categoría)
+        if USE_SQLITE:
+            with timed('load'):
+                df_filtrado = ledger_sqlite.load_transactions(
+                    st.session_state.selected_company,
+                    padre=None if categoria_padre_filtro == "Todas" else categoria_padre_filtro,
+                    hijo=None if subcategoria_filtro == "Todas" else subcategoria_filtro
+                )
+            if query.strip():
+                with timed('index'):
+                    df_filtrado = search_frame(df_filtrado, query)
+        else:
+            # Índice invertido del ledger (una vez por versión); el categorizado tiene el mismo orden de filas
+            df_filtrado = search_frame(df_transactions, query, datasets(SEARCH_NAME)) if query.strip() else df_transactions
+            
+            if categoria_padre_filtro != "Todas":
+                df_filtrado = df_filtrado[df_filtrado['Categoria_Padre'] == categoria_padre_filtro]
+            
+            if subcategoria_filtro != "Todas":
+                df_filtrado = df_filtrado[df_filtrado['Categoria_Hijo'] == subcategoria_filtro]
         
         # Mostrar transacciones filtradas
         st.markdown("### 📊 Transacciones Filtradas")
         
         if not df_filtrado.empty:
-            # Crear tabla personalizada
-            for _, row in df_filtrado.iterrows():
-                amount_color = "#10b981" if row['Monto'] > 0 else "#ef4444"
-                amount_sign = "+" if row['Monto'] > 0 else ""
-                
-                col1, col2, col3, col4, col5 = st.columns([3, 2, 2, 2, 2])
-                
-                with col1:
-                    st.write(f"**{row['Descripción']}**")
-                with col2:
-                    st.markdown(f'<span style="background-color: {CATEGORIAS_PADRE.get(row["Categoria_Padre"], {}).get("color", "#6b7280")}; color: white; padding: 4px 8px; border-radius: 12px; font-size: 0.8em;">{row["Categoria_Padre"]}</span>', unsafe_allow_html=True)
-                with col3:
-                    st.write(row['Categoria_Hijo'])
-                with col4:
-                    st.write(row['Fecha'])
-                with col5:
-                    st.markdown(f'<span style="color: {amount_color}; font-weight: bold;">{amount_sign}${abs(row["Monto"]):,.0f}</span>', unsafe_allow_html=True)
-                
-                st.markdown("---")
+            # Tabla paginada con badge de categoría padre
+            columns = default_columns(
+                badge_column='Categoria_Padre',
+                badge_label="Categoría Padre",
+                badge_colors={cat: info['color'] for cat, info in CATEGORIAS_PADRE.items()},
+                extra_columns=[("Subcategoría", 'Categoria_Hijo')]
+            )
+            render_transaction_table(df_filtrado, key="categorias_transacciones", columns=columns)
+            
+            # Exportación de las transacciones filtradas (por bloques, sin armar el archivo en memoria)
+            filtros = [filtro for filtro in (categoria_padre_filtro, subcategoria_filtro, query.strip()) if filtro not in ("Todas", "")]
+            render_ledger_export(df_filtrado, "transacciones", filtros)
         else:
             st.info("No hay transacciones que coincidan con los filtros seleccionados.")
 
@@ -697,15 +743,64 @@ elif page == "Reportes":
             st.markdown("### 📊 Análisis por Categoría Padre")
             
             # Gráfico de barras por categoría padre
-            category_analysis = df_transactions.groupby('Categoria_Padre')['Monto'].sum().reset_index()
-            category_analysis['Monto'] = category_analysis['Monto'].apply(lambda x: abs(x))
+            def build_parent_bars_figure():
+                category_analysis = datasets(PARENT_TOTALS_NAME)
+                
+                fig_bars = px.bar(
+                    category_analysis,
+                    x='Categoria_Padre',
+                    y='Monto',
+                    title="Total por Categoría Padre",
+                    color='Categoria_Padre',
+                    color_discrete_map={
+                        'Ingresos': '#10b981',
+                        'Gastos Operacionales': '#ef4444',
+                        'Gastos Administrativos': '#f97316',
+                        'Gastos de Personal': '#8b5cf6',
+                        'Gastos de Marketing': '#06b6d4',
+                        'Gastos de Viaje': '#eab308'
+                    }
+                )
+                fig_bars.update_layout(xaxis={'tickangle': 45})
+                return fig_bars
+            
+            fig_bars = cached_figure(chart_key('padre_barras'), build_parent_bars_figure)
+            st.plotly_chart(fig_bars, use_container_width=True)
+        
+        with col2:
+            st.markdown("### 📊 Análisis por Subcategoría")
+            
+            # Gráfico de subcategorías más importantes
+            def build_children_figure():
+                subcategory_analysis = datasets(CHILD_TOTALS_NAME).head(8)
+                
+                fig_horizontal = px.bar(
+                    subcategory_analysis,
+                    x='Monto',
+                    y='Categoria_Hijo',
+                    orientation='h',
+                    title="Top 8 Subcategorías",
+                    color='Monto',
+                    color_continuous_scale='viridis'
+                )
+                return fig_horizontal
+            
+            fig_horizontal = cached_figure(chart_key('subcategorias'), build_children_figure)
+            st.plotly_chart(fig_horizontal, use_container_width=True)
+        
+        # Análisis temporal por categorías
+        st.markdown("### 📈 Evolución Temporal por Categorías")
+        
+        # Preparar datos temporales desde el cubo (O(días × categorías))
+        def build_monthly_figure():
+            monthly_by_category = datasets(MONTHLY_PARENT_NAME)
             
-            fig_bars = px.bar(
-                category_analysis,
-                x='Categoria_Padre',
+            fig_line = px.line(
+                monthly_by_category,
+                x='Mes',
                 y='Monto',
-                title="Total por Categoría Padre",
                 color='Categoria_Padre',
+                title="Evolución Mensual por Categoría Padre",
                 color_discrete_map={
                     'Ingresos': '#10b981',
                     'Gastos Operacionales': '#ef4444',
@@ -715,55 +810,21 @@ elif page == "Reportes":
                     'Gastos de Viaje': '#eab308'
                 }
             )
-            fig_bars.update_layout(xaxis={'tickangle': 45})
-            st.plotly_chart(fig_bars, use_container_width=True)
+            return fig_line
         
-        with col2:
-            st.markdown("### 📊 Análisis por Subcategoría")
-            
-            # Gráfico de subcategorías más importantes
-            subcategory_analysis = df_transactions.groupby('Categoria_Hijo')['Monto'].sum().reset_index()
-            subcategory_analysis['Monto'] = subcategory_analysis['Monto'].apply(lambda x: abs(x))
-            subcategory_analysis = subcategory_analysis.sort_values('Monto', ascending=False).head(8)
-            
-            fig_horizontal = px.bar(
-                subcategory_analysis,
-                x='Monto',
-                y='Categoria_Hijo',
-                orientation='h',
-                title="Top 8 Subcategorías",
-                color='Monto',
-                color_continuous_scale='viridis'
-            )
-            st.plotly_chart(fig_horizontal, use_container_width=True)
-        
-        # Análisis temporal por categorías
-        st.markdown("### 📈 Evolución Temporal por Categorías")
+        fig_line = cached_figure(chart_key('mensual'), build_monthly_figure)
+        st.plotly_chart(fig_line, use_container_width=True)
         
-        # Preparar datos temporales
-        df_temp = df_transactions.copy()
-        df_temp['Fecha'] = pd.to_datetime(df_temp['Fecha'], format='%d/%m/%Y')
-        df_temp['Mes'] = df_temp['Fecha'].dt.to_period('M')
-        
-        monthly_by_category = df_temp.groupby(['Mes', 'Categoria_Padre'])['Monto'].sum().reset_index()
-        monthly_by_category['Mes'] = monthly_by_category['Mes'].astype(str)
-        
-        fig_line = px.line(
-            monthly_by_category,
-            x='Mes',
-            y='Monto',
-            color='Categoria_Padre',
-            title="Evolución Mensual por Categoría Padre",
-            color_discrete_map={
-                'Ingresos': '#10b981',
-                'Gastos Operacionales': '#ef4444',
-                'Gastos Administrativos': '#f97316',
-                'Gastos de Personal': '#8b5cf6',
-                'Gastos de Marketing': '#06b6d4',
-                'Gastos de Viaje': '#eab308'
-            }
+        # Pronóstico de flujo de caja del total y por categoría padre (una vez por versión del ledger)
+        st.markdown("### 🔮 Pronóstico de Flujo de Caja")
+        render_forecast(
+            datasets(FORECAST_NAME), "categorias_pronostico", chart_key, "Pronóstico de Flujo de Caja",
+            get_company_theme(st.session_state.selected_company), series_label="Categoría padre",
+            total_name=st.session_state.selected_company
         )
-        st.plotly_chart(fig_line, use_container_width=True)
+        
+        # Exportación del ledger categorizado: solo se categoriza fila por fila al preparar el archivo
+        render_ledger_export(lambda: datasets(CATEGORIZED_NAME), "ledger_categorizado", rows=len(df_transactions))
 
 # Footer
 st.markdown("---")
@@ -783,4 +844,13 @@ st.markdown(f"""
         🌙 Modo {'Oscuro' if st.session_state.dark_mode else 'Claro'} Activado
     </p>
 </div>
-""", unsafe_allow_html=True) 
\ No newline at end of file
+""", unsafe_allow_html=True)
+
+# Reporte de memoria: se registra lo que usó esta ejecución y se muestra en el sidebar
+register_session({'df_transactions': df_transactions})
+finish_run()
+with st.sidebar:
+    if not USE_SQLITE:
+        render_refresh_status()
+    render_memory_report()
+    render_performance_panel('app_categorias')
@@ -1,9 +1,34 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
-import os
+
+import ledger_sqlite
+from agregados import append_to_cube, build_cube, category_totals, daily_totals, monthly_totals
+from anomalias import build_anomalies, render_anomalies, update_anomalies
+from busqueda import build_search_index, search_frame, update_search_index
+from categorias import GASTO_REPORTE_RULES_HASH, LEDGER_RULES_HASH, categorize_expenses
+from derivados import LEDGER, node
+from exportacion import render_export
+from graficos import cached_figure, figure_key
+from ledger_store import ALL_COMPANIES, CSV_FILES, append_company_transaction, date_slice, merge_rows, sort_by_date
+from kpis import append_to_kpis, build_kpis, frame_kpis, kpi_summary
+from memoria import register_session, render_memory_report
+from pronostico import build_forecast, render_forecast
+from refresco import (
+    current_snapshot, render_refresh_status, request_refresh, snapshot_datasets, start_refresh_worker
+)
+from rendimiento import finish_run, render_performance_panel, set_run_page, start_run, timed
+from reportes import (
+    closed_month, expense_categories, expense_summary, load_report, render_report_files, report_current,
+    report_figures, type_total, type_totals
+)
+from tabla_transacciones import default_columns, render_transaction_table
+from temas import get_company_theme, minify_css
+
+# Copy-on-write: los DataFrames de la sesión comparten los arreglos del caché de ledgers; una columna solo se
+# copia si se modifica, así el ledger compartido nunca se altera
+pd.set_option("mode.copy_on_write", True)
 
 # Configuración de la página
 st.set_page_config(
@@ -13,47 +38,15 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Función para obtener el tema CSS según la empresa
-def get_company_theme(company):
-    themes = {
-        "W TRAVEL CHILE": {
-            "primary": "#1e3a8a",
-            "secondary": "#3b82f6", 
-            "accent": "#fbbf24",
-            "light": "#f8fafc",
-            "gradient": "linear-gradient(135deg, #1e3a8a 0%, #3b82f6 100%)",
-            "income_gradient": "linear-gradient(135deg, #059669 0%, #10b981 100%)",
-            "expense_gradient": "linear-gradient(135deg, #dc2626 0%, #ef4444 100%)",
-            "logo": "🌍"
-        },
-        "WOLF TRAVEL CHILE": {
-            "primary": "#166534",
-            "secondary": "#22c55e",
-            "accent": "#ea580c", 
-            "light": "#f0fdf4",
-            "gradient": "linear-gradient(135deg, #166534 0%, #22c55e 100%)",
-            "income_gradient": "linear-gradient(135deg, #059669 0%, #10b981 100%)",
-            "expense_gradient": "linear-gradient(135deg, #dc2626 0%, #ef4444 100%)",
-            "logo": "🐺"
-        },
-        "HELPMETRAVEL SPA": {
-            "primary": "#7c3aed",
-            "secondary": "#a855f7",
-            "accent": "#1e40af",
-            "light": "#faf5ff", 
-            "gradient": "linear-gradient(135deg, #7c3aed 0%, #a855f7 100%)",
-            "income_gradient": "linear-gradient(135deg, #059669 0%, #10b981 100%)",
-            "expense_gradient": "linear-gradient(135deg, #dc2626 0%, #ef4444 100%)",
-            "logo": "🏢"
-        }
-    }
-    return themes.get(company, themes["W TRAVEL CHILE"])
-
-# Función para generar CSS dinámico
+# Medición de tiempos de esta ejecución (panel de rendimiento con ?admin=1)
+start_run('app_v2')
+
+# Función para generar CSS dinámico (memoizada por empresa y modo; Streamlit la conserva entre reruns)
+@st.cache_data(show_spinner=False)
 def generate_dynamic_css(company):
     theme = get_company_theme(company)
     
-    return f"""
+    return minify_css(f"""
     <style>
         /* Variables CSS dinámicas */
         :root {{
@@ -279,30 +272,152 @@ def generate_dynamic_css(company):
              }}
          }}
     </style>
-    """
+    """)
 
-# Función para cargar datos desde CSV
+# Función para cargar datos desde la última instantánea del ledger consolidado (cada empresa es una partición,
+# sin leer disco: el hilo de refresco la mantiene al día). La vista consolidada es el derivado ordenado por Fecha.
 def load_company_data(company):
-    csv_files = {
-        "W TRAVEL CHILE": "w_travel_chile.csv",
-        "WOLF TRAVEL CHILE": "wolf_travel_chile.csv", 
-        "HELPMETRAVEL SPA": "helpmetravel_spa.csv"
-    }
-    
-    csv_file = csv_files.get(company)
-    if csv_file and os.path.exists(csv_file):
-        df = pd.read_csv(csv_file)
-        return df
-    else:
-        st.error(f"Archivo CSV no encontrado para {company}")
-        return pd.DataFrame()
+    if datasets is not None:
+        return datasets(BY_DATE_NAME if company == ALL_COMPANIES else LEDGER).copy(deep=False)
+    st.error(f"Archivo CSV no encontrado para {company}")
+    return pd.DataFrame()
+
+# Función para obtener el cubo de agregados de la empresa (GROUP BY en SQLite si ese backend está activo).
+# En la vista consolidada el cubo se abre por Empresa: su total es el combinado de las tres.
+def load_company_cube(company):
+    if company == ALL_COMPANIES:
+        if USE_SQLITE:
+            return ledger_sqlite.build_cube(None, ('Empresa',))
+        return datasets('cube')
+    if USE_SQLITE:
+        return ledger_sqlite.build_cube(company)
+    return datasets('cube')
+
+# Función para obtener los KPIs del rango seleccionado: si cubre todo el ledger se leen del motor incremental
+# (sumas y conteos corrientes, actualizados con el journal); si no, una sola pasada sobre el recorte
+def load_company_kpis(company, df, full_range):
+    if full_range and not USE_SQLITE:
+        return kpi_summary(datasets('kpis')['total'])
+    return frame_kpis(df)
+
+# Función para construir el cubo consolidado abierto por Empresa
+def build_consolidated_cube(df):
+    return build_cube(df, ('Empresa',))
+
+# Función para pronosticar el flujo de caja consolidado: el total y cada empresa en la misma pasada
+def build_consolidated_forecast(cube):
+    return build_forecast(cube, 'Empresa')
+
+# Función para obtener el pronóstico de flujo de caja (una vez por versión del ledger; con SQLite, en cada ejecución)
+def load_company_forecast(cube):
+    if USE_SQLITE:
+        return build_forecast(cube, 'Empresa' if is_consolidated else None)
+    return datasets(FORECAST_NAME)
+
+# Función para obtener las transacciones inusuales del ledger, una vez por versión de los datos (con SQLite, por
+# versión de la base: las filas insertadas desde la anterior se evalúan sin recorrer el historial)
+def load_company_anomalies():
+    if USE_SQLITE:
+        return ledger_sqlite.load_derived(sql_company, ANOMALIES_NAME, build_anomalies, update_anomalies)
+    return datasets(ANOMALIES_NAME)
+
+# Función para obtener los gastos del ledger con su categoría de reporte
+def categorize_ledger_expenses(df):
+    expenses = df[df['Monto'] < 0]
+    return expenses.assign(Categoría=categorize_expenses(expenses['Descripción']))
+
+# Función para sumar a los gastos categorizados los gastos nuevos del journal
+def append_ledger_expenses(expenses, new_rows):
+    return merge_rows(expenses, categorize_ledger_expenses(new_rows))
+
+# Nombre del derivado de gastos (con el hash de sus reglas: si cambian, se recalcula)
+EXPENSES_NAME = f'gastos_{GASTO_REPORTE_RULES_HASH}'
+
+# Nombre del índice de búsqueda de descripciones
+SEARCH_NAME = 'busqueda'
+
+# Nombre del estado de anomalías (usa las subcategorías del ledger: lleva el hash de sus reglas)
+ANOMALIES_NAME = f'anomalias_{LEDGER_RULES_HASH}'
+
+# Nombre del pronóstico de flujo de caja (sale del cubo: se recalcula con cada versión)
+FORECAST_NAME = 'pronostico'
+
+# Nombre del ledger consolidado ordenado por Fecha (el consolidado guarda un bloque por empresa)
+BY_DATE_NAME = 'por_fecha'
+
+# Datasets derivados por empresa: cada página pide solo los que muestra y se calculan una vez por versión
+COMPANY_GRAPH = {
+    'cube': node(build_cube, updater=append_to_cube),
+    'kpis': node(build_kpis, updater=append_to_kpis),
+    EXPENSES_NAME: node(categorize_ledger_expenses, updater=append_ledger_expenses, stage='categorize'),
+    SEARCH_NAME: node(build_search_index, updater=update_search_index, stage='index'),
+    FORECAST_NAME: node(build_forecast, deps=('cube',)),
+    ANOMALIES_NAME: node(build_anomalies, updater=update_anomalies)
+}
+# En la vista consolidada el cubo se abre por Empresa; la tabla, la búsqueda y los gastos recortan por fecha el
+# consolidado ordenado por Fecha
+CONSOLIDATED_GRAPH = {
+    **COMPANY_GRAPH,
+    BY_DATE_NAME: node(sort_by_date, updater=merge_rows, stage='load'),
+    'cube': node(build_consolidated_cube, updater=append_to_cube),
+    EXPENSES_NAME: node(
+        categorize_ledger_expenses, deps=(BY_DATE_NAME,), updater=append_ledger_expenses, stage='categorize'
+    ),
+    SEARCH_NAME: node(build_search_index, deps=(BY_DATE_NAME,), updater=update_search_index, stage='index'),
+    FORECAST_NAME: node(build_consolidated_forecast, deps=('cube',))
+}
+
+# Función para armar la clave de caché de un gráfico con la empresa, versión de datos, filtros y tema actuales
+def chart_key(name, *params):
+    version = None if snapshot is None else snapshot['version']
+    return figure_key(
+        name, st.session_state.selected_company, version, start_filter, end_filter,
+        get_company_theme(st.session_state.selected_company)['primary'], *params
+    )
+
+# Función para mostrar la exportación de un recorte del ledger con la empresa, el rango de fechas y otros filtros
+def render_ledger_export(frame, name, filters=(), label="📥 Exportar"):
+    company = st.session_state.selected_company
+    version = None if snapshot is None else snapshot['version']
+    file_name = f"{name}_{company.lower().replace(' ', '_')}_{start_filter:%Y%m%d}_{end_filter:%Y%m%d}"
+    render_export(frame, file_name, f"v2_exportar_{name}", (company, start_filter, end_filter, *filters), version, label=label)
+
+# Función para cambiar de empresa (callback: se aplica antes de la siguiente ejecución, sin st.rerun)
+def select_company(company):
+    st.session_state.selected_company = company
+
+# Backend de datos: CSV (por defecto) o SQLite con TRILEDGER_BACKEND=sqlite
+USE_SQLITE = ledger_sqlite.sqlite_enabled()
+
+# Empresas disponibles y vista consolidada
+companies = list(CSV_FILES)
+company_options = [*companies, ALL_COMPANIES]
 
 # Inicializar session state
 if 'selected_company' not in st.session_state:
     st.session_state.selected_company = "W TRAVEL CHILE"
 
+is_consolidated = st.session_state.selected_company == ALL_COMPANIES
+# En SQLite, empresa None consulta todas
+sql_company = None if is_consolidated else st.session_state.selected_company
+
 # Cargar datos de la empresa seleccionada
-df_transactions = load_company_data(st.session_state.selected_company)
+with timed('load'):
+    if USE_SQLITE:
+        snapshot = None
+        datasets = None
+        # Con SQLite solo se consultan los límites; el rango de fechas se filtra en la base
+        date_bounds = ledger_sqlite.date_bounds(sql_company)
+        df_transactions = pd.DataFrame()
+    else:
+        # El hilo de refresco relee los ledgers y mantiene al día los derivados que las páginas ya pidieron
+        start_refresh_worker()
+        snapshot = current_snapshot()
+        datasets = snapshot_datasets(
+            snapshot, st.session_state.selected_company, CONSOLIDATED_GRAPH if is_consolidated else COMPANY_GRAPH
+        )
+        df_transactions = load_company_data(st.session_state.selected_company)
+        date_bounds = None if df_transactions.empty else (df_transactions['Fecha'].iloc[0], df_transactions['Fecha'].iloc[-1])
 
 # Aplicar CSS dinámico
 st.markdown(generate_dynamic_css(st.session_state.selected_company), unsafe_allow_html=True)
@@ -326,31 +441,22 @@ with st.sidebar:
     # Navegación
     st.markdown("### 📊 Navegación")
     page = st.radio("Seleccionar página", ["Dashboard", "Transacciones", "Reportes"], label_visibility="collapsed")
+    set_run_page(page)
     
     # Filtros
     st.markdown("### 🔍 Filtros")
     
-    # Selector de empresa con logos
-    companies = ["W TRAVEL CHILE", "WOLF TRAVEL CHILE", "HELPMETRAVEL SPA"]
-    company_logos = {"W TRAVEL CHILE": "🌍", "WOLF TRAVEL CHILE": "🐺", "HELPMETRAVEL SPA": "🏢"}
-    
-    selected_company = st.selectbox(
+    # Selector de empresa con logos (ligado a session_state: el cambio no necesita un st.rerun extra)
+    st.selectbox(
         "Empresa",
-        companies,
-        format_func=lambda x: f"{company_logos[x]} {x}",
-        index=companies.index(st.session_state.selected_company)
+        company_options,
+        format_func=lambda x: f"{get_company_theme(x)['logo']} {x}",
+        key="selected_company"
     )
     
-    # Actualizar empresa seleccionada
-    if selected_company != st.session_state.selected_company:
-        st.session_state.selected_company = selected_company
-        st.rerun()
-    
-    # Filtro de fechas
-    if not df_transactions.empty:
-        df_transactions['Fecha'] = pd.to_datetime(df_transactions['Fecha'], format='%d/%m/%Y')
-        min_date = df_transactions['Fecha'].min()
-        max_date = df_transactions['Fecha'].max()
+    # Filtro de fechas (el ledger viene ordenado por Fecha)
+    if date_bounds is not None:
+        min_date, max_date = date_bounds
         
         date_range = st.date_input(
             "📅 Rango de fechas",
@@ -358,6 +464,19 @@ with st.sidebar:
             min_value=min_date.date(),
             max_value=max_date.date()
         )
+        
+        # Mientras se elige el rango, st.date_input devuelve solo la fecha de inicio
+        if len(date_range) == 2:
+            start_filter, end_filter = date_range
+        else:
+            start_filter, end_filter = date_range[0], max_date.date()
+        # Si el rango cubre todo el ledger, los KPIs no necesitan recorrer las transacciones
+        full_range = start_filter <= min_date.date() and end_filter >= max_date.date()
+        if USE_SQLITE:
+            with timed('load'):
+                df_transactions = ledger_sqlite.load_transactions(sql_company, start_filter, end_filter)
+        else:
+            df_transactions = date_slice(df_transactions, start_filter, end_filter)
 
 # Contenido principal
 if page == "Dashboard":
@@ -380,26 +499,29 @@ if page == "Dashboard":
     st.markdown("### 🏢 Seleccionar Empresa")
     st.markdown("Haz clic en una empresa para cambiar la vista:")
     
-    cols = st.columns(len(companies))
+    cols = st.columns(len(company_options))
     
-    for i, company in enumerate(companies):
+    for i, company in enumerate(company_options):
         with cols[i]:
             company_theme = get_company_theme(company)
             is_selected = company == st.session_state.selected_company
             
-            if st.button(
+            st.button(
                 f"{company_theme['logo']} {company}",
                 key=f"btn_{i}",
-                use_container_width=True
-            ):
-                st.session_state.selected_company = company
-                st.rerun()
+                use_container_width=True,
+                on_click=select_company,
+                args=(company,)
+            )
     
     if not df_transactions.empty:
-        # Cálculos financieros
-        total_income = df_transactions[df_transactions['Monto'] > 0]['Monto'].sum()
-        total_expenses = abs(df_transactions[df_transactions['Monto'] < 0]['Monto'].sum())
-        current_balance = total_income - total_expenses
+        # Cálculos financieros (el cubo y los KPIs se calculan una vez por versión del ledger)
+        with timed('aggregate'):
+            cube = load_company_cube(st.session_state.selected_company)
+            kpis = load_company_kpis(st.session_state.selected_company, df_transactions, full_range)
+        total_income = kpis['Ingresos']
+        total_expenses = kpis['Gastos']
+        current_balance = kpis['Saldo']
         
         # Métricas principales con animaciones
         st.markdown("### 💰 Resumen Financiero")
@@ -410,7 +532,7 @@ if page == "Dashboard":
             <div class="metric-card fade-in">
                 <h3>💰 Saldo Actual</h3>
                 <h2 style="font-size: 2.5rem; margin: 1rem 0;">${current_balance:,.0f}</h2>
-                <p>Basado en todas las transacciones</p>
+                <p>Basado en el rango de fechas seleccionado</p>
             </div>
             ''', unsafe_allow_html=True)
         
@@ -432,6 +554,25 @@ if page == "Dashboard":
             </div>
             ''', unsafe_allow_html=True)
         
+        # Vista consolidada: KPIs de cada empresa lado a lado (desde el cubo abierto por Empresa)
+        if is_consolidated:
+            st.markdown("### 🏢 Comparativo por Empresa")
+            company_kpis = category_totals(cube, 'Empresa', start_filter, end_filter).reindex(companies, fill_value=0)
+            kpi_cols = st.columns(len(companies))
+
+            for kpi_col, (company, kpis) in zip(kpi_cols, company_kpis.iterrows()):
+                with kpi_col:
+                    company_theme = get_company_theme(company)
+                    st.markdown(f"**{company_theme['logo']} {company}**")
+                    st.metric("💰 Saldo", f"${kpis['Neto']:,.0f}")
+                    st.metric("📈 Ingresos", f"${kpis['Ingresos']:,.0f}")
+                    st.metric("📉 Gastos", f"${kpis['Gastos']:,.0f}")
+
+        # Montos atípicos y posibles duplicados del rango (las filas nuevas del journal se evalúan al llegar)
+        with timed('aggregate'):
+            anomalies = load_company_anomalies()
+        render_anomalies(anomalies, start_filter, end_filter)
+
         # Gráficos y análisis
         col1, col2 = st.columns(2)
         
@@ -439,54 +580,45 @@ if page == "Dashboard":
             st.markdown('<h3 class="section-title">📊 Flujo de Caja - Últimos 7 Días</h3>', unsafe_allow_html=True)
             
             # Gráfico de flujo de caja
-            recent_data = df_transactions.copy()
             end_date = datetime.now()
             start_date = end_date - timedelta(days=6)
             
             # Crear rango de fechas
-            date_range = pd.date_range(start=start_date, end=end_date, freq='D')
+            days = pd.date_range(start=start_date, end=end_date, freq='D')
             
-            # Agrupar datos por fecha
-            daily_data = []
-            for date in date_range:
-                date_str = date.strftime('%d/%m')
-                day_data = recent_data[recent_data['Fecha'].dt.date == date.date()]
-                day_income = day_data[day_data['Monto'] > 0]['Monto'].sum()
-                day_expenses = abs(day_data[day_data['Monto'] < 0]['Monto'].sum())
+            def build_cash_flow_figure():
+                # Totales diarios desde el cubo de agregados (O(días), sin recorrer el ledger)
+                df_daily = daily_totals(cube, days, start_filter, end_filter)
+                df_daily['Fecha'] = days.strftime('%d/%m')
                 
-                daily_data.append({
-                    'Fecha': date_str,
-                    'Ingresos': day_income,
-                    'Gastos': day_expenses
-                })
-            
-            df_daily = pd.DataFrame(daily_data)
-            
-            fig = go.Figure()
-            fig.add_trace(go.Bar(
-                name='Ingresos',
-                x=df_daily['Fecha'],
-                y=df_daily['Ingresos'],
-                marker_color='#10b981'
-            ))
-            
-            fig.add_trace(go.Bar(
-                name='Gastos',
-                x=df_daily['Fecha'],
-                y=df_daily['Gastos'],
-                marker_color='#ef4444'
-            ))
+                fig = go.Figure()
+                fig.add_trace(go.Bar(
+                    name='Ingresos',
+                    x=df_daily['Fecha'],
+                    y=df_daily['Ingresos'],
+                    marker_color='#10b981'
+                ))
+                
+                fig.add_trace(go.Bar(
+                    name='Gastos',
+                    x=df_daily['Fecha'],
+                    y=df_daily['Gastos'],
+                    marker_color='#ef4444'
+                ))
+                
+                fig.update_layout(
+                    title="Flujo de Caja - Últimos 7 días",
+                    xaxis_title="Fecha",
+                    yaxis_title="Monto ($)",
+                    barmode='group',
+                    height=400,
+                    showlegend=True,
+                    plot_bgcolor='rgba(0,0,0,0)',
+                    paper_bgcolor='rgba(0,0,0,0)'
+                )
+                return fig
             
-            fig.update_layout(
-                title="Flujo de Caja - Últimos 7 días",
-                xaxis_title="Fecha",
-                yaxis_title="Monto ($)",
-                barmode='group',
-                height=400,
-                showlegend=True,
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)'
-            )
+            fig = cached_figure(chart_key('flujo_caja', days[0].date()), build_cash_flow_figure)
             
             st.plotly_chart(fig, use_container_width=True)
         
@@ -496,7 +628,7 @@ if page == "Dashboard":
             # Tabla de transacciones recientes
             st.markdown('<div class="transaction-table fade-in">', unsafe_allow_html=True)
             
-            recent_transactions = df_transactions.head(5)
+            recent_transactions = df_transactions.tail(5).iloc[::-1]
             
             for _, row in recent_transactions.iterrows():
                 amount_color = "#10b981" if row['Monto'] > 0 else "#ef4444"
@@ -523,6 +655,9 @@ if page == "Dashboard":
 elif page == "Transacciones":
     st.markdown('<h1 class="main-header">📝 Gestión de Transacciones</h1>', unsafe_allow_html=True)
     
+    if 'flash_message' in st.session_state:
+        st.success(st.session_state.pop('flash_message'))
+    
     if not df_transactions.empty:
         # Formulario para nueva transacción
         with st.expander("➕ Agregar Nueva Transacción", expanded=False):
@@ -531,64 +666,114 @@ elif page == "Transacciones":
             with col1:
                 description = st.text_input("Descripción")
                 transaction_type = st.selectbox("Tipo", ["Ingreso", "Gasto"])
-                company = st.selectbox("Empresa", [st.session_state.selected_company])
+                # En la vista consolidada se elige a qué empresa pertenece la transacción
+                company = st.selectbox("Empresa", companies if is_consolidated else [st.session_state.selected_company])
             
             with col2:
                 amount = st.number_input("Monto", min_value=0.0, value=0.0, step=0.01)
                 date = st.date_input("Fecha", value=datetime.now())
             
             if st.button("💾 Guardar Transacción", type="primary"):
-                st.success("✅ Transacción guardada exitosamente!")
+                if not description.strip() or amount <= 0:
+                    st.error("❌ Ingresa una descripción y un monto mayor a 0")
+                else:
+                    # Se agrega al journal de la empresa; el ledger en caché lo incorpora en la próxima lectura
+                    if USE_SQLITE:
+                        ledger_sqlite.insert_transaction(company, description.strip(), transaction_type, date, amount)
+                    else:
+                        append_company_transaction(company, description.strip(), transaction_type, date, amount)
+                        # Quien guarda espera (acotado) la instantánea que ya incluye su transacción
+                        request_refresh(timeout=5)
+                    st.session_state.flash_message = "✅ Transacción guardada exitosamente!"
+                    st.rerun()
+        
+        # Búsqueda en las descripciones (sin distinguir acentos ni mayúsculas; cada palabra puede ser un prefijo)
+        query = st.text_input("🔎 Buscar en descripciones", key="v2_busqueda", placeholder="Ej.: comision, venta paq")
+        if query.strip():
+            if USE_SQLITE:
+                with timed('index'):
+                    df_transactions = search_frame(df_transactions, query)
+            else:
+                # Índice invertido del ledger completo (una vez por versión); luego el recorte por fecha
+                df_transactions = date_slice(
+                    search_frame(datasets(BY_DATE_NAME if is_consolidated else LEDGER), query, datasets(SEARCH_NAME)),
+                    start_filter, end_filter
+                )
+            st.caption(f"{len(df_transactions):,} transacciones coinciden con la búsqueda")
         
         # Tabla completa de transacciones
         st.markdown('<h3 class="section-title">📊 Todas las Transacciones</h3>', unsafe_allow_html=True)
         st.markdown(f'<p style="color: #666; text-align: center;">Mostrando transacciones de: <strong>{st.session_state.selected_company}</strong></p>', unsafe_allow_html=True)
         
-        # Crear tabla personalizada con mejor formato
+        # Tabla paginada: solo se renderiza la página visible
         st.markdown('<div class="transaction-table">', unsafe_allow_html=True)
-        
-        # Header de la tabla
-        col1, col2, col3, col4 = st.columns([4, 2, 2, 2])
-        with col1:
-            st.markdown("**Descripción**")
-        with col2:
-            st.markdown("**Tipo**")
-        with col3:
-            st.markdown("**Fecha**")
-        with col4:
-            st.markdown("**Monto**")
-        
-        st.markdown("---")
-        
-        # Filas de transacciones
-        for _, row in df_transactions.iterrows():
-            amount_color = "#10b981" if row['Monto'] > 0 else "#ef4444"
-            amount_sign = "+" if row['Monto'] > 0 else ""
-            type_color = "#10b981" if row['Tipo'] == "Ingreso" else "#6b7280"
-            
-            col1, col2, col3, col4 = st.columns([4, 2, 2, 2])
-            
-            with col1:
-                st.write(row['Descripción'])
-            with col2:
-                st.markdown(f'<div style="text-align: center;"><span style="background-color: {type_color}; color: white; padding: 6px 16px; border-radius: 15px; font-size: 0.85em; font-weight: bold; display: inline-block; min-width: 80px; text-align: center;">{row["Tipo"]}</span></div>', unsafe_allow_html=True)
-            with col3:
-                st.write(row['Fecha'].strftime('%d/%m/%Y'))
-            with col4:
-                st.markdown(f'<div style="text-align: right;"><span style="color: {amount_color}; font-weight: bold; font-size: 1.1em;">{amount_sign}${abs(row["Monto"]):,.0f}</span></div>', unsafe_allow_html=True)
-            
-            st.markdown("---")
-        
+        columns = default_columns(extra_columns=[("Empresa", "Empresa")]) if is_consolidated else None
+        render_transaction_table(df_transactions, key="v2_transacciones", columns=columns)
         st.markdown('</div>', unsafe_allow_html=True)
+        
+        # Exportación de las transacciones del rango elegido (por bloques, sin armar el archivo en memoria)
+        render_ledger_export(df_transactions, "transacciones", (query.strip(),))
 
 elif page == "Reportes":
     st.markdown('<h1 class="main-header">📈 Reportes Financieros</h1>', unsafe_allow_html=True)
     
     if not df_transactions.empty:
-        # Cálculos financieros para reportes
-        total_income = df_transactions[df_transactions['Monto'] > 0]['Monto'].sum()
-        total_expenses = abs(df_transactions[df_transactions['Monto'] < 0]['Monto'].sum())
-        current_balance = total_income - total_expenses
+        # Si el rango es un mes cerrado con reporte pre-generado (python reportes.py), se muestra sin recalcular
+        report = None
+        month = None
+        if not USE_SQLITE and not is_consolidated:
+            month = closed_month(start_filter, end_filter, min_date.date(), max_date.date())
+            if month is not None:
+                report = load_report(st.session_state.selected_company, month)
+        
+        # Cálculos financieros para reportes (el cubo y los KPIs se calculan una vez por versión del ledger)
+        with timed('aggregate'):
+            cube = load_company_cube(st.session_state.selected_company)
+            # Un reporte generado antes de que cambiaran las transacciones del mes o las reglas de categorías ya no vale
+            if report is not None and not report_current(report, datasets(LEDGER)):
+                report = None
+            kpis = report['kpis'] if report is not None else load_company_kpis(st.session_state.selected_company, df_transactions, full_range)
+        total_income = kpis['Ingresos']
+        total_expenses = kpis['Gastos']
+        current_balance = kpis['Saldo']
+        
+        if report is not None:
+            render_report_files(report)
+            income_total = report['type_totals']['Ingreso']
+            expense_total = report['type_totals']['Gasto']
+            report_figure = report['figures'].get
+            summary_data = report['summary']
+            # Los gastos categorizados solo se piden si se exportan
+            expenses_frame = lambda: date_slice(datasets(EXPENSES_NAME), start_filter, end_filter)
+        else:
+            type_data = type_totals(df_transactions)
+            income_total = type_total(type_data, 'Ingreso')
+            expense_total = type_total(type_data, 'Gasto')
+            
+            # Gastos con su categoría de reporte
+            if USE_SQLITE:
+                with timed('categorize'):
+                    expenses_df = categorize_ledger_expenses(df_transactions)
+            else:
+                # Gastos categorizados una vez por versión del ledger; el rango elegido es un recorte por fecha
+                expenses_df = date_slice(datasets(EXPENSES_NAME), start_filter, end_filter)
+            
+            with timed('aggregate'):
+                monthly = monthly_totals(cube, start_filter, end_filter)
+                # Vista consolidada: una línea por empresa además del combinado
+                by_company = monthly_totals(cube, start_filter, end_filter, dim='Empresa')['Neto'].unstack('Empresa', fill_value=0) if is_consolidated else None
+                builders = report_figures(
+                    type_data, monthly, kpis, expense_categories(expenses_df),
+                    st.session_state.selected_company, theme, by_company
+                )
+                summary_data = expense_summary(expenses_df) if not expenses_df.empty else None
+            expenses_frame = expenses_df
+            
+            # Figuras del caché por empresa, versión de datos y rango (solo se construyen si no están)
+            def report_figure(name):
+                if name not in builders:
+                    return None
+                return cached_figure(chart_key(name), builders[name])
         
         col1, col2 = st.columns(2)
         
@@ -596,96 +781,46 @@ elif page == "Reportes":
             st.markdown('<h3 class="section-title">📊 Análisis por Tipo</h3>', unsafe_allow_html=True)
             
             # Gráfico de barras en lugar de torta para mejor visualización
-            type_data = df_transactions.groupby('Tipo')['Monto'].sum().reset_index()
-            type_data['Monto'] = type_data['Monto'].apply(lambda x: abs(x))  # Valor absoluto para visualización
-            
-            fig_bars = px.bar(
-                type_data,
-                x='Tipo',
-                y='Monto',
-                title=f"Total por Tipo - {st.session_state.selected_company}",
-                color='Tipo',
-                color_discrete_map={'Ingreso': '#10b981', 'Gasto': '#ef4444'},
-                text=type_data['Monto'].apply(lambda x: f"${x:,.0f}")
-            )
-            fig_bars.update_traces(textposition='outside')
-            fig_bars.update_layout(
-                xaxis_title="Tipo de Transacción",
-                yaxis_title="Monto Total ($)",
-                showlegend=False,
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)'
-            )
-            st.plotly_chart(fig_bars, use_container_width=True)
+            st.plotly_chart(report_figure('por_tipo'), use_container_width=True)
             
             # Métricas adicionales debajo del gráfico
             col1_1, col1_2 = st.columns(2)
             with col1_1:
-                income_total = type_data[type_data['Tipo'] == 'Ingreso']['Monto'].iloc[0] if len(type_data[type_data['Tipo'] == 'Ingreso']) > 0 else 0
                 st.metric("💰 Total Ingresos", f"${income_total:,.0f}")
             with col1_2:
-                expense_total = type_data[type_data['Tipo'] == 'Gasto']['Monto'].iloc[0] if len(type_data[type_data['Tipo'] == 'Gasto']) > 0 else 0
                 st.metric("💸 Total Gastos", f"${expense_total:,.0f}")
         
         with col2:
             st.markdown('<h3 class="section-title">📈 Tendencia Mensual</h3>', unsafe_allow_html=True)
             
             # Gráfico de línea de tendencia
-            monthly_data = df_transactions.copy()
-            monthly_summary = monthly_data.groupby(monthly_data['Fecha'].dt.to_period('M'))['Monto'].sum().reset_index()
-            monthly_summary['Fecha'] = monthly_summary['Fecha'].astype(str)
-            
-            fig_line = px.line(
-                monthly_summary, 
-                x='Fecha', 
-                y='Monto', 
-                title=f"Tendencia de Flujo de Caja - {st.session_state.selected_company}",
-                markers=True
-            )
-            fig_line.update_traces(line_color=theme['primary'], marker_color=theme['secondary'])
-            fig_line.update_layout(
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)'
-            )
-            st.plotly_chart(fig_line, use_container_width=True)
+            st.plotly_chart(report_figure('tendencia'), use_container_width=True)
+        
+        # Pronóstico de ingresos, gastos y saldo sobre los totales mensuales de todo el ledger
+        st.markdown('<h3 class="section-title">🔮 Pronóstico de Flujo de Caja</h3>', unsafe_allow_html=True)
+        with timed('aggregate'):
+            forecast = load_company_forecast(cube)
+        render_forecast(
+            forecast, "v2_pronostico", chart_key, "Pronóstico de Flujo de Caja", theme,
+            series_label="Empresa", total_name=st.session_state.selected_company
+        )
         
         # Gráfico de proporción ingresos vs gastos
         st.markdown('<h3 class="section-title">📊 Proporción Ingresos vs Gastos</h3>', unsafe_allow_html=True)
         
-        # Crear gráfico de proporción más claro
-        proportion_data = pd.DataFrame({
-            'Tipo': ['Ingresos', 'Gastos'],
-            'Monto': [total_income, total_expenses],
-            'Porcentaje': [100, (total_expenses/total_income*100) if total_income > 0 else 0]
-        })
-        
         col_prop1, col_prop2 = st.columns(2)
         
         with col_prop1:
             # Gráfico de donut para proporción
-            fig_donut = go.Figure(data=[go.Pie(
-                labels=proportion_data['Tipo'],
-                values=proportion_data['Monto'],
-                hole=0.6,
-                marker_colors=['#10b981', '#ef4444'],
-                textinfo='label+percent',
-                textposition='inside'
-            )])
-            
-            fig_donut.update_layout(
-                title=f"Proporción Ingresos vs Gastos - {st.session_state.selected_company}",
-                showlegend=True,
-                legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
-            )
-            st.plotly_chart(fig_donut, use_container_width=True)
+            st.plotly_chart(report_figure('proporcion'), use_container_width=True)
         
         with col_prop2:
             # Métricas de proporción
             st.markdown("### 📈 Métricas de Proporción")
             
             # Calcular métricas
-            profit_margin_pct = ((total_income - total_expenses) / total_income * 100) if total_income > 0 else 0
-            expense_ratio = (total_expenses / total_income * 100) if total_income > 0 else 0
+            profit_margin_pct = kpis['Margen']
+            expense_ratio = kpis['Ratio de gastos']
             
             col_met1, col_met2 = st.columns(2)
             with col_met1:
@@ -699,84 +834,20 @@ elif page == "Reportes":
         # Gráficos de categorías de gastos
         st.markdown('<h3 class="section-title">📊 Análisis de Categorías de Gastos</h3>', unsafe_allow_html=True)
         
-        # Función para categorizar gastos
-        def categorize_expense(description):
-            description_lower = description.lower()
-            if any(word in description_lower for word in ['arriendo', 'oficina', 'rent']):
-                return 'Arriendo'
-            elif any(word in description_lower for word in ['servicios', 'básicos', 'luz', 'agua', 'gas']):
-                return 'Servicios Básicos'
-            elif any(word in description_lower for word in ['impuestos', 'tasas', 'gubernamentales']):
-                return 'Impuestos'
-            elif any(word in description_lower for word in ['equipos', 'computación', 'software', 'audiovisuales']):
-                return 'Equipos y Tecnología'
-            elif any(word in description_lower for word in ['mantenimiento', 'vehículos', 'seguro']):
-                return 'Mantenimiento y Seguros'
-            elif any(word in description_lower for word in ['supermercado', 'provisiones', 'alimentación']):
-                return 'Alimentación y Provisiones'
-            else:
-                return 'Otros Gastos'
-        
-        # Crear DataFrame con categorías
-        expenses_df = df_transactions[df_transactions['Monto'] < 0].copy()
-        expenses_df['Categoría'] = expenses_df['Descripción'].apply(categorize_expense)
-        
         col1, col2 = st.columns(2)
         
         with col1:
             # Gráfico de barras por categorías de gastos (más claro que torta)
-            if not expenses_df.empty:
-                category_data = expenses_df.groupby('Categoría')['Monto'].sum().reset_index()
-                category_data['Monto'] = abs(category_data['Monto'])
-                category_data = category_data.sort_values('Monto', ascending=False)  # Ordenar por monto
-                
-                # Colores para categorías
-                colors = ['#ef4444', '#f97316', '#eab308', '#84cc16', '#22c55e', '#06b6d4', '#8b5cf6']
-                
-                fig_expenses = px.bar(
-                    category_data,
-                    x='Categoría',
-                    y='Monto',
-                    title=f"Categorías de Gastos - {st.session_state.selected_company}",
-                    color='Categoría',
-                    color_discrete_sequence=colors,
-                    text=category_data['Monto'].apply(lambda x: f"${x:,.0f}")
-                )
-                fig_expenses.update_traces(textposition='outside')
-                fig_expenses.update_layout(
-                    xaxis_title="Categoría",
-                    yaxis_title="Monto Total ($)",
-                    showlegend=False,
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    xaxis={'tickangle': 45}
-                )
+            fig_expenses = report_figure('gastos_categoria')
+            if fig_expenses is not None:
                 st.plotly_chart(fig_expenses, use_container_width=True)
             else:
                 st.info("No hay gastos registrados para mostrar categorías.")
         
         with col2:
             # Gráfico de barras por categorías de gastos
-            if not expenses_df.empty:
-                category_data = expenses_df.groupby('Categoría')['Monto'].sum().reset_index()
-                category_data['Monto'] = abs(category_data['Monto'])
-                category_data = category_data.sort_values('Monto', ascending=True)
-                
-                fig_bars = px.bar(
-                    category_data,
-                    x='Monto',
-                    y='Categoría',
-                    orientation='h',
-                    title=f"Gastos por Categoría - {st.session_state.selected_company}",
-                    color='Monto',
-                    color_continuous_scale='Reds'
-                )
-                fig_bars.update_layout(
-                    xaxis_title="Monto ($)",
-                    yaxis_title="Categoría",
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    paper_bgcolor='rgba(0,0,0,0)'
-                )
+            fig_bars = report_figure('gastos_barras')
+            if fig_bars is not None:
                 st.plotly_chart(fig_bars, use_container_width=True)
             else:
                 st.info("No hay gastos registrados para mostrar gráfico de barras.")
@@ -787,39 +858,30 @@ elif page == "Reportes":
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            total_transactions = len(df_transactions)
-            st.metric("Total Transacciones", f"{total_transactions:,}")
+            total_transactions = kpis['Transacciones']
+            st.metric("Total Transacciones", f"{total_transactions:,.0f}")
         
         with col2:
-            avg_income = df_transactions[df_transactions['Monto'] > 0]['Monto'].mean()
+            avg_income = kpis['Promedio ingreso']
             st.metric("Promedio Ingresos", f"${avg_income:,.0f}")
         
         with col3:
-            avg_expense = abs(df_transactions[df_transactions['Monto'] < 0]['Monto'].mean())
+            avg_expense = kpis['Promedio gasto']
             st.metric("Promedio Gastos", f"${avg_expense:,.0f}")
         
         with col4:
-            profit_margin = ((total_income - total_expenses) / total_income * 100) if total_income > 0 else 0
+            profit_margin = kpis['Margen']
             st.metric("Margen de Ganancia", f"{profit_margin:.1f}%")
         
         # Tabla de resumen por categorías
-        if not expenses_df.empty:
+        if summary_data is not None:
             st.markdown('<h3 class="section-title">📋 Resumen de Gastos por Categoría</h3>', unsafe_allow_html=True)
             
-            summary_data = expenses_df.groupby('Categoría').agg({
-                'Monto': ['sum', 'count'],
-                'Descripción': lambda x: ', '.join(x.head(3).tolist()) + ('...' if len(x) > 3 else '')
-            }).reset_index()
-            
-            summary_data.columns = ['Categoría', 'Total Gastos', 'Cantidad', 'Ejemplos']
-            summary_data['Total Gastos'] = abs(summary_data['Total Gastos'])
-            summary_data = summary_data.sort_values('Total Gastos', ascending=False)
-            
-            # Formatear para display
-            display_summary = summary_data.copy()
-            display_summary['Total Gastos'] = display_summary['Total Gastos'].apply(lambda x: f"${x:,.0f}")
+            st.dataframe(summary_data, use_container_width=True)
             
-            st.dataframe(display_summary, use_container_width=True)
+            # Exportación de los gastos del rango con su categoría (las transacciones completas se exportan en
+            # la página Transacciones)
+            render_ledger_export(expenses_frame, "gastos", label="📥 Exportar solo gastos (con su categoría)")
 
 # Footer mejorado
 st.markdown("---")
@@ -833,4 +895,13 @@ st.markdown(f"""
         🌟 Versión 2.0 - Tema personalizado para {st.session_state.selected_company}
     </p>
 </div>
-""", unsafe_allow_html=True) 
\ No newline at end of file
+""", unsafe_allow_html=True)
+
+# Reporte de memoria: se registra lo que usó esta ejecución y se muestra en el sidebar
+register_session({'df_transactions': df_transactions})
+finish_run()
+with st.sidebar:
+    if not USE_SQLITE:
+        render_refresh_status()
+    render_memory_report()
+    render_performance_panel('app_v2')
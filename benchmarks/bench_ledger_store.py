@@ -0,0 +1,102 @@
+# Benchmark de carga en frío: pd.read_csv + to_datetime vs. sidecar Feather memory-mapped
+#
+# Uso:
+#   python benchmarks/bench_ledger_store.py
+#   python benchmarks/bench_ledger_store.py --sizes 10000 1000000
+#
+# Cada medición corre en un proceso nuevo para que el tiempo y el RSS máximo sean de carga en frío.
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import pandas as pd
+
+import ledger_store
+
+DEFAULT_SIZES = [10_000, 1_000_000, 10_000_000]
+
+DESCRIPCIONES = [
+    "Venta paquete turístico Europa", "Pago arriendo oficina", "Comisión agencia aérea",
+    "Compra equipos computación", "Pago servicios básicos", "Mantenimiento equipos",
+    "Pago impuestos", "Venta paquete aventura", "Supermercado - Provisiones"
+]
+
+
+# Función para generar un CSV sintético con el formato de los ledgers
+def generate_csv(path, rows, seed=42):
+    rng = np.random.default_rng(seed)
+    chunk = 1_000_000
+    for start in range(0, rows, chunk):
+        n = min(chunk, rows - start)
+        monto = rng.integers(100, 20_000, n)
+        gasto = rng.random(n) < 0.45
+        fechas = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 730, n), unit="D")
+        df = pd.DataFrame({
+            "Descripción": np.array(DESCRIPCIONES, dtype=object)[rng.integers(0, len(DESCRIPCIONES), n)],
+            "Tipo": np.where(gasto, "Gasto", "Ingreso"),
+            "Fecha": fechas.strftime("%d/%m/%Y"),
+            "Monto": np.where(gasto, -monto, monto),
+            "Empresa": "W TRAVEL CHILE"
+        })
+        df.to_csv(path, mode="w" if start == 0 else "a", header=start == 0, index=False)
+
+
+# Función que ejecuta una carga en el proceso hijo y reporta tiempo y RSS máximo
+def run_worker(mode, path):
+    start = time.perf_counter()
+    if mode == "csv":
+        df = pd.read_csv(path)
+        df["Fecha"] = pd.to_datetime(df["Fecha"], format="%d/%m/%Y")
+    else:
+        df = ledger_store.read_ledger(path)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss está en KiB en Linux y en bytes en macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+    print(json.dumps({"rows": len(df), "seconds": elapsed, "rss_mb": rss_mb}))
+
+
+def measure(mode, path):
+    out = subprocess.run(
+        [sys.executable, __file__, "--worker", mode, path],
+        check=True, capture_output=True, text=True
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga en frío de ledgers")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--worker", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(*args.worker)
+        return
+
+    print(f"{'Filas':>12} {'Modo':>8} {'Tiempo (s)':>11} {'RSS (MB)':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.sizes:
+            path = os.path.join(tmp, f"ledger_{rows}.csv")
+            generate_csv(path, rows)
+            csv_result = measure("csv", path)
+            # Primera carga construye el sidecar; la medición es sobre el sidecar ya creado
+            ledger_store.read_ledger(path)
+            sidecar_result = measure("sidecar", path)
+            for mode, result in (("csv", csv_result), ("sidecar", sidecar_result)):
+                print(f"{rows:>12,} {mode:>8} {result['seconds']:>11.3f} {result['rss_mb']:>10.1f}")
+            os.remove(path)
+            os.remove(ledger_store.sidecar_path(path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# Benchmark de re-categorización masiva: filas/s según la cantidad de procesos del pool
+#
+# Uso:
+#   python benchmarks/bench_recategorizacion.py
+#   python benchmarks/bench_recategorizacion.py --rows 2000000 --workers 1 2 4 8
+#
+# Cada descripción lleva un sufijo numérico para que haya muchos pares distintos (el peor caso:
+# la tabla memo no ayuda y todo el trabajo es regex).
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import pandas as pd
+
+
+# Función para generar un ledger sintético con `unique` descripciones distintas
+def generate_ledger(rows, unique, seed=42):
+    from bench_ledger_store import DESCRIPCIONES
+    rng = np.random.default_rng(seed)
+    base = np.array(DESCRIPCIONES, dtype=object)[rng.integers(0, len(DESCRIPCIONES), unique)]
+    pool = pd.Series(base).str.cat(pd.Series(np.arange(unique)).astype(str), sep=" #")
+    gasto = rng.random(rows) < 0.45
+    return pd.DataFrame({
+        "Descripción": pool.to_numpy()[rng.integers(0, unique, rows)],
+        "Tipo": np.where(gasto, "Gasto", "Ingreso")
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de re-categorización con ProcessPoolExecutor")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--unique", type=int, default=200_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    # La tabla memo se escribe en un directorio temporal para no tocar la del proyecto
+    os.environ["TRILEDGER_CACHE_DIR"] = tempfile.mkdtemp()
+    import categorias
+    from recategorizacion import recategorize
+
+    df = generate_ledger(args.rows, args.unique)
+    print(f"{args.rows:,} filas, {args.unique:,} descripciones distintas, {os.cpu_count()} núcleos")
+
+    start = time.perf_counter()
+    categorias._categorize_rules(df)
+    seconds = time.perf_counter() - start
+    print(f"{'en proceso (sin pool)':>24}: {args.rows / seconds:>12,.0f} filas/s ({seconds:.2f} s)")
+
+    for workers in args.workers:
+        categorias._memos.clear()
+        _, stats = recategorize(df, workers=workers)
+        print(f"{f'{workers} procesos':>24}: {stats['rows_per_s']:>12,.0f} filas/s ({stats['seconds']:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
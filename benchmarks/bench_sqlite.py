@@ -0,0 +1,82 @@
+# Benchmark de latencia de filtro y agregación: pandas (ledger en memoria) vs. SQLite con índices
+#
+# Uso:
+#   python benchmarks/bench_sqlite.py
+#   python benchmarks/bench_sqlite.py --sizes 100000 1000000 --repeat 20
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(ROOT))
+sys.path.insert(0, ROOT)
+
+import agregados
+import ledger_sqlite
+import ledger_store
+from bench_ledger_store import generate_csv
+from categorias import categorize_ledger
+
+COMPANY = "W TRAVEL CHILE"
+START, END = "2023-06-01", "2023-08-31"
+
+
+# Función para medir la mediana de varias ejecuciones (ms)
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pandas vs. SQLite")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'Filas':>12} {'Operación':>28} {'pandas (ms)':>12} {'SQLite (ms)':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.sizes:
+            csv_path = os.path.join(tmp, f"ledger_{rows}.csv")
+            db_path = os.path.join(tmp, f"ledger_{rows}.db")
+            generate_csv(csv_path, rows)
+            df = ledger_store.read_ledger(csv_path)
+            ledger_sqlite.import_company(COMPANY, df, db_path)
+            df = df.assign(**categorize_ledger(df))
+
+            cases = [
+                (
+                    "filtro por rango de fechas",
+                    lambda: ledger_store.date_slice(df, START, END),
+                    lambda: ledger_sqlite.load_transactions(COMPANY, START, END, db_path=db_path)
+                ),
+                (
+                    "filtro por categoría",
+                    lambda: df[(df['Categoria_Padre'] == "Gastos Operacionales") & (df['Categoria_Hijo'] == "Mantenimiento")],
+                    lambda: ledger_sqlite.load_transactions(
+                        COMPANY, padre="Gastos Operacionales", hijo="Mantenimiento", db_path=db_path
+                    )
+                ),
+                (
+                    "agregado mensual por categoría",
+                    lambda: agregados.monthly_totals(
+                        agregados.build_cube(df, ('Categoria_Padre', 'Categoria_Hijo')), dim='Categoria_Padre'
+                    ),
+                    lambda: agregados.monthly_totals(
+                        ledger_sqlite.build_cube(COMPANY, ('Categoria_Padre', 'Categoria_Hijo'), db_path=db_path),
+                        dim='Categoria_Padre'
+                    )
+                )
+            ]
+            for name, pandas_fn, sqlite_fn in cases:
+                print(f"{rows:>12,} {name:>28} {timed(pandas_fn, args.repeat):>12.2f} {timed(sqlite_fn, args.repeat):>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
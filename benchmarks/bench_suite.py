@@ -0,0 +1,267 @@
+# Suite de benchmarks sin interfaz: tiempos de las rutas de código de cada app sobre ledgers sintéticos
+#
+# Uso:
+#   python benchmarks/bench_suite.py                                  # tabla + comparación con baseline.json
+#   python benchmarks/bench_suite.py --sizes 10000 1000000 10000000 --repeat 5
+#   python benchmarks/bench_suite.py --save-baseline                  # registra una nueva línea base
+#
+# Para cada tamaño genera los tres ledgers con generar_ledger.py (misma semilla: mismos datos) y mide, con la
+# mediana de --repeat corridas, las mismas llamadas que hacen las apps: carga (CSV y sidecar), categorización,
+# KPIs, cubos, groupbys por categoría y tendencia mensual. Si hay una línea base, cada medición se compara con
+# ella y el proceso termina con código 1 si alguna empeora más que --tolerance (las líneas base solo son
+# comparables en la misma máquina).
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# La tabla memo de categorías se escribe en un directorio temporal para no tocar la del proyecto
+os.environ["TRILEDGER_CACHE_DIR"] = tempfile.mkdtemp()
+
+import pandas as pd
+
+import categorias
+import ledger_store
+from agregados import build_cube, category_totals, monthly_totals
+from anomalias import build_anomalies, update_anomalies
+from busqueda import build_search_index, search_rows
+from categorias import categorize_expenses, categorize_ledger
+from generar_ledger import generate_ledgers
+from kpis import build_kpis, frame_kpis, kpi_table
+from pronostico import build_forecast
+
+# Mismo modo que las apps: los frames de las vistas comparten los arreglos del caché
+pd.set_option("mode.copy_on_write", True)
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+CATEGORY_DIMS = ('Categoria_Padre', 'Categoria_Hijo')
+
+# Empresa usada en las vistas por empresa (la de más filas)
+COMPANY = "W TRAVEL CHILE"
+
+
+# Función para vaciar la tabla memo de categorías (en memoria y en disco): la próxima categorización es en frío
+def reset_memos():
+    categorias._memos.clear()
+    for path in glob.glob(os.path.join(categorias.CACHE_DIR, "categorias_*.json")):
+        os.remove(path)
+
+
+# Función para borrar los sidecars y el caché en memoria: la próxima carga parte de los CSV
+def reset_sidecars(data_dir):
+    ledger_store.clear_cache()
+    for path in glob.glob(os.path.join(data_dir, "*.feather")):
+        os.remove(path)
+
+
+# Mediciones: (app, operación, función a medir, preparación no medida). Las funciones reciben el contexto con los
+# datos ya preparados; cada una reproduce la llamada que hace la app correspondiente.
+OPERATIONS = [
+    ("todas", "carga CSV (sin sidecar)",
+     lambda ctx: ledger_store.load_consolidated(), lambda ctx: reset_sidecars(ctx['dir'])),
+    ("todas", "carga sidecar",
+     lambda ctx: ledger_store.load_consolidated(), lambda ctx: ledger_store.clear_cache()),
+
+    ("app.py", "parseo de fechas",
+     lambda ctx: pd.to_datetime(ctx['fechas_texto'], format='%d/%m/%Y'), None),
+    ("app.py", "KPIs por empresa",
+     lambda ctx: build_kpis(ctx['df'], dims=('Empresa',)), None),
+    ("app.py", "tendencia mensual",
+     lambda ctx: ctx['df'].groupby(ctx['df']['Fecha'].dt.to_period('M'))['Monto'].sum(), None),
+
+    ("app_v2", "cubo diario",
+     lambda ctx: build_cube(ctx['company']), None),
+    ("app_v2", "cubo consolidado",
+     lambda ctx: build_cube(ctx['df'], ('Empresa',)), None),
+    ("app_v2", "KPIs",
+     lambda ctx: build_kpis(ctx['company']), None),
+    ("app_v2", "KPIs de un rango (90 días)",
+     lambda ctx: frame_kpis(ledger_store.date_slice(ctx['company'], *ctx['rango'])), None),
+    ("app_v2", "categorizar gastos (memo frío)",
+     lambda ctx: categorize_expenses(ctx['gastos']['Descripción']), lambda ctx: reset_memos()),
+    ("app_v2", "gastos por categoría",
+     lambda ctx: ctx['gastos_categorizados'].groupby('Categoría')['Monto'].sum(), None),
+    ("app_v2", "tendencia mensual",
+     lambda ctx: monthly_totals(ctx['cubo']), None),
+    ("app_v2", "índice de búsqueda",
+     lambda ctx: build_search_index(ctx['df']), None),
+    ("app_v2", "búsqueda 'venta paq'",
+     lambda ctx: search_rows(ctx['indice'], "venta paq"), None),
+    ("app_v2", "pronóstico (3 modelos)",
+     lambda ctx: build_forecast(ctx['cubo']), None),
+    ("app_v2", "anomalías (mediana/MAD móvil)",
+     lambda ctx: build_anomalies(ctx['df']), None),
+    ("app_v2", "anomalías: 100 filas del journal",
+     lambda ctx: update_anomalies(ctx['anomalias'], ctx['df'].tail(100)), None),
+
+    ("app_categorias", "categorizar (memo frío)",
+     lambda ctx: ctx['company'].assign(**categorize_ledger(ctx['company'])), lambda ctx: reset_memos()),
+    ("app_categorias", "categorizar (memo en caché)",
+     lambda ctx: ctx['company'].assign(**categorize_ledger(ctx['company'])), None),
+    ("app_categorias", "cubo por categoría",
+     lambda ctx: build_cube(ctx['categorizado'], dims=CATEGORY_DIMS), None),
+    ("app_categorias", "KPIs por categoría",
+     lambda ctx: kpi_table(build_kpis(ctx['categorizado'], dims=CATEGORY_DIMS), 'Categoria_Padre'), None),
+    ("app_categorias", "totales por categoría",
+     lambda ctx: (category_totals(ctx['cubo_categorias'], 'Categoria_Padre'),
+                  category_totals(ctx['cubo_categorias'], 'Categoria_Hijo')), None),
+    ("app_categorias", "tendencia mensual por categoría",
+     lambda ctx: monthly_totals(ctx['cubo_categorias'], dim='Categoria_Padre'), None),
+    ("app_categorias", "pronóstico por categoría padre",
+     lambda ctx: build_forecast(ctx['cubo_categorias'], 'Categoria_Padre'), None),
+]
+
+
+# Función para medir una operación: mediana de `repeat` corridas, en milisegundos
+def measure(ctx, run, setup, repeat):
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup(ctx)
+        start = time.perf_counter()
+        run(ctx)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+# Función para preparar (sin medir) los datos que usan las operaciones de un tamaño
+def prepare_context(data_dir):
+    entry = ledger_store.load_consolidated()
+    df = entry['df']
+    company = entry['partitions'][COMPANY]
+    gastos = company[company['Monto'] < 0]
+    categorizado = company.assign(**categorize_ledger(company))
+    fin = company['Fecha'].iloc[-1]
+    return {
+        'dir': data_dir,
+        'df': df,
+        'company': company,
+        'fechas_texto': df['Fecha'].dt.strftime('%d/%m/%Y'),
+        'rango': (fin - pd.Timedelta(days=90), fin),
+        'gastos': gastos,
+        'gastos_categorizados': gastos.assign(Categoría=categorize_expenses(gastos['Descripción'])),
+        'cubo': build_cube(company),
+        'indice': build_search_index(df),
+        'anomalias': build_anomalies(df),
+        'categorizado': categorizado,
+        'cubo_categorias': build_cube(categorizado, dims=CATEGORY_DIMS)
+    }
+
+
+# Función para correr todas las operaciones sobre un ledger sintético de `rows` filas
+def run_size(rows, repeat, seed, work_dir):
+    data_dir = os.path.join(work_dir, f"ledger_{rows}")
+    generate_ledgers(data_dir, rows, seed)
+    # Las rutas de CSV_FILES son relativas: las apps corren desde el directorio de los ledgers
+    previous_dir = os.getcwd()
+    os.chdir(data_dir)
+    try:
+        reset_sidecars(data_dir)
+        reset_memos()
+        results = []
+        for app, operation, run, setup in OPERATIONS[:2]:
+            results.append({'app': app, 'op': operation, 'rows': rows, 'ms': measure({'dir': data_dir}, run, setup, repeat)})
+        ctx = prepare_context(data_dir)
+        for app, operation, run, setup in OPERATIONS[2:]:
+            results.append({'app': app, 'op': operation, 'rows': rows, 'ms': measure(ctx, run, setup, repeat)})
+        return results
+    finally:
+        ledger_store.clear_cache()
+        os.chdir(previous_dir)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+# Función para describir la máquina y las versiones (la línea base solo es comparable con la misma)
+def machine_info():
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count()
+    }
+
+
+# Función para armar la tabla comparativa: una fila por (app, operación) y una columna por tamaño
+def comparison_table(results, baseline=None, tolerance=0.2, min_ms=5.0):
+    base = {(r['app'], r['op'], r['rows']): r['ms'] for r in (baseline or {}).get('results', [])}
+    regressions = []
+    rows = {}
+    for r in results:
+        cell = f"{r['ms']:,.1f}"
+        reference = base.get((r['app'], r['op'], r['rows']))
+        if reference:
+            delta = (r['ms'] - reference) / reference
+            regressed = delta > tolerance and r['ms'] - reference > min_ms
+            cell += f" ({delta:+.0%}{' ⚠' if regressed else ''})"
+            if regressed:
+                regressions.append((r, reference))
+        rows.setdefault((r['app'], r['op']), {})[f"{r['rows']:,} filas (ms)"] = cell
+    table = pd.DataFrame.from_dict(rows, orient='index')
+    table.index = pd.MultiIndex.from_tuples(table.index, names=['App', 'Operación'])
+    return table, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Suite de benchmarks de las apps")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="filas totales de los ledgers (10k a 50M)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="archivo JSON de la línea base")
+    parser.add_argument("--save-baseline", action="store_true", help="guardar los resultados como línea base")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="empeoramiento admitido (0.2 = 20%%)")
+    parser.add_argument("--min-ms", type=float, default=5.0, help="diferencias menores se consideran ruido")
+    parser.add_argument("--work-dir", default=None, help="directorio para los ledgers generados")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp()
+    info = machine_info()
+    print(f"Python {info['python']}, pandas {info['pandas']}, {info['cpus']} núcleos, {info['platform']}")
+
+    results = []
+    for rows in args.sizes:
+        started = time.perf_counter()
+        results.extend(run_size(rows, args.repeat, args.seed, work_dir))
+        print(f"{rows:>12,} filas medidas en {time.perf_counter() - started:.1f} s")
+
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('machine') != info:
+            print("Aviso: la línea base se midió en otra máquina o con otras versiones; los deltas son orientativos")
+
+    table, regressions = comparison_table(results, baseline, args.tolerance, args.min_ms)
+    print()
+    print(table.to_string())
+
+    if args.save_baseline:
+        payload = {
+            'meta': {'machine': info, 'seed': args.seed, 'repeat': args.repeat,
+                     'created': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'results': results
+        }
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, indent=1)
+        print(f"\nLínea base guardada en {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} regresiones sobre la línea base (tolerancia {args.tolerance:.0%}):")
+        for r, reference in regressions:
+            print(f"  {r['app']} / {r['op']} / {r['rows']:,} filas: {reference:,.1f} -> {r['ms']:,.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# Generador reproducible de ledgers sintéticos a escala de producción (10k a 50M filas)
+#
+# Uso:
+#   python benchmarks/generar_ledger.py --rows 1000000 --out /tmp/ledgers
+#   python benchmarks/generar_ledger.py --rows 50000000 --out /data/ledgers --seed 7
+#
+# Escribe los tres CSV con los nombres del proyecto (w_travel_chile.csv, ...), así que una app puede correr sobre
+# ellos desde ese directorio. Cada fila se toma de los ledgers reales de su empresa: se conservan el vocabulario
+# de descripciones, la mezcla Ingreso/Gasto y la participación de cada empresa; el monto lleva una variación
+# aleatoria y las fechas se reparten en el período pedido. Con la misma semilla el resultado es idéntico.
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import pandas as pd
+
+from ledger_store import CSV_FILES
+
+# Filas por bloque escrito (memoria acotada al bloque)
+CHUNK_ROWS = 1_000_000
+
+# Período por defecto de las fechas generadas
+START_DATE = "2023-01-01"
+DAYS = 3 * 365
+
+
+# Función para leer el perfil de cada empresa desde sus CSV reales: descripción, tipo y monto absoluto por fila
+def load_profiles(root=ROOT):
+    profiles = {}
+    for company, csv_file in CSV_FILES.items():
+        df = pd.read_csv(os.path.join(root, csv_file))
+        profiles[company] = pd.DataFrame({
+            'Descripción': df['Descripción'].astype(str),
+            'Tipo': df['Tipo'].astype(str),
+            'Monto': df['Monto'].abs().astype('int64')
+        })
+    return profiles
+
+
+# Función para repartir las filas entre empresas según su participación en los ledgers reales
+def split_rows(rows, profiles):
+    sizes = np.array([len(profile) for profile in profiles.values()], dtype='float64')
+    counts = np.floor(rows * sizes / sizes.sum()).astype('int64')
+    counts[0] += rows - counts.sum()
+    return dict(zip(profiles, counts.tolist()))
+
+
+# Función para generar por bloques el ledger sintético de una empresa (DataFrames con el formato del CSV)
+def generate_chunks(company, profile, rows, seed=42, start=START_DATE, days=DAYS, chunk_rows=CHUNK_ROWS):
+    # Una secuencia aleatoria por empresa: el resultado de una no depende de cuántas filas tengan las otras
+    rng = np.random.default_rng([seed, list(CSV_FILES).index(company)])
+    descriptions = profile['Descripción'].to_numpy(dtype=object)
+    tipos = profile['Tipo'].to_numpy(dtype=object)
+    amounts = profile['Monto'].to_numpy()
+    start = pd.Timestamp(start)
+    for offset in range(0, rows, chunk_rows):
+        n = min(chunk_rows, rows - offset)
+        picks = rng.integers(0, len(profile), n)
+        # Variación log-normal del monto real, redondeada a decenas (montos en pesos, sin decimales)
+        monto = np.maximum(np.round(amounts[picks] * rng.lognormal(0.0, 0.25, n), -1), 10).astype('int64')
+        gasto = tipos[picks] == "Gasto"
+        # Cada bloque cubre su tramo del período [offset, offset + n) * days / rows: fechas dentro del rango pedido
+        # y el CSV queda ordenado por Fecha
+        low = offset * days // rows
+        high = max((offset + n) * days // rows, low + 1)
+        fechas = start + pd.to_timedelta(np.sort(rng.integers(low, high, n)), unit="D")
+        yield pd.DataFrame({
+            'Descripción': descriptions[picks],
+            'Tipo': tipos[picks],
+            'Fecha': fechas.strftime("%d/%m/%Y"),
+            'Monto': np.where(gasto, -monto, monto),
+            'Empresa': company
+        })
+
+
+# Función para escribir los tres ledgers sintéticos en out_dir; devuelve empresa -> (ruta, filas)
+def generate_ledgers(out_dir, rows, seed=42, start=START_DATE, days=DAYS, chunk_rows=CHUNK_ROWS):
+    os.makedirs(out_dir, exist_ok=True)
+    profiles = load_profiles()
+    written = {}
+    for company, company_rows in split_rows(rows, profiles).items():
+        path = os.path.join(out_dir, CSV_FILES[company])
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write("Descripción,Tipo,Fecha,Monto,Empresa\n")
+            for chunk in generate_chunks(company, profiles[company], company_rows, seed, start, days, chunk_rows):
+                chunk.to_csv(f, header=False, index=False)
+        written[company] = (path, company_rows)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador de ledgers sintéticos")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="filas totales entre las tres empresas")
+    parser.add_argument("--out", required=True, help="directorio de salida")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--start", default=START_DATE)
+    parser.add_argument("--days", type=int, default=DAYS)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    written = generate_ledgers(args.out, args.rows, args.seed, args.start, args.days)
+    for company, (path, rows) in written.items():
+        print(f"{company:<20} {rows:>12,} filas  {os.path.getsize(path) / 1024 ** 2:>9,.1f} MB  {path}")
+    print(f"Generado en {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import re
+import unicodedata
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+
+# Índice invertido de las descripciones de un ledger para la búsqueda de la página Transacciones.
+# Las descripciones se repiten mucho, así que el índice tiene dos niveles: token -> descripciones distintas que lo
+# contienen, y fila -> descripción (un arreglo de códigos alineado con el orden del ledger). Una consulta resuelve
+# los tokens con búsqueda binaria (prefijos) y luego marca las filas con una sola pasada vectorizada.
+# Se construye una vez por versión del ledger; las filas nuevas del journal se agregan sin re-tokenizar el historial.
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+
+# Función para normalizar un texto: minúsculas y sin acentos ("Comisión" -> "comision")
+def normalize_text(text):
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+# Función para separar un texto normalizado en tokens
+def tokenize(text):
+    return _TOKEN.findall(normalize_text(text))
+
+
+# Función para agregar descripciones nuevas al vocabulario; devuelve el mapa token -> códigos de descripción
+def _index_descriptions(postings, descriptions, first_code):
+    postings = {token: list(codes) for token, codes in postings.items()}
+    for code, description in enumerate(descriptions, start=first_code):
+        for token in set(tokenize(description)):
+            postings.setdefault(token, []).append(code)
+    return postings
+
+
+# Función para armar el índice a partir del vocabulario, los códigos por fila y sus fechas
+def _make_index(postings, descriptions, codes, fechas):
+    tokens = sorted(postings)
+    return {
+        'tokens': tokens,
+        'postings': [np.array(postings[token], dtype='int32') for token in tokens],
+        'descriptions': descriptions,
+        'ids': {description: code for code, description in enumerate(descriptions)},
+        'codes': codes,
+        'fechas': fechas
+    }
+
+
+# Función para construir el índice de búsqueda de un ledger (ordenado por Fecha)
+def build_search_index(df):
+    codes, uniques = pd.factorize(df['Descripción'].astype(str))
+    descriptions = list(uniques)
+    postings = _index_descriptions({}, descriptions, 0)
+    # Fechas copiadas: una vista mantendría vivo el ledger de una versión anterior mientras viva el índice
+    fechas = df['Fecha'].to_numpy(dtype='datetime64[ns]', copy=True)
+    return _make_index(postings, descriptions, codes.astype('int32'), fechas)
+
+
+# Función para incorporar las filas nuevas del journal: se insertan donde merge_rows las ubica (orden estable por
+# Fecha, después de las filas existentes del mismo día). El índice anterior no se modifica.
+def update_search_index(index, new_rows):
+    if new_rows.empty:
+        return index
+    descriptions = new_rows['Descripción'].astype(str).tolist()
+    unseen = list(dict.fromkeys(d for d in descriptions if d not in index['ids']))
+    if unseen:
+        postings = {token: codes.tolist() for token, codes in zip(index['tokens'], index['postings'])}
+        postings = _index_descriptions(postings, unseen, len(index['descriptions']))
+        updated = _make_index(postings, index['descriptions'] + unseen, index['codes'], index['fechas'])
+    else:
+        updated = dict(index)
+
+    new_fechas = new_rows['Fecha'].to_numpy(dtype='datetime64[ns]')
+    order = np.argsort(new_fechas, kind='stable')
+    new_codes = np.array([updated['ids'][d] for d in descriptions], dtype='int32')[order]
+    new_fechas = new_fechas[order]
+    positions = np.searchsorted(index['fechas'], new_fechas, side='right')
+    updated['codes'] = np.insert(index['codes'], positions, new_codes)
+    updated['fechas'] = np.insert(index['fechas'], positions, new_fechas)
+    return updated
+
+
+# Función para obtener las descripciones que contienen todos los términos (cada término como prefijo de un token)
+def matching_descriptions(index, query):
+    terms = tokenize(query)
+    if not terms:
+        return None
+    tokens = index['tokens']
+    match = np.ones(len(index['descriptions']), dtype=bool)
+    for term in terms:
+        term_match = np.zeros(len(index['descriptions']), dtype=bool)
+        lo = bisect_left(tokens, term)
+        hi = bisect_left(tokens, term + '\uffff', lo)
+        for postings in index['postings'][lo:hi]:
+            term_match[postings] = True
+        match &= term_match
+    return match
+
+
+# Función para buscar en el índice: posiciones (ordenadas) de las filas del ledger que coinciden con la consulta.
+# Devuelve None si la consulta no tiene términos.
+def search_rows(index, query):
+    match = matching_descriptions(index, query)
+    if match is None:
+        return None
+    if not match.any():
+        return np.empty(0, dtype='int64')
+    return np.flatnonzero(match[index['codes']])
+
+
+# Función para filtrar un ledger con una consulta usando su índice (o uno armado en el momento si no hay)
+def search_frame(df, query, index=None):
+    if index is None:
+        index = build_search_index(df)
+    rows = search_rows(index, query)
+    return df if rows is None else df.iloc[rows]
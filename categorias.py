@@ -0,0 +1,314 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Directorio para cachés persistentes (tabla memo de categorías)
+CACHE_DIR = os.environ.get("TRILEDGER_CACHE_DIR", ".triledger_cache")
+
+# Definir categorías jerárquicas
+CATEGORIAS_PADRE = {
+    "Ingresos": {
+        "color": "#10b981",
+        "icon": "📈",
+        "subcategorias": [
+            "Ventas de Paquetes",
+            "Comisiones",
+            "Servicios Turísticos",
+            "Otros Ingresos"
+        ]
+    },
+    "Gastos Operacionales": {
+        "color": "#ef4444", 
+        "icon": "🏢",
+        "subcategorias": [
+            "Arriendo de Oficina",
+            "Servicios Básicos",
+            "Equipos y Tecnología",
+            "Software y Licencias",
+            "Mantenimiento"
+        ]
+    },
+    "Gastos Administrativos": {
+        "color": "#f97316",
+        "icon": "📋",
+        "subcategorias": [
+            "Impuestos",
+            "Tasas Gubernamentales",
+            "Seguros",
+            "Gastos Legales"
+        ]
+    },
+    "Gastos de Personal": {
+        "color": "#8b5cf6",
+        "icon": "👥",
+        "subcategorias": [
+            "Salarios",
+            "Beneficios",
+            "Capacitación",
+            "Viáticos"
+        ]
+    },
+    "Gastos de Marketing": {
+        "color": "#06b6d4",
+        "icon": "📢",
+        "subcategorias": [
+            "Publicidad",
+            "Promociones",
+            "Material Promocional",
+            "Eventos"
+        ]
+    },
+    "Gastos de Viaje": {
+        "color": "#eab308",
+        "icon": "✈️",
+        "subcategorias": [
+            "Transporte",
+            "Alojamiento",
+            "Alimentación",
+            "Actividades"
+        ]
+    }
+}
+
+# Reglas de categorización, evaluadas en orden: la primera regla con alguna palabra clave gana
+REGLAS_INGRESO = [
+    (['paquete', 'turístico', 'viaje', 'reserva'], "Ingresos", "Ventas de Paquetes"),
+    (['comisión', 'comision'], "Ingresos", "Comisiones"),
+    (['servicio', 'tour', 'guía'], "Ingresos", "Servicios Turísticos")
+]
+DEFAULT_INGRESO = ("Ingresos", "Otros Ingresos")
+
+REGLAS_GASTO = [
+    (['arriendo', 'oficina', 'rent'], "Gastos Operacionales", "Arriendo de Oficina"),
+    (['servicios', 'básicos', 'luz', 'agua', 'gas'], "Gastos Operacionales", "Servicios Básicos"),
+    (['equipos', 'computación', 'software', 'audiovisuales'], "Gastos Operacionales", "Equipos y Tecnología"),
+    (['mantenimiento'], "Gastos Operacionales", "Mantenimiento"),
+    (['impuestos', 'tasas', 'gubernamentales'], "Gastos Administrativos", "Impuestos"),
+    (['supermercado', 'provisiones', 'alimentación'], "Gastos de Viaje", "Alimentación")
+]
+DEFAULT_GASTO = ("Gastos Operacionales", "Otros Gastos")
+
+# Reglas del análisis de categorías de gastos de app_v2 (una sola categoría por gasto)
+REGLAS_GASTO_REPORTE = [
+    (['arriendo', 'oficina', 'rent'], 'Arriendo'),
+    (['servicios', 'básicos', 'luz', 'agua', 'gas'], 'Servicios Básicos'),
+    (['impuestos', 'tasas', 'gubernamentales'], 'Impuestos'),
+    (['equipos', 'computación', 'software', 'audiovisuales'], 'Equipos y Tecnología'),
+    (['mantenimiento', 'vehículos', 'seguro'], 'Mantenimiento y Seguros'),
+    (['supermercado', 'provisiones', 'alimentación'], 'Alimentación y Provisiones')
+]
+DEFAULT_GASTO_REPORTE = 'Otros Gastos'
+
+
+# Función para compilar una regex de alternancia por regla (búsqueda de subcadena, igual que `word in texto`)
+def _compile_rules(reglas):
+    return [re.compile('|'.join(re.escape(word) for word in words)) for words, _, _ in reglas]
+
+
+_PATRONES_INGRESO = _compile_rules(REGLAS_INGRESO)
+_PATRONES_GASTO = _compile_rules(REGLAS_GASTO)
+_PATRONES_GASTO_REPORTE = [
+    re.compile('|'.join(re.escape(word) for word in words)) for words, _ in REGLAS_GASTO_REPORTE
+]
+
+
+# Función para calcular el hash de un conjunto de reglas (invalida la tabla memo cuando cambian)
+def rules_hash(*rule_sets):
+    payload = json.dumps(rule_sets, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+LEDGER_RULES_HASH = rules_hash(CATEGORIAS_PADRE, REGLAS_INGRESO, DEFAULT_INGRESO, REGLAS_GASTO, DEFAULT_GASTO)
+GASTO_REPORTE_RULES_HASH = rules_hash(REGLAS_GASTO_REPORTE, DEFAULT_GASTO_REPORTE)
+
+# Tablas memo (descripción, tipo) -> categorías, en memoria del proceso y en disco
+_memos = {}
+_memo_lock = threading.Lock()
+
+
+# Función para categorizar una transacción individual
+def categorize_transaction(description, transaction_type):
+    description_lower = description.lower()
+
+    if transaction_type == "Ingreso":
+        reglas, default = REGLAS_INGRESO, DEFAULT_INGRESO
+    else:
+        reglas, default = REGLAS_GASTO, DEFAULT_GASTO
+
+    for words, padre, hijo in reglas:
+        if any(word in description_lower for word in words):
+            return padre, hijo
+    return default
+
+
+# Función para obtener el índice de la primera regla que aplica a cada descripción (len(patrones) si ninguna)
+def _rule_choice(descriptions_lower, patrones):
+    conditions = [
+        descriptions_lower.str.contains(patron, regex=True, na=False).to_numpy()
+        for patron in patrones
+    ]
+    # np.select toma la primera condición verdadera, respetando el orden de las reglas
+    return np.select(conditions, np.arange(len(patrones)), default=len(patrones))
+
+
+# Función para asignar (padre, hijo) a un bloque de descripciones ya en minúsculas
+def _apply_rules(descriptions_lower, reglas, patrones, default):
+    choice = _rule_choice(descriptions_lower, patrones)
+    padres = np.array([padre for _, padre, _ in reglas] + [default[0]], dtype=object)
+    hijos = np.array([hijo for _, _, hijo in reglas] + [default[1]], dtype=object)
+    return padres[choice], hijos[choice]
+
+
+# Función para aplicar las reglas del ledger a todas las filas de una sola vez
+def _categorize_rules(df):
+    descriptions_lower = df['Descripción'].astype(str).str.lower()
+    es_ingreso = (df['Tipo'] == "Ingreso").to_numpy()
+
+    padre = np.empty(len(df), dtype=object)
+    hijo = np.empty(len(df), dtype=object)
+
+    for mask, reglas, patrones, default in (
+        (es_ingreso, REGLAS_INGRESO, _PATRONES_INGRESO, DEFAULT_INGRESO),
+        (~es_ingreso, REGLAS_GASTO, _PATRONES_GASTO, DEFAULT_GASTO)
+    ):
+        if mask.any():
+            padre[mask], hijo[mask] = _apply_rules(descriptions_lower[mask], reglas, patrones, default)
+
+    return pd.DataFrame({'Categoria_Padre': padre, 'Categoria_Hijo': hijo}, index=df.index)
+
+
+# Etiquetas (padre, hijo) del ledger en orden de código: reglas de ingreso, su default, reglas de gasto, su default
+LEDGER_LABELS = (
+    [(padre, hijo) for _, padre, hijo in REGLAS_INGRESO] + [DEFAULT_INGRESO]
+    + [(padre, hijo) for _, padre, hijo in REGLAS_GASTO] + [DEFAULT_GASTO]
+)
+
+
+# Función para categorizar con códigos enteros sobre LEDGER_LABELS (resultado compacto para procesos externos)
+def categorize_codes(descriptions, es_ingreso):
+    descriptions_lower = pd.Series(descriptions, dtype=object).astype(str).str.lower()
+    es_ingreso = np.asarray(es_ingreso, dtype=bool)
+    codes = np.empty(len(descriptions_lower), dtype='int16')
+    if es_ingreso.any():
+        codes[es_ingreso] = _rule_choice(descriptions_lower[es_ingreso], _PATRONES_INGRESO)
+    if (~es_ingreso).any():
+        codes[~es_ingreso] = len(REGLAS_INGRESO) + 1 + _rule_choice(descriptions_lower[~es_ingreso], _PATRONES_GASTO)
+    return codes
+
+
+# Función para aplicar las reglas de gastos del reporte de app_v2 de una sola vez
+def _categorize_expense_rules(df):
+    descriptions_lower = df['Descripción'].astype(str).str.lower()
+    conditions = [
+        descriptions_lower.str.contains(patron, regex=True, na=False).to_numpy()
+        for patron in _PATRONES_GASTO_REPORTE
+    ]
+    choice = np.select(conditions, np.arange(len(REGLAS_GASTO_REPORTE)), default=len(REGLAS_GASTO_REPORTE))
+    categorias = np.array([categoria for _, categoria in REGLAS_GASTO_REPORTE] + [DEFAULT_GASTO_REPORTE], dtype=object)
+    return pd.DataFrame({'Categoría': categorias[choice]}, index=df.index)
+
+
+# Función para obtener la tabla memo de un conjunto de reglas, descartándola si el hash no coincide
+def _load_memo(name, digest):
+    memo = _memos.get(name)
+    if memo is not None and memo['hash'] == digest:
+        return memo
+
+    path = os.path.join(CACHE_DIR, f"categorias_{name}.json")
+    entries = {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('rules_hash') == digest:
+            entries = {(desc, tipo): tuple(values) for desc, tipo, *values in data['entries']}
+    except (OSError, ValueError):
+        pass
+
+    memo = {'hash': digest, 'path': path, 'entries': entries}
+    _memos[name] = memo
+    return memo
+
+
+# Función para guardar la tabla memo en disco (escritura atómica)
+def _save_memo(memo):
+    payload = {
+        'rules_hash': memo['hash'],
+        'entries': [[desc, tipo, *values] for (desc, tipo), values in memo['entries'].items()]
+    }
+    tmp_path = f"{memo['path']}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, memo['path'])
+    except OSError:
+        # Sin permisos de escritura la tabla sigue viva en memoria
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# Función para categorizar solo las (descripción, tipo) no vistas y unir el resultado por código
+def _categorize_memoized(descriptions, tipos, name, digest, categorize_fn, columns):
+    # Código por par (descripción, tipo) a partir de los códigos de cada columna
+    desc_codes, desc_uniques = pd.factorize(descriptions.astype(str))
+    tipo_codes, tipo_uniques = pd.factorize(tipos.astype(str))
+    pair_codes, codes = np.unique(desc_codes * len(tipo_uniques) + tipo_codes, return_inverse=True)
+    uniques = list(zip(
+        desc_uniques[pair_codes // max(len(tipo_uniques), 1)],
+        tipo_uniques[pair_codes % max(len(tipo_uniques), 1)]
+    ))
+
+    with _memo_lock:
+        memo = _load_memo(name, digest)
+        entries = memo['entries']
+        missing = [key for key in uniques if key not in entries]
+        if missing:
+            new_keys = pd.DataFrame(missing, columns=['Descripción', 'Tipo'])
+            result = categorize_fn(new_keys)
+            for key, values in zip(missing, result[columns].itertuples(index=False, name=None)):
+                entries[key] = values
+            _save_memo(memo)
+        unique_values = [entries[key] for key in uniques]
+
+    # Join vectorizado: cada fila toma el resultado de su descripción única
+    return pd.DataFrame({
+        column: np.array([values[j] for values in unique_values], dtype=object)[codes]
+        for j, column in enumerate(columns)
+    }, index=descriptions.index)
+
+
+# Función para registrar en la tabla memo del ledger resultados calculados fuera de este proceso
+def seed_ledger_memo(keys, values):
+    with _memo_lock:
+        memo = _load_memo("ledger", LEDGER_RULES_HASH)
+        memo['entries'].update(zip(keys, values))
+        _save_memo(memo)
+
+
+# Función para saber si la tabla memo del ledger no corresponde a las reglas actuales (cambió la taxonomía o nunca
+# se categorizó): todo el historial debe volver a categorizarse
+def ledger_memo_stale():
+    with _memo_lock:
+        return not _load_memo("ledger", LEDGER_RULES_HASH)['entries']
+
+
+# Función para categorizar todas las transacciones de un ledger de una sola vez
+def categorize_ledger(df):
+    return _categorize_memoized(
+        df['Descripción'], df['Tipo'], "ledger", LEDGER_RULES_HASH,
+        _categorize_rules, ['Categoria_Padre', 'Categoria_Hijo']
+    )
+
+
+# Función para categorizar los gastos del reporte de app_v2
+def categorize_expenses(descriptions):
+    tipos = pd.Series("Gasto", index=descriptions.index)
+    return _categorize_memoized(
+        descriptions, tipos, "gastos_reporte", GASTO_REPORTE_RULES_HASH,
+        _categorize_expense_rules, ['Categoría']
+    )['Categoría']
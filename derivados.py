@@ -0,0 +1,40 @@
+# Grafo perezoso de datasets derivados de un ledger (fechas, categorías, cubos, resúmenes).
+# Cada nodo tiene un nombre, una función y sus dependencias; se calcula la primera vez que una página lo pide y
+# se memoriza en la entrada de caché del ledger, que es una por versión. Un nodo que la página actual no usa no
+# se calcula. Los nodos con updater se actualizan con las filas nuevas del journal en vez de recalcularse.
+from rendimiento import timed
+
+# Nodo raíz: el ledger de la entrada
+LEDGER = 'ledger'
+
+
+# Función para definir un nodo: builder recibe los valores de sus dependencias, en orden.
+# stage es la etapa a la que se atribuye su tiempo en la instrumentación (rendimiento.py).
+def node(builder, deps=(LEDGER,), updater=None, stage='aggregate'):
+    return {'builder': builder, 'deps': tuple(deps), 'updater': updater, 'stage': stage}
+
+
+# Función para crear una entrada sin ledger en caché (memoización de una sola ejecución, p. ej. con SQLite)
+def run_entry():
+    return {'df': None, 'derived': {}, 'updaters': {}}
+
+
+# Función para evaluar un nodo sobre una entrada de caché, calculando antes las dependencias que falten
+def evaluate(entry, graph, name):
+    if name == LEDGER and name not in graph:
+        return entry['df'].copy(deep=False)
+    derived = entry['derived']
+    if name not in derived:
+        spec = graph[name]
+        values = [evaluate(entry, graph, dep) for dep in spec['deps']]
+        # Si dos sesiones lo calculan a la vez, ambas obtienen el mismo resultado
+        with timed(spec['stage']):
+            derived[name] = spec['builder'](*values)
+        if spec['updater'] is not None:
+            entry['updaters'][name] = spec['updater']
+    return derived[name]
+
+
+# Función para obtener el acceso perezoso a los datasets de una entrada: datasets(nombre) -> valor
+def lazy_datasets(entry, graph):
+    return lambda name: evaluate(entry, graph, name)
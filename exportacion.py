@@ -0,0 +1,223 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:  # Sin pyarrow no se ofrece Parquet y el CSV se escribe con pandas
+    pa = None
+    pa_csv = None
+    pq = None
+
+# Excel: xlsxwriter (memoria constante) o, si no está, openpyxl en modo solo escritura; sin ninguno no se ofrece
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# Exportación del ledger filtrado. El archivo se escribe por bloques en disco: la memoria de trabajo es la de un
+# bloque, no la del archivo. Un archivo ya exportado se reutiliza mientras no cambien la versión de los datos ni
+# los filtros; st.download_button lo lee al mostrarse.
+
+# Filas por bloque escrito
+EXPORT_CHUNK_ROWS = int(os.environ.get("TRILEDGER_EXPORT_CHUNK_ROWS", 100_000))
+
+# Directorio de los archivos exportados y cuántos se conservan (los más antiguos se borran)
+EXPORT_DIR = os.environ.get("TRILEDGER_EXPORT_DIR", os.path.join(tempfile.gettempdir(), "triledger_exportaciones"))
+EXPORT_MAX_FILES = int(os.environ.get("TRILEDGER_EXPORT_MAX_FILES", 16))
+
+# Límite de filas de una hoja Excel (sin contar el encabezado)
+XLSX_MAX_ROWS = 1_048_575
+
+# Formatos: extensión y tipo MIME
+FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet")
+}
+
+_export_lock = threading.Lock()
+
+
+# Función para obtener los formatos disponibles con las dependencias instaladas
+def available_formats():
+    formats = ["CSV"]
+    if xlsxwriter is not None or openpyxl is not None:
+        formats.append("Excel")
+    if pq is not None:
+        formats.append("Parquet")
+    return formats
+
+
+# Función para recorrer un DataFrame por bloques de filas (vistas, sin copiar el resto)
+def _chunks(df, chunk_rows):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+# Función para formatear las fechas de un bloque como en el CSV del ledger (una vez por día distinto, no por fila)
+def _format_dates(chunk):
+    formatted = {}
+    for name, column in chunk.items():
+        if pd.api.types.is_datetime64_any_dtype(column):
+            codes, days = pd.factorize(column)
+            formatted[name] = np.asarray(days.strftime('%d/%m/%Y'), dtype=object)[codes]
+    return chunk.assign(**formatted) if formatted else chunk
+
+
+# Función para convertir un bloque a listas de Python por columna
+def _chunk_columns(chunk):
+    columns = []
+    for _, column in _format_dates(chunk).items():
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            column = column.astype(object)
+        columns.append(column.tolist())
+    return columns
+
+
+# Función para escribir un CSV con el mismo formato de fechas que los ledgers (con pyarrow si está instalado)
+def _write_csv(df, path, chunk_rows):
+    if pa_csv is None:
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            if df.empty:
+                df.to_csv(f, index=False)
+            for i, chunk in enumerate(_chunks(df, chunk_rows)):
+                _format_dates(chunk).to_csv(f, header=i == 0, index=False)
+        return
+    schema = pa.Table.from_pandas(_format_dates(df.iloc[:chunk_rows]), preserve_index=False).schema
+    with pa_csv.CSVWriter(path, schema) as writer:
+        for chunk in _chunks(df, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(_format_dates(chunk), schema=schema, preserve_index=False))
+
+
+# Función para escribir un Parquet con un row group por bloque (tipos conservados: fechas y categorías)
+def _write_parquet(df, path, chunk_rows):
+    # El esquema sale del primer bloque (un DataFrame vacío no tiene tipos para las columnas de texto)
+    schema = pa.Table.from_pandas(df.iloc[:chunk_rows], preserve_index=False).schema
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in _chunks(df, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+# Función para escribir una hoja Excel fila a fila en modo de memoria constante
+def _write_xlsx(df, path, chunk_rows):
+    header = [str(column) for column in df.columns]
+    if xlsxwriter is not None:
+        workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+        worksheet = workbook.add_worksheet("Transacciones")
+        worksheet.write_row(0, 0, header)
+        row = 1
+        for chunk in _chunks(df, chunk_rows):
+            for values in zip(*_chunk_columns(chunk)):
+                worksheet.write_row(row, 0, values)
+                row += 1
+        workbook.close()
+    else:
+        workbook = openpyxl.Workbook(write_only=True)
+        worksheet = workbook.create_sheet("Transacciones")
+        worksheet.append(header)
+        for chunk in _chunks(df, chunk_rows):
+            for values in zip(*_chunk_columns(chunk)):
+                worksheet.append(values)
+        workbook.save(path)
+
+
+WRITERS = {"CSV": _write_csv, "Excel": _write_xlsx, "Parquet": _write_parquet}
+
+
+# Función para borrar los archivos exportados más antiguos
+def _prune_exports():
+    try:
+        paths = [os.path.join(EXPORT_DIR, name) for name in os.listdir(EXPORT_DIR)]
+        paths = sorted((path for path in paths if not path.endswith('.tmp')), key=os.path.getmtime)
+        for path in paths[:-EXPORT_MAX_FILES]:
+            os.remove(path)
+    except OSError:
+        pass
+
+
+# Función para exportar un DataFrame a un archivo; con clave, el archivo se reutiliza mientras la clave no cambie.
+# Devuelve la ruta del archivo.
+def export_frame(df, fmt, key=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    extension = FORMATS[fmt][0]
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    if key is None:
+        handle, path = tempfile.mkstemp(suffix=f".{extension}", dir=EXPORT_DIR)
+        os.close(handle)
+        WRITERS[fmt](df, path, chunk_rows)
+        with _export_lock:
+            _prune_exports()
+        return path
+
+    digest = hashlib.sha1(repr((key, fmt)).encode()).hexdigest()[:16]
+    path = os.path.join(EXPORT_DIR, f"{digest}.{extension}")
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+    # Escritura atómica: otra sesión nunca ve un archivo a medio escribir
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        WRITERS[fmt](df, tmp_path, chunk_rows)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    with _export_lock:
+        _prune_exports()
+    return path
+
+
+# Función para mostrar la exportación de un DataFrame: elegir formato, preparar el archivo y descargarlo.
+# frame puede ser una función que devuelve el DataFrame: solo se evalúa al preparar el archivo. filters identifica
+# el recorte (empresa, fechas, categorías); sin versión de los datos (p. ej. con SQLite) el archivo no se reutiliza.
+# label es el título del expander (debe decir qué filas se exportan si no son las de la tabla de la página).
+def render_export(frame, file_name, widget_key, filters, version, rows=None, label="📥 Exportar"):
+    with st.expander(label, expanded=False):
+        if rows is None and isinstance(frame, pd.DataFrame):
+            rows = len(frame)
+        col1, col2 = st.columns([2, 1])
+        with col1:
+            fmt = st.radio("Formato", available_formats(), horizontal=True, key=f"{widget_key}_formato")
+            if rows is not None:
+                st.caption(f"{rows:,} filas con los filtros actuales")
+        with col2:
+            prepare = st.button("Preparar archivo", key=f"{widget_key}_preparar")
+
+        request = (file_name, *filters, version, fmt)
+        if prepare:
+            df = frame() if callable(frame) else frame
+            if fmt == "Excel" and len(df) > XLSX_MAX_ROWS:
+                st.warning(f"Excel admite hasta {XLSX_MAX_ROWS:,} filas; exporta en CSV o Parquet o acota los filtros.")
+                return
+            key = None if version is None else request[:-1]
+            with st.spinner("Exportando..."):
+                st.session_state[f"{widget_key}_archivo"] = (request, export_frame(df, fmt, key))
+
+        # La descarga se ofrece solo en la ejecución que preparó el archivo: download_button lo lee completo al
+        # almacén de medios, y ofrecerlo en cada ejecución posterior volvería a cargarlo en memoria
+        prepared = st.session_state.pop(f"{widget_key}_archivo", None)
+        # Un archivo preparado con otros filtros, otro formato u otra versión de los datos ya no se ofrece
+        if prepared is None or prepared[0] != request or not os.path.exists(prepared[1]):
+            return
+        extension, mime = FORMATS[fmt]
+        with open(prepared[1], 'rb') as f:
+            # Descargar no vuelve a ejecutar la página (el botón sigue disponible mientras no haya otra interacción)
+            st.download_button(
+                f"💾 Descargar {fmt}",
+                f,
+                file_name=f"{file_name}.{extension}",
+                mime=mime,
+                key=f"{widget_key}_descargar",
+                on_click="ignore"
+            )
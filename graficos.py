@@ -0,0 +1,75 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from rendimiento import timed
+
+# Caché de figuras Plotly del proceso. Una figura se construye una vez por (gráfico, empresa, versión de los
+# datos, filtros, tema, modo oscuro); los reruns que no cambian nada de eso (abrir un expander, paginar la tabla)
+# reutilizan la figura ya armada en vez de volver a pasar por plotly.express.
+
+# Máximo de puntos por traza de línea; las trazas más largas se reducen conservando mínimos y máximos
+FIGURE_MAX_POINTS = int(os.environ.get("TRILEDGER_FIGURE_MAX_POINTS", 1000))
+
+# Cantidad de figuras en caché (LRU)
+FIGURE_CACHE_SIZE = int(os.environ.get("TRILEDGER_FIGURE_CACHE_SIZE", 256))
+
+_figures = OrderedDict()
+_figures_lock = threading.Lock()
+
+
+# Función para elegir los índices a conservar de una serie: el primero, el último y, por tramo, su mínimo y su máximo
+def _minmax_indices(values, max_points):
+    buckets = np.array_split(np.arange(len(values)), max(max_points // 2 - 1, 1))
+    keep = {0, len(values) - 1}
+    for bucket in buckets:
+        if len(bucket):
+            segment = values[bucket]
+            keep.add(int(bucket[np.argmin(segment)]))
+            keep.add(int(bucket[np.argmax(segment)]))
+    return np.array(sorted(keep))
+
+
+# Función para reducir las trazas de línea con más de max_points puntos (las barras y tortas ya vienen agregadas)
+def downsample_figure(fig, max_points=FIGURE_MAX_POINTS):
+    for trace in fig.data:
+        if trace.type not in ('scatter', 'scattergl') or trace.y is None or len(trace.y) <= max_points:
+            continue
+        y = np.asarray(trace.y)
+        if not np.issubdtype(y.dtype, np.number):
+            continue
+        keep = _minmax_indices(y, max_points)
+        updates = {'y': y[keep]}
+        if trace.x is not None:
+            updates['x'] = np.asarray(trace.x)[keep]
+        if trace.text is not None and not isinstance(trace.text, str):
+            updates['text'] = np.asarray(trace.text)[keep]
+        trace.update(updates)
+    return fig
+
+
+# Función para armar la clave de una figura; sin versión de datos (p. ej. con SQLite) no se cachea
+def figure_key(name, company, version, *params):
+    if version is None:
+        return None
+    return (name, company, version, *params)
+
+
+# Función para obtener una figura del caché o construirla con build() (y reducirla) si no está
+def cached_figure(key, build):
+    if key is not None:
+        with _figures_lock:
+            fig = _figures.get(key)
+            if fig is not None:
+                _figures.move_to_end(key)
+                return fig
+    with timed('figure'):
+        fig = downsample_figure(build())
+    if key is not None:
+        with _figures_lock:
+            _figures[key] = fig
+            while len(_figures) > FIGURE_CACHE_SIZE:
+                _figures.popitem(last=False)
+    return fig
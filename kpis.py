@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+# Motor de KPIs: sumas y conteos corrientes de ingresos y gastos, en total y por grupo (empresa, categoría).
+# El estado es pequeño (una fila por grupo) y las filas nuevas del journal lo actualizan sin recorrer el ledger.
+KPI_FIELDS = ['Ingresos', 'Cantidad ingresos', 'Gastos', 'Cantidad gastos', 'Cantidad']
+
+
+# Función para calcular sumas y conteos por fila (ingresos positivos, gastos en valor absoluto)
+def _columns(monto):
+    monto = np.asarray(monto, dtype='int64')
+    return {
+        'Ingresos': np.where(monto > 0, monto, 0),
+        'Cantidad ingresos': (monto > 0).astype('int64'),
+        'Gastos': np.where(monto < 0, -monto, 0),
+        'Cantidad gastos': (monto < 0).astype('int64'),
+        'Cantidad': np.ones(len(monto), dtype='int64')
+    }
+
+
+# Función para acumular los totales de un conjunto de transacciones
+def _totals(df):
+    columns = _columns(df['Monto'])
+    return np.array([columns[field].sum() for field in KPI_FIELDS], dtype='int64')
+
+
+# Función para acumular totales por grupo: tupla de valores de las dimensiones -> totales
+def _group_totals(df, dims):
+    if df.empty:
+        return {}
+    frame = pd.DataFrame({**{dim: df[dim].to_numpy() for dim in dims}, **_columns(df['Monto'])})
+    grouped = frame.groupby(list(dims), sort=False)[KPI_FIELDS].sum()
+    keys = grouped.index if len(dims) > 1 else [(key,) for key in grouped.index]
+    return dict(zip(keys, grouped.to_numpy(dtype='int64')))
+
+
+# Función para construir el estado de KPIs de un ledger (una pasada)
+def build_kpis(df, dims=()):
+    dims = tuple(dims)
+    return {
+        'dims': dims,
+        'total': _totals(df),
+        'groups': _group_totals(df, dims) if dims else {}
+    }
+
+
+# Función para incorporar transacciones nuevas: el costo depende de las filas nuevas, no del tamaño del ledger
+def append_to_kpis(state, new_rows):
+    if new_rows.empty:
+        return state
+    groups = dict(state['groups'])
+    if state['dims']:
+        for key, totals in _group_totals(new_rows, state['dims']).items():
+            groups[key] = groups[key] + totals if key in groups else totals
+    return {'dims': state['dims'], 'total': state['total'] + _totals(new_rows), 'groups': groups}
+
+
+# Función para obtener los KPIs derivados (saldo, promedios, margen) de unos totales
+def kpi_summary(totals):
+    ingresos, n_ingresos, gastos, n_gastos, cantidad = (int(value) for value in totals)
+    return {
+        'Ingresos': ingresos,
+        'Gastos': gastos,
+        'Saldo': ingresos - gastos,
+        'Transacciones': cantidad,
+        'Promedio ingreso': ingresos / n_ingresos if n_ingresos else 0,
+        'Promedio gasto': gastos / n_gastos if n_gastos else 0,
+        'Margen': (ingresos - gastos) / ingresos * 100 if ingresos else 0,
+        'Ratio de gastos': gastos / ingresos * 100 if ingresos else 0
+    }
+
+
+# Función para obtener los KPIs de un recorte del ledger (p. ej. un rango de fechas) en una sola pasada
+def frame_kpis(df):
+    return kpi_summary(_totals(df))
+
+
+# Función para obtener la tabla de KPIs por grupo, opcionalmente sumada hasta una dimensión
+def kpi_table(state, dim=None):
+    if not state['groups']:
+        return pd.DataFrame(columns=[*KPI_FIELDS, 'Neto', 'Promedio'])
+    index = pd.MultiIndex.from_tuples(list(state['groups']), names=state['dims'])
+    table = pd.DataFrame(np.vstack(list(state['groups'].values())), index=index, columns=KPI_FIELDS)
+    table = table.groupby(level=dim if dim is not None else list(state['dims'])).sum()
+    table['Neto'] = table['Ingresos'] - table['Gastos']
+    table['Promedio'] = (table['Ingresos'] + table['Gastos']) / table['Cantidad']
+    return table
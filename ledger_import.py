@@ -0,0 +1,79 @@
+# Importación por bloques de ledgers grandes (exportaciones de varios GB).
+#
+# Uso:
+#   python ledger_import.py w_travel_chile.csv
+#   python ledger_import.py export.csv --chunksize 500000
+#
+# El CSV se lee por bloques con tipos explícitos; cada bloque se valida, se categoriza, alimenta el cubo
+# de agregados y los KPIs, y se escribe en el sidecar .feather. El archivo completo nunca se materializa.
+import argparse
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from agregados import append_to_cube, build_cube, category_totals
+from categorias import categorize_ledger
+from kpis import append_to_kpis, build_kpis, kpi_summary
+from ledger_store import CHUNK_ROWS, sidecar_path, stream_sidecar
+
+DIMS = ('Categoria_Padre', 'Categoria_Hijo')
+
+
+# Función para obtener el pico de memoria residente del proceso (bytes)
+def peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KB; macOS, bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# Función para importar un CSV por bloques: sidecar + cubo por categoría + KPIs
+def import_ledger(path, chunksize=CHUNK_ROWS):
+    state = {'cube': None, 'kpis': None}
+
+    def process(chunk):
+        chunk = chunk.assign(**categorize_ledger(chunk))
+        if state['cube'] is None:
+            state['cube'] = build_cube(chunk, DIMS)
+            state['kpis'] = build_kpis(chunk, DIMS)
+        else:
+            state['cube'] = append_to_cube(state['cube'], chunk)
+            state['kpis'] = append_to_kpis(state['kpis'], chunk)
+
+    start = time.perf_counter()
+    stats = stream_sidecar(path, chunksize=chunksize, on_chunk=process)
+    stats['seconds'] = time.perf_counter() - start
+    stats['peak_rss'] = peak_rss()
+    return stats, state['cube'], state['kpis']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importación por bloques de un ledger CSV")
+    parser.add_argument("csv")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    stats, cube, kpis = import_ledger(args.csv, args.chunksize)
+
+    print(f"Filas importadas:  {stats['rows']:,} en {stats['chunks']:,} bloques ({stats['seconds']:.1f} s)")
+    print(f"Filas descartadas: {stats['rejected']:,}")
+    if stats['peak_rss'] is not None:
+        print(f"Pico de RSS:       {stats['peak_rss'] / 1024 ** 2:,.1f} MB")
+    if not stats['rows']:
+        return
+    print(f"Sidecar:           {sidecar_path(args.csv)}")
+    if not stats['sorted']:
+        print("Aviso: el CSV no está ordenado por Fecha; el sidecar se guardó ordenado")
+
+    summary = kpi_summary(kpis['total'])
+    print(f"Ingresos: ${summary['Ingresos']:,.0f}  Gastos: ${summary['Gastos']:,.0f}  Saldo: ${summary['Saldo']:,.0f}")
+    print(category_totals(cube, 'Categoria_Padre')[['Ingresos', 'Gastos', 'Cantidad']].to_string())
+
+
+if __name__ == "__main__":
+    main()
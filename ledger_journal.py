@@ -0,0 +1,164 @@
+import atexit
+import csv
+import io
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Journal append-only por empresa: <ledger>.journal.csv junto al CSV base, mismas columnas y sin encabezado
+JOURNAL_COLUMNS = ['Descripción', 'Tipo', 'Fecha', 'Monto', 'Empresa']
+
+# fsync agrupado: se sincroniza cada N escrituras o cada T segundos, lo que ocurra primero
+FSYNC_BATCH = int(os.environ.get("TRILEDGER_JOURNAL_FSYNC_BATCH", 16))
+FSYNC_INTERVAL = float(os.environ.get("TRILEDGER_JOURNAL_FSYNC_SECONDS", 1.0))
+
+# Escrituras pendientes de fsync por journal: ruta -> (cantidad, instante del último fsync)
+_pending = {}
+_pending_lock = threading.Lock()
+
+# Temporizador que sincroniza las escrituras pendientes una vez pasado FSYNC_INTERVAL (una escritura aislada
+# seguida de inactividad no espera a la próxima escritura ni al cierre del proceso)
+_flush_timer = None
+
+
+# Función para obtener la ruta del journal de un CSV
+def journal_path(path):
+    return os.path.splitext(path)[0] + ".journal.csv"
+
+
+# Función para obtener la ruta que toma el journal mientras se compacta en el CSV base
+def compacting_path(path):
+    return journal_path(path) + ".compacting"
+
+
+# Función para obtener el tamaño actual del journal (0 si no existe)
+def journal_size(path):
+    try:
+        return os.path.getsize(journal_path(path))
+    except OSError:
+        return 0
+
+
+# Bloqueo entre procesos y sesiones: exclusivo para escribir/compactar, compartido para leer
+@contextmanager
+def journal_lock(path, shared=False):
+    lock_file = os.path.splitext(path)[0] + ".journal.lock"
+    with open(lock_file, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        else:
+            # msvcrt solo ofrece bloqueos exclusivos
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# Función para formatear una transacción como línea CSV del journal
+def format_row(description, tipo, fecha, monto, empresa):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerow(
+        [description, tipo, fecha.strftime('%d/%m/%Y'), int(monto), empresa]
+    )
+    return buffer.getvalue()
+
+
+# Función para decidir si corresponde hacer fsync (debe llamarse con el journal abierto); si no, la escritura
+# queda a cargo del temporizador
+def _sync_due(path):
+    now = time.monotonic()
+    with _pending_lock:
+        count, last_sync = _pending.get(path, (0, now))
+        count += 1
+        if count >= FSYNC_BATCH or now - last_sync >= FSYNC_INTERVAL:
+            _pending[path] = (0, now)
+            return True
+        _pending[path] = (count, last_sync)
+        _schedule_flush_locked()
+        return False
+
+
+# Función para programar el fsync diferido (llamar con _pending_lock tomado)
+def _schedule_flush_locked():
+    global _flush_timer
+    if _flush_timer is not None:
+        return
+    _flush_timer = threading.Timer(FSYNC_INTERVAL, _timed_flush)
+    _flush_timer.daemon = True
+    _flush_timer.start()
+
+
+# Función que ejecuta el temporizador: sincroniza todo lo pendiente
+def _timed_flush():
+    global _flush_timer
+    with _pending_lock:
+        _flush_timer = None
+    flush_journals()
+
+
+# Función para agregar una transacción al final del journal (nunca reescribe el CSV base)
+def append_row(path, line):
+    with journal_lock(path):
+        with open(journal_path(path), 'a', encoding='utf-8', newline='') as f:
+            f.write(line)
+            f.flush()
+            if _sync_due(path):
+                os.fsync(f.fileno())
+    return journal_size(path)
+
+
+# Función para forzar el fsync de los journals con escrituras pendientes
+def flush_journals():
+    with _pending_lock:
+        pending = [path for path, (count, _) in _pending.items() if count > 0]
+        for path in pending:
+            _pending[path] = (0, time.monotonic())
+    for path in pending:
+        try:
+            with open(journal_path(path), 'rb') as f:
+                os.fsync(f.fileno())
+        except OSError:
+            pass
+
+
+atexit.register(flush_journals)
+
+
+# Función para leer las líneas completas del journal a partir de un offset (llamar con journal_lock)
+def read_tail(path, offset):
+    try:
+        with open(journal_path(path), 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return b'', offset
+    # Una línea a medio escribir queda para la próxima lectura
+    end = data.rfind(b'\n') + 1
+    return data[:end], offset + end
+
+
+# Función para apartar el journal antes de reemplazar el CSV base (llamar con journal_lock). Mientras exista
+# <journal>.compacting la compactación no terminó: ver ledger_store.recover_compaction.
+def begin_compaction(path):
+    os.replace(journal_path(path), compacting_path(path))
+
+
+# Función para descartar el journal apartado una vez que el CSV base ya lo incluye (llamar con journal_lock)
+def end_compaction(path):
+    try:
+        os.remove(compacting_path(path))
+    except FileNotFoundError:
+        pass
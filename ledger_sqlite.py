@@ -0,0 +1,257 @@
+# Backend SQLite opcional para los ledgers.
+#
+# Activación:
+#   python ledger_sqlite.py importar          # crea/actualiza triledger.db desde los CSV (+ journal)
+#   TRILEDGER_BACKEND=sqlite streamlit run app_v2.py
+#
+# Con el backend activo, los dashboards filtran y agregan con SQL en vez de cargar el ledger completo.
+import argparse
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from agregados import MEASURES
+from categorias import categorize_ledger
+from ledger_store import CSV_FILES, load_ledger
+
+BACKEND = os.environ.get("TRILEDGER_BACKEND", "csv")
+DB_PATH = os.environ.get("TRILEDGER_SQLITE_PATH", "triledger.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    Empresa TEXT NOT NULL,
+    Fecha TEXT NOT NULL,
+    Descripcion TEXT NOT NULL,
+    Tipo TEXT NOT NULL,
+    Monto INTEGER NOT NULL,
+    Categoria_Padre TEXT NOT NULL,
+    Categoria_Hijo TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_empresa_fecha
+    ON transactions (Empresa, Fecha);
+CREATE INDEX IF NOT EXISTS idx_transactions_empresa_categoria
+    ON transactions (Empresa, Categoria_Padre, Categoria_Hijo);
+"""
+
+# Una conexión por base de datos para todo el proceso: Streamlit ejecuta cada rerun en un hilo nuevo, así que una
+# conexión por hilo se abriría (con sus PRAGMA y el esquema) en cada interacción. Cada conexión tiene su lock.
+_connections = {}
+_connections_lock = threading.Lock()
+
+# Derivados calculados una vez por versión de los datos: (base, empresa, nombre) -> {'changes', 'version', 'value'}
+_derived = {}
+_derived_lock = threading.Lock()
+
+
+# Función para saber si los dashboards deben usar SQLite
+def sqlite_enabled():
+    return BACKEND == "sqlite" and os.path.exists(DB_PATH)
+
+
+# Función para abrir una conexión compartida; PRAGMA y esquema se aplican una sola vez, al crearla
+def _open_connection(db_path):
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    # WAL permite lectores concurrentes mientras se escribe
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return {'conn': conn, 'lock': threading.RLock()}
+
+
+# Función para usar la conexión del proceso a una base, con acceso exclusivo mientras dura el bloque
+@contextmanager
+def connection(db_path=None):
+    db_path = db_path or DB_PATH
+    with _connections_lock:
+        pooled = _connections.get(db_path)
+        if pooled is None:
+            pooled = _connections[db_path] = _open_connection(db_path)
+    with pooled['lock']:
+        yield pooled['conn']
+
+
+# Función para convertir una fecha a texto ISO (ordenable en SQLite)
+def _iso(value):
+    return pd.Timestamp(value).strftime('%Y-%m-%d')
+
+
+# Función para construir la cláusula WHERE común (empresa, rango de fechas, categorías y filas posteriores a un id);
+# company=None son todas
+def _where(company, start=None, end=None, padre=None, hijo=None, after_id=None):
+    clauses, params = [], []
+    if company is not None:
+        clauses.append("Empresa = ?")
+        params.append(company)
+    if after_id is not None:
+        clauses.append("id > ?")
+        params.append(after_id)
+    if start is not None:
+        clauses.append("Fecha >= ?")
+        params.append(_iso(start))
+    if end is not None:
+        clauses.append("Fecha <= ?")
+        params.append(_iso(end))
+    if padre is not None:
+        clauses.append("Categoria_Padre = ?")
+        params.append(padre)
+    if hijo is not None:
+        clauses.append("Categoria_Hijo = ?")
+        params.append(hijo)
+    return " AND ".join(clauses) or "1 = 1", params
+
+
+# Función para importar el ledger de una empresa (reemplaza sus filas)
+def import_company(company, df, db_path=None):
+    categorias = categorize_ledger(df)
+    rows = zip(
+        [company] * len(df),
+        df['Fecha'].dt.strftime('%Y-%m-%d'),
+        df['Descripción'].astype(str),
+        df['Tipo'].astype(str),
+        df['Monto'].astype('int64').tolist(),
+        categorias['Categoria_Padre'],
+        categorias['Categoria_Hijo']
+    )
+    with connection(db_path) as conn:
+        with conn:
+            conn.execute("DELETE FROM transactions WHERE Empresa = ?", (company,))
+            conn.executemany(
+                "INSERT INTO transactions (Empresa, Fecha, Descripcion, Tipo, Monto, Categoria_Padre, Categoria_Hijo) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        conn.execute("ANALYZE")
+
+
+# Función para importar los CSV existentes de las tres empresas
+def import_csvs(db_path=None):
+    imported = {}
+    for company, csv_file in CSV_FILES.items():
+        if os.path.exists(csv_file):
+            df = load_ledger(csv_file)
+            import_company(company, df, db_path)
+            imported[company] = len(df)
+    return imported
+
+
+# Función para insertar una transacción nueva
+def insert_transaction(company, description, tipo, fecha, monto, db_path=None):
+    row = pd.DataFrame({'Descripción': [description], 'Tipo': [tipo]})
+    categorias = categorize_ledger(row).iloc[0]
+    monto = abs(int(round(monto)))
+    with connection(db_path) as conn, conn:
+        conn.execute(
+            "INSERT INTO transactions (Empresa, Fecha, Descripcion, Tipo, Monto, Categoria_Padre, Categoria_Hijo) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (company, _iso(fecha), description, tipo, -monto if tipo == "Gasto" else monto,
+             categorias['Categoria_Padre'], categorias['Categoria_Hijo'])
+        )
+
+
+# Función para obtener la primera y última fecha de una empresa (None si no tiene datos)
+def date_bounds(company, db_path=None):
+    where, params = _where(company)
+    with connection(db_path) as conn:
+        row = conn.execute(f"SELECT MIN(Fecha), MAX(Fecha) FROM transactions WHERE {where}", params).fetchone()
+    if row[0] is None:
+        return None
+    return pd.Timestamp(row[0]), pd.Timestamp(row[1])
+
+
+# Función para obtener las transacciones filtradas (el filtro lo resuelve SQLite con los índices)
+def load_transactions(company, start=None, end=None, padre=None, hijo=None, db_path=None, after_id=None):
+    where, params = _where(company, start, end, padre, hijo, after_id)
+    with connection(db_path) as conn:
+        df = pd.read_sql_query(
+            "SELECT Descripcion AS \"Descripción\", Tipo, Fecha, Monto, Empresa, Categoria_Padre, Categoria_Hijo "
+            f"FROM transactions WHERE {where} ORDER BY Fecha, id",
+            conn, params=params
+        )
+    df['Fecha'] = pd.to_datetime(df['Fecha'], format='%Y-%m-%d')
+    df['Tipo'] = df['Tipo'].astype('category')
+    df['Empresa'] = df['Empresa'].astype('category')
+    return df
+
+
+# Función para obtener la versión de los datos de una empresa: cantidad de filas y último id (company=None son todas)
+def data_version(company, db_path=None):
+    where, params = _where(company)
+    with connection(db_path) as conn:
+        return tuple(conn.execute(f"SELECT COUNT(*), MAX(id) FROM transactions WHERE {where}", params).fetchone())
+
+
+# Función para obtener un dataset derivado del ledger de una empresa, calculado una vez por versión de los datos.
+# Si la base no cambió (contador de cambios de esta conexión y de las demás) no se consulta la tabla. Con
+# updater(valor, filas_nuevas), si desde la versión anterior solo se insertaron filas se actualiza con ellas; si hubo
+# borrados o una reimportación se recalcula.
+def load_derived(company, name, builder, updater=None, db_path=None):
+    key = (db_path or DB_PATH, company, name)
+    with _derived_lock:
+        cached = _derived.get(key)
+    with connection(db_path) as conn:
+        changes = (conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+        if cached is not None and cached['changes'] == changes:
+            return cached['value']
+        # Una sola transacción de lectura: la versión y las filas salen de la misma instantánea de la base
+        conn.execute("BEGIN")
+        try:
+            version = data_version(company, db_path)
+            df = new_rows = None
+            if cached is None or cached['version'] != version:
+                if cached is not None and updater is not None and cached['version'][1] is not None:
+                    new_rows = load_transactions(company, db_path=db_path, after_id=cached['version'][1])
+                    if cached['version'][0] + len(new_rows) != version[0]:
+                        new_rows = None
+                if new_rows is None:
+                    df = load_transactions(company, db_path=db_path)
+        finally:
+            conn.commit()
+    if df is not None:
+        value = builder(df)
+    elif new_rows is not None:
+        value = updater(cached['value'], new_rows)
+    else:
+        # Cambiaron otras empresas: el valor sigue vigente
+        value = cached['value']
+    with _derived_lock:
+        _derived[key] = {'changes': changes, 'version': version, 'value': value}
+    return value
+
+
+# Función para construir el cubo de agregados con un GROUP BY en SQLite (misma forma que agregados.build_cube)
+def build_cube(company, dims=(), db_path=None):
+    dims = tuple(dims)
+    where, params = _where(company)
+    dim_sql = "".join(f", {dim}" for dim in dims)
+    with connection(db_path) as conn:
+        daily = pd.read_sql_query(
+            f"SELECT Fecha{dim_sql}, "
+            "SUM(CASE WHEN Monto > 0 THEN Monto ELSE 0 END) AS Ingresos, "
+            "SUM(CASE WHEN Monto < 0 THEN -Monto ELSE 0 END) AS Gastos, "
+            "COUNT(*) AS Cantidad "
+            f"FROM transactions WHERE {where} GROUP BY Fecha{dim_sql} ORDER BY Fecha{dim_sql}",
+            conn, params=params
+        )
+    daily['Fecha'] = pd.to_datetime(daily['Fecha'], format='%Y-%m-%d')
+    daily = daily.set_index(['Fecha', *dims])[MEASURES]
+    total = daily.groupby(level='Fecha').sum() if dims else daily
+    return {'dims': dims, 'daily': daily, 'total': total}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend SQLite de Tri-Ledger")
+    parser.add_argument("comando", choices=["importar"])
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args()
+
+    if args.comando == "importar":
+        for company, rows in import_csvs(args.db).items():
+            print(f"{company}: {rows:,} transacciones importadas en {args.db}")
+
+
+if __name__ == "__main__":
+    main()
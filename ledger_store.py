@@ -0,0 +1,832 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import ledger_journal
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # Sin pyarrow se lee siempre el CSV
+    pa = None
+    feather = None
+
+# Archivos CSV por empresa
+CSV_FILES = {
+    "W TRAVEL CHILE": "w_travel_chile.csv",
+    "WOLF TRAVEL CHILE": "wolf_travel_chile.csv",
+    "HELPMETRAVEL SPA": "helpmetravel_spa.csv"
+}
+
+# Opción de vista consolidada y su clave en el caché
+ALL_COMPANIES = "Todas las empresas"
+CONSOLIDATED_KEY = "<consolidado>"
+
+# Presupuesto de memoria del caché de ledgers (bytes), compartido por todas las sesiones
+CACHE_MAX_BYTES = int(os.environ.get("TRILEDGER_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Caché LRU del proceso: ruta absoluta -> entrada con la versión del archivo y el DataFrame
+_cache = OrderedDict()
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+
+
+# Función para obtener la versión de un archivo (ruta, mtime, tamaño)
+def file_version(path):
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+# Tipos de columnas del ledger
+LEDGER_DTYPES = {
+    'Monto': 'int64',
+    'Tipo': 'category',
+    'Empresa': 'category'
+}
+
+
+# Tamaño del journal a partir del cual se compacta en el CSV base (bytes)
+COMPACT_BYTES = int(os.environ.get("TRILEDGER_JOURNAL_COMPACT_BYTES", 8 * 1024 * 1024))
+
+# CSV a partir de este tamaño se importan por bloques (memoria acotada al bloque, no al archivo)
+STREAM_BYTES = int(os.environ.get("TRILEDGER_STREAM_BYTES", 256 * 1024 * 1024))
+CHUNK_ROWS = int(os.environ.get("TRILEDGER_CHUNK_ROWS", 200_000))
+
+# Tipos de transacción válidos
+TIPOS = ['Gasto', 'Ingreso']
+
+
+# Función para leer y parsear un CSV de transacciones (ordenado por Fecha)
+def parse_ledger_csv(path):
+    df = pd.read_csv(path, dtype=LEDGER_DTYPES)
+    df['Fecha'] = pd.to_datetime(df['Fecha'], format='%d/%m/%Y')
+    return sort_by_date(df)
+
+
+# Función para parsear líneas del journal (sin encabezado) con los mismos tipos que el CSV
+def parse_journal_rows(data):
+    if not data:
+        return None
+    df = pd.read_csv(io.BytesIO(data), header=None, names=ledger_journal.JOURNAL_COLUMNS, dtype=LEDGER_DTYPES)
+    df['Fecha'] = pd.to_datetime(df['Fecha'], format='%d/%m/%Y')
+    return df
+
+
+# Función para concatenar un ledger con filas nuevas conservando los tipos de columna (concat de categorías
+# distintas da object)
+def _concat_rows(df, new_rows):
+    merged = pd.concat([df, new_rows], ignore_index=True)
+    for column, dtype in LEDGER_DTYPES.items():
+        if column in merged.columns and str(merged[column].dtype) != dtype:
+            merged[column] = merged[column].astype(dtype)
+    return merged
+
+
+# Función para unir el snapshot base con filas nuevas, manteniendo tipos y orden por Fecha
+def merge_rows(df, new_rows):
+    return sort_by_date(_concat_rows(df, new_rows))
+
+
+# Función para ordenar un ledger por Fecha (estable, para conservar el orden dentro de un día)
+def sort_by_date(df):
+    if df['Fecha'].is_monotonic_increasing:
+        return df
+    return df.sort_values('Fecha', kind='mergesort', ignore_index=True)
+
+
+# Función para recortar un ledger ordenado a un rango de fechas [start, end] con búsqueda binaria
+def date_slice(df, start, end):
+    fechas = df['Fecha'].to_numpy()
+    lo = fechas.searchsorted(pd.Timestamp(start).to_datetime64(), side='left')
+    hi = fechas.searchsorted((pd.Timestamp(end) + pd.Timedelta(days=1)).to_datetime64(), side='left')
+    return df.iloc[lo:hi]
+
+
+# Función para validar y tipar un bloque del CSV; devuelve el bloque limpio y la cantidad de filas descartadas
+def clean_chunk(chunk):
+    fecha = pd.to_datetime(chunk['Fecha'], format='%d/%m/%Y', errors='coerce')
+    monto = pd.to_numeric(chunk['Monto'], errors='coerce')
+    valid = (
+        fecha.notna() & monto.notna() & (monto % 1 == 0)
+        & chunk['Tipo'].isin(TIPOS) & chunk['Descripción'].notna() & chunk['Empresa'].notna()
+    )
+    clean = chunk.assign(Fecha=fecha, Monto=monto)[valid].astype({'Monto': 'int64'})
+    return clean, int(len(chunk) - valid.sum())
+
+
+# Función para leer un CSV por bloques validados, con tipos explícitos desde el parser
+def iter_ledger_chunks(path, chunksize=CHUNK_ROWS):
+    dtypes = {'Descripción': 'object', 'Tipo': 'category', 'Fecha': 'object', 'Empresa': 'category'}
+    with pd.read_csv(path, dtype=dtypes, chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield clean_chunk(chunk)
+
+
+# Función para obtener la ruta del sidecar columnar de un CSV
+def sidecar_path(path):
+    return os.path.splitext(path)[0] + ".feather"
+
+
+# Función para leer el sidecar si corresponde exactamente a la versión actual del CSV
+def _read_sidecar(path, version):
+    sidecar = sidecar_path(path)
+    if not os.path.exists(sidecar):
+        return None
+    try:
+        # memory_map evita copiar las columnas numéricas a memoria propia
+        table = feather.read_table(sidecar, memory_map=True)
+    except (OSError, pa.ArrowInvalid):
+        return None
+    metadata = table.schema.metadata or {}
+    source = (metadata.get(b'source_mtime_ns'), metadata.get(b'source_size'))
+    if source != (str(version[1]).encode(), str(version[2]).encode()):
+        return None
+    return table.to_pandas(split_blocks=True)
+
+
+# Función para (re)construir el sidecar a partir del CSV
+def _write_sidecar(path, version, df):
+    sidecar = sidecar_path(path)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        'source_mtime_ns': str(version[1]),
+        'source_size': str(version[2])
+    })
+    tmp_path = f"{sidecar}.{os.getpid()}.tmp"
+    try:
+        # Sin compresión para que la lectura pueda ser memory-mapped
+        feather.write_feather(table, tmp_path, compression='uncompressed')
+        os.replace(tmp_path, sidecar)
+    except OSError:
+        # Directorio de solo lectura: se sigue trabajando desde el CSV
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# Función para abrir el escritor IPC del sidecar con el esquema del primer bloque y la versión del CSV
+def _sidecar_writer(sink, table, version):
+    schema = table.schema.with_metadata({
+        **(table.schema.metadata or {}),
+        b'source_mtime_ns': str(version[1]).encode(),
+        b'source_size': str(version[2]).encode()
+    })
+    return pa.ipc.new_file(sink, schema, options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+
+
+# Función para reescribir ordenado por Fecha un sidecar cuyos bloques (cada uno ya ordenado) se solapan.
+# Merge externo: las fechas se reparten en tramos de ~chunksize filas según el histograma de todos los bloques y
+# cada tramo junta el rango contiguo que le corresponde en cada bloque (búsqueda binaria sobre el archivo
+# memory-mapped). La memoria queda acotada al tramo y el orden es estable (bloques en el orden del CSV).
+def _sort_sidecar(source, target, version, categories, chunksize):
+    with pa.memory_map(source) as mapped:
+        reader = pa.ipc.open_file(mapped)
+        runs = [reader.get_batch(i) for i in range(reader.num_record_batches)]
+        fechas = [run.column('Fecha').to_numpy() for run in runs]
+        histogram = pd.concat([
+            pd.Series(counts, index=days)
+            for days, counts in (np.unique(f, return_counts=True) for f in fechas)
+        ]).groupby(level=0).sum()
+        # Cada día va al tramo donde empieza; el límite de un tramo es el primer día del siguiente
+        tranche = (histogram.cumsum() - histogram).to_numpy() // chunksize
+        edges = [*histogram.index[1:][np.diff(tranche) > 0], None]
+
+        writer = None
+        lows = [0] * len(runs)
+        with pa.OSFile(target, 'wb') as sink:
+            for edge in edges:
+                pieces = []
+                for i, f in enumerate(fechas):
+                    high = len(f) if edge is None else int(f.searchsorted(edge.to_datetime64(), side='left'))
+                    if high > lows[i]:
+                        pieces.append(runs[i].slice(lows[i], high - lows[i]))
+                    lows[i] = high
+                chunk = pa.Table.from_batches(pieces).to_pandas().sort_values('Fecha', kind='mergesort', ignore_index=True)
+                for column, known in categories.items():
+                    chunk[column] = chunk[column].cat.set_categories(known)
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = _sidecar_writer(sink, table, version)
+                writer.write_table(table)
+            writer.close()
+
+
+# Función para construir el sidecar de un CSV por bloques, sin materializar el archivo completo.
+# Cada bloque se escribe como record batch del IPC; on_chunk(bloque) permite procesarlo (categorizar,
+# alimentar el cubo) mientras se escribe. Si el CSV no viene ordenado por Fecha, cada bloque se ordena y al
+# final el sidecar se reescribe una vez con un merge externo: las cargas lo leen ya ordenado.
+# Devuelve estadísticas de la importación.
+def stream_sidecar(path, version=None, chunksize=CHUNK_ROWS, on_chunk=None):
+    if version is None:
+        version = file_version(path)
+    sidecar = sidecar_path(path)
+    tmp_path = f"{sidecar}.{os.getpid()}.tmp"
+    runs_path = f"{sidecar}.{os.getpid()}.runs.tmp"
+    stats = {'rows': 0, 'rejected': 0, 'chunks': 0, 'sorted': True}
+    # Categorías acumuladas: cada bloque extiende las anteriores, así el IPC solo emite deltas de diccionario
+    categories = {'Tipo': [], 'Empresa': []}
+    last_fecha = None
+    writer = None
+    try:
+        with pa.OSFile(runs_path, 'wb') as sink:
+            for chunk, rejected in iter_ledger_chunks(path, chunksize):
+                stats['rejected'] += rejected
+                if chunk.empty:
+                    continue
+                for column, known in categories.items():
+                    known.extend(value for value in chunk[column].cat.categories if value not in known)
+                    chunk[column] = chunk[column].cat.set_categories(list(known))
+                fechas = chunk['Fecha']
+                if not fechas.is_monotonic_increasing or (last_fecha is not None and fechas.iloc[0] < last_fecha):
+                    stats['sorted'] = False
+                last_fecha = fechas.max() if stats['sorted'] else None
+
+                # Cada bloque queda ordenado: es una corrida del merge final
+                table = pa.Table.from_pandas(sort_by_date(chunk), preserve_index=False)
+                if writer is None:
+                    writer = _sidecar_writer(sink, table, version)
+                writer.write_table(table)
+                stats['rows'] += len(chunk)
+                stats['chunks'] += 1
+                if on_chunk is not None:
+                    on_chunk(chunk)
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            os.remove(runs_path)
+        elif stats['sorted']:
+            os.replace(runs_path, sidecar)
+        else:
+            _sort_sidecar(runs_path, tmp_path, version, categories, chunksize)
+            os.remove(runs_path)
+            os.replace(tmp_path, sidecar)
+    except BaseException:
+        for leftover in (runs_path, tmp_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+    return stats
+
+
+# Función para leer un ledger desde el sidecar columnar, reconstruyéndolo si el CSV cambió
+def read_ledger(path, version=None):
+    if feather is None:
+        return parse_ledger_csv(path)
+    if version is None:
+        version = file_version(path)
+    df = _read_sidecar(path, version)
+    if df is None and version[2] >= STREAM_BYTES:
+        # CSV grande: el sidecar se arma por bloques y luego se lee memory-mapped
+        try:
+            stream_sidecar(path, version)
+        except OSError:
+            pass
+        else:
+            df = _read_sidecar(path, version)
+    if df is None:
+        # El sidecar se guarda ya ordenado por Fecha, así el orden se calcula una sola vez
+        df = parse_ledger_csv(path)
+        _write_sidecar(path, version, df)
+    return sort_by_date(df)
+
+
+# Función para liberar entradas antiguas hasta respetar el presupuesto de memoria
+def _evict_locked(keep):
+    global _cache_bytes
+    while _cache_bytes > CACHE_MAX_BYTES and len(_cache) > 1:
+        key, entry = next(iter(_cache.items()))
+        if key == keep:
+            _cache.move_to_end(key)
+            continue
+        del _cache[key]
+        _cache_bytes -= entry['bytes']
+
+
+# Función para registrar una entrada en el caché LRU
+def _store_entry(key, entry):
+    global _cache_bytes
+    with _cache_lock:
+        old = _cache.pop(key, None)
+        if old is not None:
+            _cache_bytes -= old['bytes']
+        _cache[key] = entry
+        _cache_bytes += entry['bytes']
+        _evict_locked(key)
+
+
+# Función para crear una entrada de caché (nbytes: tamaño ya conocido, para no recorrer los textos)
+def _new_entry(version, journal_offset, df, derived=None, updaters=None, nbytes=None):
+    return {
+        'version': version,
+        'journal': journal_offset,
+        'df': df,
+        'bytes': int(df.memory_usage(deep=True).sum()) if nbytes is None else nbytes,
+        'derived': derived if derived is not None else {},
+        'updaters': updaters if updaters is not None else {}
+    }
+
+
+# Función para actualizar con filas nuevas los derivados incrementales de una entrada (los demás se descartan)
+def _update_derived(entry, new_rows):
+    derived = {}
+    for name, value in list(entry['derived'].items()):
+        updater = entry['updaters'].get(name)
+        if updater is not None:
+            derived[name] = updater(value, new_rows)
+    return derived
+
+
+# Función para extender una entrada con la cola del journal, actualizando los derivados incrementales
+def _extend_entry(entry, new_rows, journal_offset):
+    derived = _update_derived(entry, new_rows)
+    df = merge_rows(entry['df'], new_rows)
+    return _new_entry(entry['version'], journal_offset, df, derived, dict(entry['updaters']))
+
+
+# Función para refrescar la entrada de un ledger (llamar con journal_lock tomado)
+def _refresh_entry(path):
+    version = file_version(path)
+    key = version[0]
+    size = ledger_journal.journal_size(path)
+
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry['version'] == version and entry['journal'] == size:
+            _cache.move_to_end(key)
+            return entry
+
+    if entry is not None and entry['version'] == version and entry['journal'] < size:
+        # Solo se leen las líneas nuevas del journal, no el CSV completo
+        data, offset = ledger_journal.read_tail(path, entry['journal'])
+        new_rows = parse_journal_rows(data)
+        if new_rows is None:
+            return entry
+        entry = _extend_entry(entry, new_rows, offset)
+    else:
+        df = read_ledger(path, version)
+        data, offset = ledger_journal.read_tail(path, 0)
+        new_rows = parse_journal_rows(data)
+        if new_rows is not None:
+            df = merge_rows(df, new_rows)
+        entry = _new_entry(version, offset, df)
+
+    _store_entry(key, entry)
+    return entry
+
+
+# Función para obtener la entrada de caché de un ledger: base (CSV/sidecar) + cola del journal. El ledger de una
+# empresa es su partición del consolidado.
+def _load_entry(path):
+    company = _company_of(path)
+    if company is not None:
+        return load_company_entry(company)
+    if _compaction_pending(path):
+        with ledger_journal.journal_lock(path):
+            recover_compaction(path)
+    with ledger_journal.journal_lock(path, shared=True):
+        return _refresh_entry(path)
+
+
+# Función para cargar un ledger desde el caché
+def load_ledger(path):
+    return _load_entry(path)['df'].copy(deep=False)
+
+
+# Función para obtener un dataset derivado del ledger, calculado una vez por versión del archivo.
+# Si se indica updater(valor, filas_nuevas), el derivado se actualiza con las filas del journal en vez de recalcularse.
+def load_derived(path, name, builder, updater=None):
+    return entry_derived(_load_entry(path), name, builder, updater)
+
+
+# Función para obtener (o calcular una vez) un dataset derivado de una entrada de caché ya cargada
+def entry_derived(entry, name, builder, updater=None):
+    derived = entry['derived']
+    if name not in derived:
+        # Si dos sesiones lo calculan a la vez, ambas obtienen el mismo resultado
+        derived[name] = builder(entry['df'].copy(deep=False))
+        if updater is not None:
+            entry['updaters'][name] = updater
+    return derived[name]
+
+
+# Función para cargar los datos de una empresa (None si no hay archivo)
+def load_company_ledger(company):
+    entry = load_company_entry(company)
+    return None if entry is None else entry['df'].copy(deep=False)
+
+
+# Función para obtener la entrada de caché del ledger de una empresa: su partición del ledger consolidado
+# (None si no hay archivo)
+def load_company_entry(company):
+    consolidated = load_consolidated()
+    if consolidated is None:
+        return None
+    return consolidated['entries'].get(company)
+
+
+# Función para obtener un dataset derivado del ledger de una empresa (None si no hay archivo)
+def load_company_derived(company, name, builder, updater=None):
+    entry = load_company_entry(company)
+    if entry is None:
+        return None
+    return entry_derived(entry, name, builder, updater)
+
+
+# Función para obtener las filas que df agrega a base (multiconjunto por hash de fila), en el orden de df.
+# None si a df le faltan filas de base: el ledger se reescribió con otro contenido y no es una extensión.
+def _added_rows(base, df):
+    base_hashes = pd.util.hash_pandas_object(base[ledger_journal.JOURNAL_COLUMNS], index=False).to_numpy()
+    hashes = pd.util.hash_pandas_object(df[ledger_journal.JOURNAL_COLUMNS], index=False).to_numpy()
+    known, counts = np.unique(base_hashes, return_counts=True)
+    position = np.minimum(np.searchsorted(known, hashes), max(len(known) - 1, 0))
+    seen = np.where(known[position] == hashes, counts[position], 0) if len(known) else np.zeros(len(hashes), 'int64')
+    # Las primeras apariciones de cada fila son las que ya estaban en base
+    added = pd.Series(hashes).groupby(hashes).cumcount().to_numpy() >= seen
+    if len(df) - int(added.sum()) != len(base):
+        return None
+    return df[added].reset_index(drop=True)
+
+
+# Función para publicar en la entrada vigente de una empresa un derivado calculado fuera del refresco sobre entry
+# (la re-categorización masiva, que puede durar minutos). Si entretanto llegaron filas, el valor se pone al día con
+# updater sobre las filas agregadas. Se publica con _consolidated_lock tomado, el mismo del refresco: ninguna
+# extensión puede dejarlo en una entrada ya reemplazada. Devuelve la entrada donde quedó (None si el ledger se
+# reescribió con otro contenido y el valor ya no corresponde).
+def publish_company_derived(company, entry, name, value, updater):
+    while True:
+        current = load_company_entry(company)
+        if current is None:
+            return None
+        if current['df'] is not entry['df']:
+            new_rows = _added_rows(entry['df'], current['df'])
+            if new_rows is None:
+                return None
+            if len(new_rows):
+                value = updater(value, new_rows)
+        entry = current
+        with _consolidated_lock:
+            with _cache_lock:
+                consolidated = _cache.get(CONSOLIDATED_KEY)
+            if consolidated is not None and consolidated['entries'].get(company) is current:
+                # Si una página ya lo calculó para esta versión, se conserva el suyo
+                current['derived'].setdefault(name, value)
+                current['updaters'][name] = updater
+                return current
+
+
+# Ledger consolidado: un solo DataFrame con un bloque contiguo por empresa (en el orden de CSV_FILES), cada bloque
+# ordenado por Fecha. La partición de una empresa es una vista de su bloque y su entrada de caché apunta a esa
+# vista: los datos están una sola vez en memoria. Las filas nuevas del journal se insertan en el bloque de su
+# empresa y los derivados con updater se actualizan; el frame solo se rearma si cambia el CSV de alguna empresa.
+_consolidated_lock = threading.Lock()
+
+
+# Función para obtener la empresa de un CSV (None si el ledger no es de una empresa)
+def _company_of(path):
+    path = os.path.abspath(path)
+    for company, csv_file in CSV_FILES.items():
+        if os.path.abspath(csv_file) == path:
+            return company
+    return None
+
+
+# Función para leer lo nuevo de una empresa respecto de su entrada anterior (llamar con journal_lock tomado).
+# Devuelve (versión del CSV, offset del journal, ledger completo si hubo que releer el CSV, filas nuevas del journal).
+def _read_company(path, entry):
+    version = file_version(path)
+    size = ledger_journal.journal_size(path)
+    if entry is not None and entry['version'] == version and entry['journal'] <= size:
+        if entry['journal'] == size:
+            return version, size, None, None
+        # Solo se leen las líneas nuevas del journal, no el CSV completo
+        data, offset = ledger_journal.read_tail(path, entry['journal'])
+        return version, offset, None, parse_journal_rows(data)
+    df = read_ledger(path, version)
+    data, offset = ledger_journal.read_tail(path, 0)
+    new_rows = parse_journal_rows(data)
+    if new_rows is not None:
+        df = merge_rows(df, new_rows)
+    return version, offset, df, None
+
+
+# Función para fijar la empresa de las filas según la clave (no el texto del CSV), como categoría con todas las empresas
+def _with_company(df, company, companies):
+    codes = np.full(len(df), companies.index(company), dtype='int8')
+    return df.assign(Empresa=pd.Categorical.from_codes(codes, categories=companies))
+
+
+# Función para obtener la partición de una empresa: vista de su bloque en el consolidado, con índice desde 0
+def _partition(df, start, stop):
+    partition = df.iloc[start:stop]
+    partition.index = pd.RangeIndex(stop - start)
+    return partition
+
+
+# Función para re-apuntar a la partición nueva un derivado fila a fila (el ledger con columnas agregadas): si
+# compartiera arreglos con la partición anterior, mantendría vivo el consolidado anterior
+def _rebase(value, old, new):
+    if new is old or not isinstance(value, pd.DataFrame) or len(value) != len(old):
+        return value
+    if list(value.columns[:len(old.columns)]) != list(old.columns):
+        return value
+    if not np.may_share_memory(value['Monto'].to_numpy(), old['Monto'].to_numpy()):
+        return value
+    return new.assign(**{column: value[column] for column in value.columns[len(old.columns):]})
+
+
+# Función para la entrada de una empresa sobre su partición nueva. Sin filas nuevas conserva todos sus derivados;
+# con filas nuevas, los que tienen updater. Sus bytes se cuentan en la entrada consolidada.
+def _company_entry(entry, version, offset, partition, new_rows):
+    if entry is None:
+        return _new_entry(version, offset, partition, nbytes=0)
+    if new_rows is None:
+        derived = {name: _rebase(value, entry['df'], partition) for name, value in list(entry['derived'].items())}
+    else:
+        derived = _update_derived(entry, new_rows)
+    return _new_entry(version, offset, partition, derived, dict(entry['updaters']), nbytes=0)
+
+
+# Función para crear la entrada consolidada: 'partitions' da el ledger de cada empresa en O(1), 'entries' su
+# entrada de caché y 'bounds' las filas de su bloque
+def _consolidated_entry(df, entries, bounds, derived=None, updaters=None, nbytes=None):
+    version = tuple((company, entry['version'], entry['journal']) for company, entry in entries.items())
+    entry = _new_entry(version, None, df, derived, updaters, nbytes)
+    entry['entries'] = entries
+    entry['partitions'] = {company: company_entry['df'] for company, company_entry in entries.items()}
+    entry['bounds'] = bounds
+    return entry
+
+
+# Función para armar el ledger consolidado desde el ledger de cada empresa. Las empresas cuyo CSV no cambió
+# parten de su partición anterior y conservan sus derivados.
+def _build_consolidated(entry, reads):
+    companies = list(reads)
+    previous = {} if entry is None else entry['entries']
+    frames = {}
+    for company, (_, _, df, new_rows) in reads.items():
+        if df is None:
+            df = previous[company]['df']
+            if new_rows is not None:
+                df = merge_rows(df, new_rows)
+        frames[company] = df
+    lengths = [len(frame) for frame in frames.values()]
+    df = pd.concat(frames.values(), ignore_index=True)
+    # La empresa se toma de la clave (no del texto del CSV) y se codifica como categoría con todas las empresas
+    df['Empresa'] = pd.Categorical.from_codes(
+        np.repeat(np.arange(len(companies), dtype='int8'), lengths), categories=companies
+    )
+    df['Tipo'] = df['Tipo'].astype('category')
+
+    stops = np.cumsum(lengths)
+    bounds = {company: (int(stop - length), int(stop)) for company, stop, length in zip(companies, stops, lengths)}
+    entries = {
+        company: _company_entry(
+            None if base is not None else previous.get(company), version, offset, _partition(df, *bounds[company]), new_rows
+        )
+        for company, (version, offset, base, new_rows) in reads.items()
+    }
+    return _consolidated_entry(df, entries, bounds)
+
+
+# Función para insertar las filas nuevas del journal en el bloque de su empresa, después de las de su misma fecha
+# (el orden de merge_rows sobre la partición). El frame se copia una vez, sin reordenarlo ni releer los CSV.
+def _extend_consolidated(entry, reads, tails):
+    df = entry['df']
+    companies = list(df['Empresa'].cat.categories)
+    fechas = df['Fecha'].to_numpy()
+    pieces, positions, bounds, shift = {}, [], {}, 0
+    for company, (start, stop) in entry['bounds'].items():
+        added = 0
+        if company in tails:
+            rows = _with_company(sort_by_date(tails[company]), company, companies)
+            positions.append(start + fechas[start:stop].searchsorted(rows['Fecha'].to_numpy(), side='right'))
+            pieces[company] = rows
+            added = len(rows)
+        bounds[company] = (start + shift, stop + shift + added)
+        shift += added
+
+    if pieces:
+        new_rows = pd.concat(pieces.values(), ignore_index=True)
+        merged = _concat_rows(df, new_rows)
+        order = np.insert(np.arange(len(df)), np.concatenate(positions), np.arange(len(df), len(merged)))
+        df = merged.take(order)
+        df.index = pd.RangeIndex(len(df))
+        derived = _update_derived(entry, new_rows)
+        nbytes = entry['bytes'] + int(new_rows.memory_usage(deep=True).sum())
+    else:
+        derived, nbytes = dict(entry['derived']), entry['bytes']
+
+    entries = {}
+    for company, previous in entry['entries'].items():
+        version, offset, _, _ = reads[company]
+        partition = _partition(df, *bounds[company]) if pieces else previous['df']
+        entries[company] = _company_entry(previous, version, offset, partition, pieces.get(company))
+    return _consolidated_entry(df, entries, bounds, derived, dict(entry['updaters']), nbytes)
+
+
+# Función para refrescar el ledger consolidado (llamar con _consolidated_lock tomado). Con locked, quien llama ya
+# tiene el journal_lock de las empresas de paths: solo se leen esas y las demás quedan como estaban.
+def _refresh_consolidated(paths, locked=False):
+    with _cache_lock:
+        entry = _cache.get(CONSOLIDATED_KEY)
+    previous = {} if entry is None else entry['entries']
+    if locked:
+        if not all(company in previous for company in paths):
+            return None
+        reads = {company: (e['version'], e['journal'], None, None) for company, e in previous.items()}
+        for company, csv_file in paths.items():
+            reads[company] = _read_company(csv_file, previous[company])
+    else:
+        reads = {}
+        for company, csv_file in paths.items():
+            with ledger_journal.journal_lock(csv_file, shared=True):
+                reads[company] = _read_company(csv_file, previous.get(company))
+
+    if entry is not None and list(reads) == list(previous) and all(read[2] is None for read in reads.values()):
+        if all(previous[company]['journal'] == offset for company, (_, offset, _, _) in reads.items()):
+            with _cache_lock:
+                if _cache.get(CONSOLIDATED_KEY) is entry:
+                    _cache.move_to_end(CONSOLIDATED_KEY)
+            return entry
+        tails = {company: read[3] for company, read in reads.items() if read[3] is not None}
+        entry = _extend_consolidated(entry, reads, tails)
+    else:
+        entry = _build_consolidated(entry, reads)
+    _store_entry(CONSOLIDATED_KEY, entry)
+    return entry
+
+
+# Función para cargar el ledger consolidado de todas las empresas, compartido por todas las sesiones.
+# Devuelve None si no existe ningún CSV.
+def load_consolidated():
+    paths = {company: csv_file for company, csv_file in CSV_FILES.items() if os.path.exists(csv_file)}
+    if not paths:
+        return None
+    for csv_file in paths.values():
+        if _compaction_pending(csv_file):
+            with ledger_journal.journal_lock(csv_file):
+                recover_compaction(csv_file)
+    with _consolidated_lock:
+        return _refresh_consolidated(paths)
+
+
+# Función para obtener un dataset derivado del ledger consolidado, calculado una vez por versión (None sin datos)
+def load_consolidated_derived(name, builder):
+    entry = load_consolidated()
+    if entry is None:
+        return None
+    return entry_derived(entry, name, builder)
+
+
+# Función para obtener la ruta temporal del CSV compactado (fija, para poder retomarla tras una caída)
+def _compaction_tmp_path(path):
+    return f"{path}.compacting.tmp"
+
+
+# Función para terminar o descartar una compactación interrumpida (llamar con journal_lock exclusivo).
+# Con el journal apartado y el CSV temporal completo, falta el reemplazo; con el journal apartado y sin temporal,
+# el CSV ya lo incluye; con solo el temporal, el journal sigue vigente y el temporal se descarta.
+def recover_compaction(path):
+    tmp_path = _compaction_tmp_path(path)
+    if os.path.exists(ledger_journal.compacting_path(path)):
+        if os.path.exists(tmp_path):
+            os.replace(tmp_path, path)
+        ledger_journal.end_compaction(path)
+    elif os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+
+# Función para saber si quedó una compactación a medias
+def _compaction_pending(path):
+    return os.path.exists(ledger_journal.compacting_path(path)) or os.path.exists(_compaction_tmp_path(path))
+
+
+# Función para reescribir el CSV con el ledger completo y vaciar el journal (llamar con journal_lock exclusivo).
+# Es idempotente: el journal se aparta antes del reemplazo y se borra después, así una caída en cualquier punto no
+# duplica transacciones. Devuelve la nueva versión del CSV.
+def _rewrite_ledger(path, df):
+    tmp_path = _compaction_tmp_path(path)
+    df.to_csv(tmp_path, index=False, date_format='%d/%m/%Y')
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    ledger_journal.begin_compaction(path)
+    os.replace(tmp_path, path)
+    ledger_journal.end_compaction(path)
+    version = file_version(path)
+    if feather is not None:
+        _write_sidecar(path, version, df)
+    return version
+
+
+# Función para compactar el journal en el CSV base (reescritura atómica) y vaciarlo. El contenido no cambia: se
+# reutilizan DataFrame y derivados con la nueva versión del CSV.
+def compact_ledger(path):
+    company = _company_of(path)
+    if company is None:
+        with ledger_journal.journal_lock(path):
+            recover_compaction(path)
+            entry = _refresh_entry(path)
+            if entry['journal'] == 0:
+                return
+            version = _rewrite_ledger(path, entry['df'])
+            _store_entry(version[0], _new_entry(version, 0, entry['df'], dict(entry['derived']), dict(entry['updaters'])))
+        return
+
+    # Mismo orden de bloqueo que load_consolidated (consolidado y luego journal); solo se lee esta empresa, así no
+    # se toma el journal_lock de otra mientras se tiene este
+    with _consolidated_lock, ledger_journal.journal_lock(path):
+        recover_compaction(path)
+        consolidated = _refresh_consolidated({company: path}, locked=True)
+        if consolidated is None:
+            # Sin consolidado en memoria se compacta desde el CSV y el journal
+            _, offset, df, _ = _read_company(path, None)
+            if offset:
+                _rewrite_ledger(path, df)
+            return
+        entry = consolidated['entries'][company]
+        if entry['journal'] == 0:
+            return
+        version = _rewrite_ledger(path, entry['df'])
+        entries = {
+            **consolidated['entries'],
+            company: _new_entry(version, 0, entry['df'], dict(entry['derived']), dict(entry['updaters']), nbytes=0)
+        }
+        _store_entry(CONSOLIDATED_KEY, _consolidated_entry(
+            consolidated['df'], entries, consolidated['bounds'], dict(consolidated['derived']),
+            dict(consolidated['updaters']), consolidated['bytes']
+        ))
+
+
+_compacting = set()
+_compacting_lock = threading.Lock()
+
+
+# Función para compactar en segundo plano, una sola vez a la vez por ledger
+def _schedule_compaction(path):
+    with _compacting_lock:
+        if path in _compacting:
+            return
+        _compacting.add(path)
+
+    def run():
+        try:
+            compact_ledger(path)
+        finally:
+            with _compacting_lock:
+                _compacting.discard(path)
+
+    threading.Thread(target=run, name=f"compact-{os.path.basename(path)}", daemon=True).start()
+
+
+# Función para agregar una transacción al journal de un ledger (el CSV base no se reescribe)
+def append_transaction(path, description, tipo, fecha, monto, empresa):
+    line = ledger_journal.format_row(description, tipo, fecha, monto, empresa)
+    size = ledger_journal.append_row(path, line)
+    if size >= COMPACT_BYTES:
+        _schedule_compaction(path)
+
+
+# Función para registrar una transacción de una empresa; el signo del monto lo define el tipo
+def append_company_transaction(company, description, tipo, fecha, monto):
+    csv_file = CSV_FILES.get(company)
+    if not csv_file or not os.path.exists(csv_file):
+        return False
+    # Montos en pesos chilenos: sin decimales
+    monto = abs(int(round(monto)))
+    append_transaction(csv_file, description, tipo, fecha, -monto if tipo == "Gasto" else monto, company)
+    return True
+
+
+# Función para obtener los DataFrames del caché compartido, con sus derivados tabulares y los de cada empresa del
+# consolidado (para el reporte de memoria)
+def cached_frames():
+    with _cache_lock:
+        return {
+            key: [
+                entry['df'],
+                *[
+                    value
+                    for owner in [entry, *entry.get('entries', {}).values()]
+                    for value in owner['derived'].values() if isinstance(value, pd.DataFrame)
+                ]
+            ]
+            for key, entry in _cache.items()
+        }
+
+
+# Función para obtener los bytes de cada entrada del caché compartido
+def cached_bytes():
+    with _cache_lock:
+        return {key: entry['bytes'] for key, entry in _cache.items()}
+
+
+# Función para vaciar el caché (útil tras reemplazar archivos manualmente)
+def clear_cache():
+    global _cache_bytes
+    with _cache_lock:
+        _cache.clear()
+        _cache_bytes = 0
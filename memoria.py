@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+import ledger_store
+from rendimiento import admin_enabled
+
+# Reporte de memoria por sesión. Con copy-on-write las sesiones referencian los mismos arreglos que el
+# caché de ledgers; una sesión solo paga memoria propia por las columnas que modifica o recalcula.
+
+# Segundos sin actividad tras los cuales una sesión deja de aparecer en el reporte
+SESSION_TTL = int(os.environ.get("TRILEDGER_SESSION_TTL_SECONDS", 30 * 60))
+
+# Registro de sesiones: id de sesión -> medición de la última ejecución
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+# Función para obtener los arreglos de datos de un DataFrame (códigos en las columnas categóricas)
+def _arrays(df):
+    arrays = []
+    for _, column in df.items():
+        values = column.array
+        arrays.append(values.codes if isinstance(values, pd.Categorical) else np.asarray(values))
+    return arrays
+
+
+# Función para obtener el id de la sesión actual ("local" fuera de un servidor Streamlit)
+def _session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "local"
+
+
+# Función para medir qué parte de los DataFrames de una sesión es propia y cuál se comparte con el caché
+def measure_frames(frames):
+    cached = [
+        (key, array)
+        for key, frames in ledger_store.cached_frames().items()
+        for df in frames
+        for array in _arrays(df)
+    ]
+    owned = shared = 0
+    references = set()
+    seen = set()
+    for df in frames.values():
+        if df is None:
+            continue
+        for array in _arrays(df):
+            # Un mismo arreglo puede aparecer en varios DataFrames de la sesión (p. ej. un recorte por fechas)
+            identity = (array.__array_interface__['data'][0], array.nbytes)
+            if identity in seen:
+                continue
+            seen.add(identity)
+            owners = {key for key, other in cached if other.dtype == array.dtype and np.may_share_memory(array, other)}
+            if owners:
+                shared += array.nbytes
+                references |= owners
+            else:
+                owned += array.nbytes
+    return {'owned': owned, 'shared': shared, 'references': references}
+
+
+# Función para registrar los DataFrames que usó la sesión actual en esta ejecución
+def register_session(frames):
+    measurement = measure_frames(frames)
+    measurement['updated'] = time.time()
+    now = measurement['updated']
+    with _sessions_lock:
+        _sessions[_session_id()] = measurement
+        for session_id in [sid for sid, m in _sessions.items() if now - m['updated'] > SESSION_TTL]:
+            del _sessions[session_id]
+
+
+# Función para armar el reporte por sesión y por ledger compartido (cantidad de sesiones que lo referencian)
+def memory_report():
+    with _sessions_lock:
+        sessions = dict(_sessions)
+    current = _session_id()
+
+    by_session = pd.DataFrame([
+        {
+            'Sesión': ("▶ " if session_id == current else "") + session_id[:8],
+            'Bytes propios': m['owned'],
+            'Bytes compartidos': m['shared'],
+            'Actualizado': time.strftime('%H:%M:%S', time.localtime(m['updated']))
+        }
+        for session_id, m in sessions.items()
+    ])
+
+    by_ledger = pd.DataFrame([
+        {
+            'Ledger': os.path.basename(key),
+            'Bytes': nbytes,
+            'Sesiones': sum(key in m['references'] for m in sessions.values())
+        }
+        for key, nbytes in ledger_store.cached_bytes().items()
+    ])
+    return by_session, by_ledger
+
+
+# Función para mostrar el reporte de memoria en un expander (solo en modo administración: lista las sesiones)
+def render_memory_report():
+    if not admin_enabled():
+        return
+    by_session, by_ledger = memory_report()
+    with st.expander("🧠 Memoria por sesión", expanded=False):
+        if by_ledger.empty:
+            st.caption("El caché de ledgers está vacío.")
+        else:
+            st.caption(f"Caché compartido: {by_ledger['Bytes'].sum() / 1024 ** 2:,.2f} MB")
+            st.dataframe(by_ledger, hide_index=True, use_container_width=True)
+        if not by_session.empty:
+            st.caption(f"Memoria propia de las sesiones: {by_session['Bytes propios'].sum() / 1024 ** 2:,.2f} MB")
+            st.dataframe(by_session, hide_index=True, use_container_width=True)
@@ -0,0 +1,238 @@
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import streamlit as st
+
+from agregados import monthly_totals
+from graficos import cached_figure
+
+# Pronóstico de flujo de caja sobre los totales mensuales del cubo de agregados.
+# Todas las series (el total y cada empresa o categoría padre, ingresos y gastos por separado) se ajustan juntas:
+# cada modelo opera sobre una matriz series x meses con NumPy, sin bucles por serie. Se calcula una vez por
+# versión del ledger (un nodo de derivados.py) para el horizonte máximo; la página recorta el horizonte elegido.
+
+# Meses a pronosticar como máximo (la página permite elegir de 3 a este valor)
+FORECAST_MAX_MONTHS = int(os.environ.get("TRILEDGER_FORECAST_MONTHS", 12))
+
+# Largo de la estacionalidad (meses)
+SEASON = 12
+
+# Modelos disponibles: clave -> nombre que muestra la página
+MODELS = {
+    'holt_winters': 'Holt-Winters',
+    'estacional': 'Estacional ingenuo',
+    'tendencia': 'Tendencia lineal'
+}
+
+# Grilla de parámetros de suavizado de Holt-Winters (nivel, tendencia, estacionalidad); cada serie usa la
+# combinación con menor error de ajuste
+HW_ALPHAS = (0.2, 0.5, 0.8)
+HW_BETAS = (0.05, 0.2)
+HW_GAMMAS = (0.1, 0.3)
+
+# Medidas pronosticadas (ingresos y gastos van en valor absoluto; el neto y el saldo se derivan de ellas)
+MEASURES = ['Ingresos', 'Gastos']
+
+# Etiqueta de la serie combinada
+TOTAL_LABEL = 'Total'
+
+
+# Función para el pronóstico estacional ingenuo: cada mes repite el mismo mes del año anterior
+# (sin un año completo de historia, repite el último mes)
+def seasonal_naive(values, horizon, season=SEASON):
+    n = values.shape[1]
+    steps = np.arange(horizon)
+    if n >= season:
+        return values[:, n - season + steps % season]
+    return np.repeat(values[:, -1:], horizon, axis=1)
+
+
+# Función para el pronóstico de tendencia lineal: recta de mínimos cuadrados por serie (forma cerrada)
+def linear_trend(values, horizon):
+    n = values.shape[1]
+    t = np.arange(n, dtype='float64')
+    t_centered = t - t.mean()
+    means = values.mean(axis=1, keepdims=True)
+    denominator = (t_centered ** 2).sum()
+    slope = ((values - means) * t_centered).sum(axis=1, keepdims=True) / denominator if denominator else np.zeros_like(means)
+    future = np.arange(n, n + horizon, dtype='float64') - t.mean()
+    return means + slope * future
+
+
+# Función para el pronóstico de Holt-Winters aditivo. Se ajustan todas las series con todas las combinaciones de la
+# grilla a la vez (arreglos series x combinaciones) y cada serie se queda con la de menor error cuadrático.
+# Con menos de un año de historia no hay componente estacional (Holt lineal).
+def holt_winters(values, horizon, season=SEASON):
+    n = values.shape[1]
+    if n < season:
+        season = 1
+    gammas = HW_GAMMAS if season > 1 else (0.0,)
+    grid = np.array([(a, b, g) for a in HW_ALPHAS for b in HW_BETAS for g in gammas])
+    alpha, beta, gamma = (grid[:, i][None, :] for i in range(3))
+
+    # Estado inicial a partir de la primera temporada (y la segunda, si la hay, para la tendencia)
+    first = values[:, :season]
+    first_mean = first.mean(axis=1, keepdims=True)
+    if n >= 2 * season:
+        trend = (values[:, season:2 * season].mean(axis=1, keepdims=True) - first_mean) / season
+    elif season == 1 and n > 1:
+        trend = values[:, 1:2] - values[:, :1]
+    else:
+        trend = np.zeros((len(values), 1))
+    # La estacionalidad inicial es la primera temporada sin su tendencia; el nivel queda en su último mes
+    offsets = np.arange(season) - (season - 1) / 2
+    seasonal = np.repeat((first - first_mean - trend * offsets)[:, None, :], len(grid), axis=1)
+    level = np.repeat(first_mean + trend * offsets[-1], len(grid), axis=1)
+    trend = np.repeat(trend, len(grid), axis=1)
+
+    sse = np.zeros_like(level)
+    for t in range(season, n):
+        y = values[:, t:t + 1]
+        s = seasonal[:, :, t % season]
+        error = y - (level + trend + s)
+        sse += error ** 2
+        new_level = alpha * (y - s) + (1 - alpha) * (level + trend)
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        seasonal[:, :, t % season] = gamma * (y - new_level) + (1 - gamma) * s
+        level = new_level
+
+    best = sse.argmin(axis=1)
+    rows = np.arange(len(values))
+    level, trend, seasonal = level[rows, best], trend[rows, best], seasonal[rows, best]
+    steps = np.arange(1, horizon + 1)
+    return level[:, None] + trend[:, None] * steps + seasonal[:, (n + steps - 1) % season]
+
+
+# Función para armar la matriz de totales mensuales: etiquetas, meses y arreglo series x meses x medidas.
+# Con dim, además del total hay una serie por valor de la dimensión (empresa o categoría padre).
+def monthly_matrix(cube, dim=None):
+    total = monthly_totals(cube)
+    months = pd.period_range(total.index.min(), total.index.max(), freq='M')
+    frames = {TOTAL_LABEL: total}
+    if dim is not None:
+        by_dim = monthly_totals(cube, dim=dim)
+        for label in by_dim.index.get_level_values(dim).unique():
+            frames[label] = by_dim.xs(label, level=dim)
+    values = np.stack([frame[MEASURES].reindex(months, fill_value=0).to_numpy(dtype='float64') for frame in frames.values()])
+    return list(frames), months, values
+
+
+# Función para calcular los pronósticos de todas las series con los tres modelos, para el horizonte máximo.
+# El último mes se deja fuera del ajuste si está incompleto (el ledger termina antes de fin de mes): se pronostica.
+def build_forecast(cube, dim=None, horizon=FORECAST_MAX_MONTHS):
+    if cube['total'].empty:
+        return None
+    labels, months, values = monthly_matrix(cube, dim)
+    last_day = cube['total'].index.max()
+    if last_day < months[-1].end_time.normalize() and len(months) > 1:
+        months, values = months[:-1], values[:, :-1]
+
+    # Todas las series y medidas en una sola matriz (series * medidas) x meses
+    series = values.transpose(0, 2, 1).reshape(-1, len(months))
+    forecasts = {
+        'holt_winters': holt_winters(series, horizon),
+        'estacional': seasonal_naive(series, horizon),
+        'tendencia': linear_trend(series, horizon)
+    }
+    shape = (len(labels), len(MEASURES), horizon)
+    return {
+        'labels': labels,
+        'months': months,
+        'history': values,
+        'future': pd.period_range(months[-1] + 1, periods=horizon, freq='M'),
+        # Montos mensuales no negativos: un pronóstico bajo cero se lleva a cero
+        'models': {name: np.clip(f, 0, None).reshape(shape).transpose(0, 2, 1) for name, f in forecasts.items()}
+    }
+
+
+# Función para obtener la historia y el pronóstico de una serie como tabla: Mes, Ingresos, Gastos, Neto, Saldo y
+# Tipo (Histórico o Pronóstico). El saldo es el acumulado del neto desde el inicio del ledger.
+def forecast_frame(forecast, label, model, horizon):
+    position = forecast['labels'].index(label)
+    history = forecast['history'][position]
+    future = forecast['models'][model][position, :horizon]
+    values = np.concatenate([history, future])
+    frame = pd.DataFrame({
+        'Mes': np.concatenate([forecast['months'].astype(str), forecast['future'][:horizon].astype(str)]),
+        'Ingresos': values[:, 0],
+        'Gastos': values[:, 1],
+        'Tipo': ['Histórico'] * len(history) + ['Pronóstico'] * len(future)
+    })
+    frame['Neto'] = frame['Ingresos'] - frame['Gastos']
+    frame['Saldo'] = frame['Neto'].cumsum()
+    return frame
+
+
+# Función para el gráfico de pronóstico: ingresos, gastos y saldo acumulado; el tramo pronosticado va punteado y
+# continúa desde el último mes con datos
+def forecast_figure(frame, title, theme):
+    history = frame[frame['Tipo'] == 'Histórico']
+    future = frame.iloc[len(history) - 1:] if len(history) else frame
+    lines = [('Ingresos', '#10b981', 'y'), ('Gastos', '#ef4444', 'y'), ('Saldo', theme['primary'], 'y2')]
+    fig = go.Figure()
+    for column, color, axis in lines:
+        fig.add_trace(go.Scatter(
+            x=history['Mes'], y=history[column], mode='lines+markers', name=column,
+            line=dict(color=color), yaxis=axis, legendgroup=column
+        ))
+        fig.add_trace(go.Scatter(
+            x=future['Mes'], y=future[column], mode='lines+markers', name=f"{column} (pronóstico)",
+            line=dict(color=color, dash='dot'), yaxis=axis, legendgroup=column, showlegend=False
+        ))
+    fig.update_layout(
+        title=title,
+        yaxis=dict(title='Monto mensual'),
+        yaxis2=dict(title='Saldo acumulado', overlaying='y', side='right', showgrid=False),
+        legend=dict(orientation='h', y=-0.2),
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)'
+    )
+    if len(history) and len(frame) > len(history):
+        fig.add_vline(x=len(history) - 1, line=dict(color='#94a3b8', dash='dash', width=1))
+    return fig
+
+
+# Función para mostrar el pronóstico en una página: horizonte, modelo y serie (si hay más de una), el gráfico desde
+# el caché de figuras y los totales del período pronosticado. chart_key(nombre, *parámetros) es la clave de la app.
+def render_forecast(forecast, widget_key, chart_key, title, theme, series_label="Serie", total_name=TOTAL_LABEL):
+    if forecast is None:
+        st.info("No hay datos suficientes para pronosticar.")
+        return
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        horizon = st.slider("Meses a pronosticar", 3, FORECAST_MAX_MONTHS, min(6, FORECAST_MAX_MONTHS), key=f"{widget_key}_meses")
+    with col2:
+        model = st.selectbox("Modelo", list(MODELS), format_func=MODELS.get, key=f"{widget_key}_modelo")
+    with col3:
+        labels = forecast['labels']
+        label = labels[0]
+        if len(labels) > 1:
+            label = st.selectbox(
+                series_label, labels, format_func=lambda x: total_name if x == TOTAL_LABEL else x,
+                key=f"{widget_key}_serie"
+            )
+
+    frame = forecast_frame(forecast, label, model, horizon)
+    name = total_name if label == TOTAL_LABEL else label
+    fig = cached_figure(
+        chart_key('pronostico', label, model, horizon),
+        lambda: forecast_figure(frame, f"{title} - {name} ({MODELS[model]})", theme)
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    future = frame[frame['Tipo'] == 'Pronóstico']
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("💰 Ingresos pronosticados", f"${future['Ingresos'].sum():,.0f}")
+    with col2:
+        st.metric("💸 Gastos pronosticados", f"${future['Gastos'].sum():,.0f}")
+    with col3:
+        st.metric(f"📈 Saldo a {future['Mes'].iloc[-1]}", f"${future['Saldo'].iloc[-1]:,.0f}",
+                  f"{future['Neto'].sum():,.0f}")
+    with st.expander("📋 Detalle del pronóstico"):
+        st.dataframe(
+            future.drop(columns='Tipo').style.format({c: '${:,.0f}' for c in ['Ingresos', 'Gastos', 'Neto', 'Saldo']}),
+            use_container_width=True, hide_index=True
+        )
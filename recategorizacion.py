@@ -0,0 +1,207 @@
+# Re-categorización masiva del historial en varios procesos.
+#
+# Cuando cambia la taxonomía (CATEGORIAS_PADRE o las reglas), todas las transacciones deben volver a
+# categorizarse. Las reglas dependen solo del par (descripción, tipo), así que se categorizan los pares
+# distintos: se escriben en memoria compartida (texto UTF-8 + offsets), se reparten en rangos de filas
+# entre un ProcessPoolExecutor y cada proceso escribe sus códigos en un buffer compartido de salida.
+# El resultado se registra en la tabla memo y se publica como ledger categorizado (CATEGORIZED_NAME) en la entrada
+# de caché de cada empresa: las páginas lo leen en vez de categorizar el historial en su ejecución. Si al iniciar
+# el proceso la tabla memo no corresponde a las reglas actuales, el trabajo arranca solo.
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+
+from categorias import LEDGER_LABELS, LEDGER_RULES_HASH, categorize_codes, categorize_ledger, ledger_memo_stale, seed_ledger_memo
+from ledger_store import CSV_FILES, load_company_entry, merge_rows, publish_company_derived
+
+# Pares (descripción, tipo) por bloque de trabajo
+SHARD_ROWS = int(os.environ.get("TRILEDGER_RECATEGORIZE_SHARD_ROWS", 20_000))
+
+# Procesos del pool (por defecto, uno por núcleo)
+WORKERS = int(os.environ.get("TRILEDGER_RECATEGORIZE_WORKERS", os.cpu_count() or 1))
+
+# Derivado con el ledger categorizado; lleva el hash de las reglas: si cambia la taxonomía se recalcula
+CATEGORIZED_NAME = f'categorizado_{LEDGER_RULES_HASH}'
+
+
+# Función para categorizar un ledger completo (columnas Categoria_Padre y Categoria_Hijo)
+def categorize_frame(df):
+    return df.assign(**categorize_ledger(df))
+
+
+# Función para categorizar las transacciones nuevas del journal y sumarlas al ledger categorizado
+def append_categorized(df, new_rows):
+    return merge_rows(df, categorize_frame(new_rows))
+
+
+# Función que ejecuta cada proceso: categoriza los pares [start, stop) y escribe sus códigos en la salida
+def _categorize_shard(names, count, start, stop):
+    # Los bloques son del proceso principal, que los libera (unlink) al terminar
+    blocks = {key: SharedMemory(name=name) for key, name in names.items()}
+    try:
+        offsets = np.ndarray((count + 1,), dtype='int64', buffer=blocks['offsets'].buf)
+        es_ingreso = np.ndarray((count,), dtype='bool', buffer=blocks['ingreso'].buf)
+        out = np.ndarray((count,), dtype='int16', buffer=blocks['out'].buf)
+        text = bytes(blocks['text'].buf[offsets[start]:offsets[stop]])
+        base = offsets[start]
+        descriptions = [
+            text[a - base:b - base].decode('utf-8')
+            for a, b in zip(offsets[start:stop], offsets[start + 1:stop + 1])
+        ]
+        out[start:stop] = categorize_codes(descriptions, es_ingreso[start:stop])
+        return stop - start
+    finally:
+        for block in blocks.values():
+            block.close()
+
+
+# Función para crear un bloque compartido con el contenido de un arreglo o bytes
+def _share(data):
+    data = memoryview(data).cast('B')
+    shm = SharedMemory(create=True, size=max(len(data), 1))
+    shm.buf[:len(data)] = data
+    return shm
+
+
+# Función para re-categorizar un ledger con un pool de procesos.
+# progress(hechos, total) se llama a medida que terminan los bloques. Devuelve las categorías por fila y estadísticas.
+def recategorize(df, workers=None, shard_rows=SHARD_ROWS, progress=None):
+    workers = workers or WORKERS
+    start_time = time.perf_counter()
+
+    # Pares distintos (descripción, tipo) y el código de par de cada fila
+    desc_codes, desc_uniques = pd.factorize(df['Descripción'].astype(str))
+    tipo_codes, tipo_uniques = pd.factorize(df['Tipo'].astype(str))
+    n_tipos = max(len(tipo_uniques), 1)
+    pair_ids, codes = np.unique(desc_codes * n_tipos + tipo_codes, return_inverse=True)
+    descriptions = desc_uniques[pair_ids // n_tipos]
+    tipos = tipo_uniques[pair_ids % n_tipos]
+    count = len(pair_ids)
+
+    encoded = [description.encode('utf-8') for description in descriptions]
+    offsets = np.zeros(count + 1, dtype='int64')
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+
+    blocks = {
+        'text': _share(b''.join(encoded)),
+        'offsets': _share(offsets),
+        'ingreso': _share(np.asarray(tipos == "Ingreso", dtype='bool')),
+        'out': SharedMemory(create=True, size=max(count * 2, 1))
+    }
+    try:
+        names = {key: block.name for key, block in blocks.items()}
+        shards = [(start, min(start + shard_rows, count)) for start in range(0, count, shard_rows)]
+        done = 0
+        if progress is not None:
+            progress(done, count)
+        # spawn: no se hace fork del servidor de Streamlit (con hilos) para crear los procesos
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as pool:
+            futures = [pool.submit(_categorize_shard, names, count, start, stop) for start, stop in shards]
+            for future in as_completed(futures):
+                done += future.result()
+                if progress is not None:
+                    progress(done, count)
+        pair_codes = np.ndarray((count,), dtype='int16', buffer=blocks['out'].buf).copy()
+    finally:
+        for block in blocks.values():
+            block.close()
+            block.unlink()
+
+    padres = np.array([padre for padre, _ in LEDGER_LABELS], dtype=object)[pair_codes]
+    hijos = np.array([hijo for _, hijo in LEDGER_LABELS], dtype=object)[pair_codes]
+    seed_ledger_memo(zip(descriptions, tipos), zip(padres, hijos))
+
+    # Unión con las filas: cada fila toma el resultado de su par
+    result = pd.DataFrame({'Categoria_Padre': padres[codes], 'Categoria_Hijo': hijos[codes]}, index=df.index)
+    seconds = time.perf_counter() - start_time
+    stats = {
+        'rows': len(df),
+        'pairs': count,
+        'workers': workers,
+        'seconds': seconds,
+        'rows_per_s': len(df) / seconds if seconds else 0
+    }
+    return result, stats
+
+
+# Trabajos en segundo plano (fuera del rerun de Streamlit): id -> estado
+_jobs = {}
+_jobs_lock = threading.Lock()
+_job_ids = itertools.count(1)
+
+# Trabajo iniciado automáticamente por un cambio de reglas (se revisa una vez por proceso)
+_auto = {'checked': False, 'job': None}
+
+
+# Función para iniciar la re-categorización de las empresas en un hilo; devuelve el id del trabajo.
+# Solo corre un trabajo a la vez: si ya hay uno activo, se devuelve ese.
+def start_job(companies=None, workers=None):
+    companies = list(companies or CSV_FILES)
+    with _jobs_lock:
+        for job_id, job in _jobs.items():
+            if job['status'] == "running":
+                return job_id
+        job_id = next(_job_ids)
+        _jobs[job_id] = {
+            'status': "running", 'companies': companies, 'current': None,
+            'done': 0, 'total': 0, 'rows': 0, 'stats': {}, 'error': None,
+            'started': time.time(), 'finished': None
+        }
+
+    def update(**values):
+        with _jobs_lock:
+            _jobs[job_id].update(values)
+
+    def run():
+        try:
+            for company in companies:
+                entry = load_company_entry(company)
+                if entry is None or entry['df'].empty:
+                    continue
+                update(current=company, done=0, total=0)
+                df = entry['df'].copy(deep=False)
+                result, stats = recategorize(df, workers, progress=lambda done, total: update(done=done, total=total))
+                # Se publica en la entrada vigente (las filas que llegaron durante el trabajo se suman con el updater);
+                # las que lleguen después las suma el refresco
+                publish_company_derived(company, entry, CATEGORIZED_NAME, df.assign(**result), append_categorized)
+                with _jobs_lock:
+                    _jobs[job_id]['stats'][company] = stats
+                    _jobs[job_id]['rows'] += stats['rows']
+            update(status="done", current=None, finished=time.time())
+        except Exception as error:
+            update(status="error", error=str(error), finished=time.time())
+
+    threading.Thread(target=run, name=f"recategorize-{job_id}", daemon=True).start()
+    return job_id
+
+
+# Función para iniciar la re-categorización si la tabla memo no corresponde a las reglas actuales. Se revisa una
+# vez por proceso (las reglas solo cambian con el código); devuelve el id del trabajo o None.
+def start_job_if_rules_changed():
+    with _jobs_lock:
+        if _auto['checked']:
+            return _auto['job']
+        _auto['checked'] = True
+    if ledger_memo_stale():
+        _auto['job'] = start_job()
+    return _auto['job']
+
+
+# Función para saber si el ledger categorizado de una entrada de caché lo está preparando un trabajo en curso
+def categorization_pending(job_id, entry):
+    job = job_status(job_id)
+    return job is not None and job['status'] == "running" and entry is not None and CATEGORIZED_NAME not in entry['derived']
+
+
+# Función para obtener una copia del estado de un trabajo (None si no existe)
+def job_status(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return None if job is None else {**job, 'stats': dict(job['stats'])}
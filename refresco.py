@@ -0,0 +1,208 @@
+import os
+import threading
+import time
+
+import streamlit as st
+
+import ledger_journal
+from derivados import evaluate, lazy_datasets
+from ledger_store import ALL_COMPANIES, CSV_FILES, file_version, load_consolidated
+from rendimiento import finish_run, start_run, timed
+
+# Refresco en segundo plano. Un hilo vigila los CSV y sus journals; cuando cambian, refresca el caché de
+# ledgers, recalcula los derivados que las páginas piden (ledger categorizado, cubos, KPIs) y publica una instantánea
+# nueva reemplazando una sola referencia. Las ejecuciones de las páginas leen la última instantánea lista:
+# nunca esperan lecturas de disco ni parseo (salvo la primera carga del proceso).
+
+# Segundos entre revisiones de los archivos
+REFRESH_SECONDS = float(os.environ.get("TRILEDGER_REFRESH_SECONDS", 2))
+
+# Segundos máximos que una página espera la primera instantánea del proceso
+FIRST_SNAPSHOT_TIMEOUT = float(os.environ.get("TRILEDGER_FIRST_SNAPSHOT_TIMEOUT", 60))
+
+# Segundos sin que ninguna página pida un derivado tras los cuales el hilo deja de mantenerlo
+WARMUP_TTL = float(os.environ.get("TRILEDGER_WARMUP_TTL_SECONDS", 30 * 60))
+
+# Última instantánea publicada: {'version', 'as_of', 'consolidated'} (None hasta la primera carga).
+# Se reemplaza completa, nunca se modifica: quien la leyó sigue viendo una versión coherente.
+_snapshot = None
+_published = threading.Condition()
+
+# Derivados que el hilo mantiene al día: (empresa o ALL_COMPANIES, nombre) -> {'graph': grafo de derivados.py,
+# 'requested': último pedido de una página}
+_warmups = {}
+_warmups_lock = threading.Lock()
+
+_state = {'thread': None, 'refreshing': False, 'error': None, 'pending': False}
+_state_lock = threading.Lock()
+_wake = threading.Event()
+
+
+# Función para obtener la versión observable de los ledgers (CSV + tamaño del journal), sin leerlos
+def _watch_versions():
+    return tuple(
+        (company, file_version(csv_file), ledger_journal.journal_size(csv_file))
+        for company, csv_file in CSV_FILES.items()
+        if os.path.exists(csv_file)
+    )
+
+
+# Función para obtener la entrada de caché de una empresa (o la consolidada) dentro de una instantánea
+def snapshot_entry(snapshot, scope):
+    consolidated = None if snapshot is None else snapshot['consolidated']
+    if consolidated is None:
+        return None
+    if scope == ALL_COMPANIES:
+        return consolidated
+    return consolidated['entries'].get(scope)
+
+
+# Función para obtener los derivados a mantener, descartando los que ninguna página pidió en WARMUP_TTL segundos.
+# Un derivado descartado pierde su updater: deja de arrastrarse con las filas del journal y se recalcula si se
+# vuelve a pedir.
+def _active_warmups(snapshot):
+    now = time.time()
+    with _warmups_lock:
+        expired = [key for key, warmup in _warmups.items() if now - warmup['requested'] > WARMUP_TTL]
+        for key in expired:
+            del _warmups[key]
+        active = {key: warmup['graph'] for key, warmup in _warmups.items()}
+    for scope, name in expired:
+        entry = snapshot_entry(snapshot, scope)
+        if entry is not None:
+            entry['updaters'].pop(name, None)
+    return active
+
+
+# Función para construir y publicar una instantánea nueva (se ejecuta en el hilo de refresco). El ledger consolidado
+# solo relee las empresas que cambiaron; las demás conservan sus derivados, así solo se calculan los que faltan
+# (los de una empresa con filas nuevas que no tienen updater, o los consolidados si alguna página los pidió).
+def _refresh():
+    global _snapshot
+    start_run('refresco', 'instantánea')
+    with timed('load'):
+        consolidated = load_consolidated()
+    snapshot = {
+        'version': None if consolidated is None else consolidated['version'],
+        'as_of': time.time(),
+        'consolidated': consolidated
+    }
+    for (scope, name), graph in _active_warmups(snapshot).items():
+        entry = snapshot_entry(snapshot, scope)
+        if entry is not None and name not in entry['derived']:
+            evaluate(entry, graph, name)
+    with _published:
+        _snapshot = snapshot
+        _published.notify_all()
+    finish_run()
+
+
+# Bucle del hilo: revisa las versiones y refresca si cambiaron o si hay derivados nuevos por calcular
+def _run():
+    last = None
+    while True:
+        # Un pedido que llegue durante el refresco despierta la próxima espera
+        _wake.clear()
+        try:
+            versions = _watch_versions()
+            with _state_lock:
+                pending = _state['pending']
+                _state['pending'] = False
+            if versions != last or pending or _snapshot is None:
+                with _state_lock:
+                    _state['refreshing'] = True
+                _refresh()
+                last = versions
+                with _state_lock:
+                    _state['error'] = None
+        except Exception as error:
+            # Se conserva la instantánea anterior; se reintenta en la próxima revisión
+            with _state_lock:
+                _state['error'] = str(error)
+        finally:
+            with _state_lock:
+                _state['refreshing'] = False
+        _wake.wait(REFRESH_SECONDS)
+
+
+# Función para registrar derivados que el hilo debe mantener calculados: [(empresa, grafo, nombre)]. Uno ya
+# registrado renueva su último pedido.
+def register_warmups(warmups):
+    added = False
+    now = time.time()
+    with _warmups_lock:
+        for scope, graph, name in warmups:
+            if (scope, name) not in _warmups:
+                added = True
+            _warmups[(scope, name)] = {'graph': graph, 'requested': now}
+    if added:
+        with _state_lock:
+            _state['pending'] = True
+        _wake.set()
+
+
+# Función para iniciar el hilo de refresco (una vez por proceso) y registrar derivados a precalcular
+def start_refresh_worker(warmups=()):
+    register_warmups(warmups)
+    with _state_lock:
+        if _state['thread'] is None:
+            _state['thread'] = threading.Thread(target=_run, name="ledger-refresh", daemon=True)
+            _state['thread'].start()
+
+
+# Función para pedir un refresco inmediato (p. ej. tras guardar una transacción).
+# Con timeout, espera hasta ese máximo a que se publique una instantánea posterior al pedido.
+def request_refresh(timeout=None):
+    requested = time.time()
+    with _state_lock:
+        _state['pending'] = True
+    _wake.set()
+    if timeout:
+        with _published:
+            _published.wait_for(lambda: _snapshot is not None and _snapshot['as_of'] >= requested, timeout)
+
+
+# Función para obtener la última instantánea publicada (solo la primera del proceso puede esperar; None si no llegó)
+def current_snapshot():
+    if _snapshot is None:
+        start_refresh_worker()
+        with _published:
+            _published.wait_for(lambda: _snapshot is not None, FIRST_SNAPSHOT_TIMEOUT)
+    return _snapshot
+
+
+# Función para obtener el acceso perezoso a los derivados de una empresa en la instantánea (None sin ledger).
+# Un derivado que el hilo aún no calculó se calcula en memoria al pedirlo y queda registrado: desde entonces el
+# hilo lo prepara para cada versión nueva, fuera de la ejecución de la página, mientras se siga pidiendo.
+def snapshot_datasets(snapshot, scope, graph):
+    entry = snapshot_entry(snapshot, scope)
+    if entry is None:
+        return None
+    datasets = lazy_datasets(entry, graph)
+
+    def get(name):
+        if name in graph:
+            register_warmups([(scope, graph, name)])
+        return datasets(name)
+
+    return get
+
+
+# Función para obtener el estado del refresco: hora de los datos, si hay un refresco en curso y el último error
+def refresh_status():
+    with _state_lock:
+        status = {'refreshing': _state['refreshing'], 'error': _state['error']}
+    status['as_of'] = None if _snapshot is None else _snapshot['as_of']
+    return status
+
+
+# Función para mostrar la hora de los datos en pantalla ("datos al ...")
+def render_refresh_status():
+    status = refresh_status()
+    if status['as_of'] is None:
+        st.caption("⏳ Cargando datos...")
+        return
+    as_of = time.strftime('%H:%M:%S', time.localtime(status['as_of']))
+    st.caption(f"🕒 Datos al {as_of}" + (" · actualizando..." if status['refreshing'] else ""))
+    if status['error']:
+        st.warning(f"No se pudo actualizar los datos: {status['error']}")
@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Instrumentación de tiempos por ejecución. Cada ejecución de una página (o refresco del hilo de fondo) mide sus
+# etapas: carga, parseo, categorización, índice de búsqueda, agregados, figuras y render. Las etapas anidadas
+# descuentan su tiempo de la etapa que las contiene, y lo que no cae en ninguna etapa cuenta como render: la suma
+# de etapas es el total.
+
+# Etapas medidas, en orden de presentación
+STAGES = ['load', 'parse', 'categorize', 'index', 'aggregate', 'figure', 'render']
+
+# Cantidad de ejecuciones que se conservan para los percentiles (ventana móvil del proceso)
+TIMINGS_WINDOW = int(os.environ.get("TRILEDGER_TIMINGS_WINDOW", 2000))
+
+# Archivo JSON lines donde se agrega cada ejecución (opcional)
+TIMINGS_PATH = os.environ.get("TRILEDGER_TIMINGS_PATH")
+
+# Panel de administración visible siempre (si no, con ?admin=1 en la URL)
+ADMIN = os.environ.get("TRILEDGER_ADMIN", "").lower() in ("1", "true", "yes")
+
+_samples = deque(maxlen=TIMINGS_WINDOW)
+_samples_lock = threading.Lock()
+
+# Ejecución en curso del hilo actual (cada sesión de Streamlit ejecuta su script en su propio hilo)
+_local = threading.local()
+
+
+# Función para iniciar la medición de una ejecución
+def start_run(app, page=None):
+    _local.run = {'app': app, 'page': page, 'start': time.perf_counter(), 'stages': {}, 'stack': []}
+
+
+# Función para indicar la página de la ejecución en curso (se conoce después de leer la navegación)
+def set_run_page(page):
+    run = getattr(_local, 'run', None)
+    if run is not None:
+        run['page'] = page
+
+
+# Contexto para medir una etapa; fuera de una ejecución no mide nada
+@contextmanager
+def timed(stage):
+    run = getattr(_local, 'run', None)
+    if run is None:
+        yield
+        return
+    frame = [stage, time.perf_counter(), 0.0]
+    run['stack'].append(frame)
+    try:
+        yield
+    finally:
+        run['stack'].pop()
+        elapsed = time.perf_counter() - frame[1]
+        # Tiempo propio: sin las etapas anidadas, que ya se contaron por separado
+        run['stages'][stage] = run['stages'].get(stage, 0.0) + elapsed - frame[2]
+        if run['stack']:
+            run['stack'][-1][2] += elapsed
+
+
+# Función para cerrar la ejecución en curso y registrarla; devuelve la muestra (None si no había ejecución)
+def finish_run():
+    run = getattr(_local, 'run', None)
+    if run is None:
+        return None
+    _local.run = None
+    total = time.perf_counter() - run['start']
+    stages = dict(run['stages'])
+    stages['render'] = stages.get('render', 0.0) + max(total - sum(stages.values()), 0.0)
+    sample = {
+        'ts': time.time(),
+        'app': run['app'],
+        'page': run['page'],
+        'total_ms': round(total * 1000, 3),
+        'stages_ms': {stage: round(seconds * 1000, 3) for stage, seconds in stages.items()}
+    }
+    with _samples_lock:
+        _samples.append(sample)
+    if TIMINGS_PATH:
+        with open(TIMINGS_PATH, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(sample, ensure_ascii=False) + '\n')
+    return sample
+
+
+# Función para obtener las muestras de la ventana
+def timing_samples():
+    with _samples_lock:
+        return list(_samples)
+
+
+# Función para calcular p50/p95/p99 (ms) por aplicación, página y etapa (incluye el total de la ejecución)
+def timing_percentiles(samples=None):
+    samples = timing_samples() if samples is None else samples
+    rows = [
+        (sample['app'], sample['page'] or '-', stage, ms)
+        for sample in samples
+        for stage, ms in [*sample['stages_ms'].items(), ('total', sample['total_ms'])]
+    ]
+    if not rows:
+        return pd.DataFrame(columns=['App', 'Página', 'Etapa', 'n', 'p50', 'p95', 'p99'])
+    df = pd.DataFrame(rows, columns=['App', 'Página', 'Etapa', 'ms'])
+    order = {stage: i for i, stage in enumerate([*STAGES, 'total'])}
+    table = [
+        {
+            'App': app, 'Página': page, 'Etapa': stage, 'n': len(group),
+            **dict(zip(['p50', 'p95', 'p99'], np.percentile(group['ms'].to_numpy(), [50, 95, 99]).round(1)))
+        }
+        for (app, page, stage), group in df.groupby(['App', 'Página', 'Etapa'], sort=False)
+    ]
+    return pd.DataFrame(table).sort_values(
+        ['App', 'Página', 'Etapa'], key=lambda column: column.map(order) if column.name == 'Etapa' else column,
+        ignore_index=True
+    )
+
+
+# Función para exportar las muestras de la ventana como JSON lines
+def export_jsonl(samples=None):
+    samples = timing_samples() if samples is None else samples
+    return ''.join(json.dumps(sample, ensure_ascii=False) + '\n' for sample in samples)
+
+
+# Función para saber si se muestra el panel de administración
+def admin_enabled():
+    return ADMIN or st.query_params.get('admin') == '1'
+
+
+# Función para mostrar el panel de rendimiento (solo en modo administración)
+def render_performance_panel(app):
+    if not admin_enabled():
+        return
+    samples = timing_samples()
+    with st.expander("⏱️ Rendimiento", expanded=False):
+        if not samples:
+            st.caption("Aún no hay ejecuciones medidas.")
+            return
+        only_app = st.checkbox("Solo esta aplicación", value=True, key="perf_only_app")
+        if only_app:
+            samples = [sample for sample in samples if sample['app'] in (app, 'refresco')]
+        st.caption(f"Percentiles (ms) de las últimas {len(samples):,} ejecuciones")
+        st.dataframe(timing_percentiles(samples), hide_index=True, use_container_width=True)
+        st.download_button(
+            "📥 Exportar JSON lines",
+            export_jsonl(samples),
+            file_name="tiempos.jsonl",
+            mime="application/jsonl"
+        )
@@ -0,0 +1,449 @@
+import argparse
+import html
+import json
+import os
+import threading
+import time
+from datetime import date
+
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+import streamlit as st
+
+import ledger_store
+from agregados import build_cube, monthly_totals
+from categorias import GASTO_REPORTE_RULES_HASH, categorize_expenses
+from kpis import frame_kpis
+from temas import get_company_theme
+
+try:
+    import weasyprint
+except (ImportError, OSError):  # Sin weasyprint o sus bibliotecas de sistema (pango) no se genera PDF
+    weasyprint = None
+
+# Reportes mensuales pre-generados. Un proceso batch (python reportes.py) arma el contenido de la página
+# Reportes de app_v2 para cada empresa y mes cerrado y lo guarda como JSON (lo que lee la app), HTML con las
+# figuras Plotly embebidas y, opcionalmente, PDF. Cuando el rango elegido es un mes cerrado la app muestra el
+# reporte guardado en vez de recalcularlo; si los datos del mes cambiaron después de generarlo, se calcula en vivo.
+
+# Directorio de los reportes generados
+REPORTS_DIR = os.environ.get("TRILEDGER_REPORTS_DIR", "reportes_mensuales")
+
+# Figuras del reporte, en el orden de la página
+FIGURES = ['por_tipo', 'tendencia', 'proporcion', 'gastos_categoria', 'gastos_barras']
+
+# Formato del reporte guardado: al cambiar la firma u otro campo se sube y los reportes anteriores se regeneran
+REPORT_FORMAT = 2
+
+# Columnas de una transacción que entran en la firma de un mes
+SIGNATURE_COLUMNS = ['Descripción', 'Tipo', 'Monto', 'Fecha']
+
+# Colores de las categorías de gastos
+EXPENSE_COLORS = ['#ef4444', '#f97316', '#eab308', '#84cc16', '#22c55e', '#06b6d4', '#8b5cf6']
+
+# Reportes ya leídos: ruta -> (mtime, reporte con las figuras ya construidas), compartido entre sesiones
+_reports = {}
+_reports_lock = threading.Lock()
+
+
+# Función para sumar ingresos y gastos (valor absoluto) por tipo de transacción
+def type_totals(df):
+    type_data = df.groupby('Tipo', observed=True)['Monto'].sum().reset_index()
+    type_data['Monto'] = type_data['Monto'].abs()
+    return type_data
+
+
+# Función para sumar los gastos (valor absoluto) por categoría de reporte, de mayor a menor
+def expense_categories(expenses_df):
+    category_data = expenses_df.groupby('Categoría')['Monto'].sum().reset_index()
+    category_data['Monto'] = category_data['Monto'].abs()
+    return category_data.sort_values('Monto', ascending=False)
+
+
+# Función para armar la tabla de resumen de gastos por categoría (montos ya formateados)
+def expense_summary(expenses_df):
+    summary_data = expenses_df.groupby('Categoría').agg({
+        'Monto': ['sum', 'count'],
+        'Descripción': lambda x: ', '.join(x.head(3).tolist()) + ('...' if len(x) > 3 else '')
+    }).reset_index()
+    summary_data.columns = ['Categoría', 'Total Gastos', 'Cantidad', 'Ejemplos']
+    summary_data['Total Gastos'] = abs(summary_data['Total Gastos'])
+    summary_data = summary_data.sort_values('Total Gastos', ascending=False)
+    summary_data['Total Gastos'] = summary_data['Total Gastos'].apply(lambda x: f"${x:,.0f}")
+    return summary_data
+
+
+# Función para el gráfico de barras por tipo de transacción
+def type_figure(type_data, company):
+    fig_bars = px.bar(
+        type_data,
+        x='Tipo',
+        y='Monto',
+        title=f"Total por Tipo - {company}",
+        color='Tipo',
+        color_discrete_map={'Ingreso': '#10b981', 'Gasto': '#ef4444'},
+        text=type_data['Monto'].apply(lambda x: f"${x:,.0f}")
+    )
+    fig_bars.update_traces(textposition='outside')
+    fig_bars.update_layout(
+        xaxis_title="Tipo de Transacción",
+        yaxis_title="Monto Total ($)",
+        showlegend=False,
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)'
+    )
+    return fig_bars
+
+
+# Función para el gráfico de tendencia mensual del neto; by_company agrega una línea por empresa (consolidado)
+def trend_figure(monthly, company, theme, by_company=None):
+    monthly_summary = pd.DataFrame({
+        'Fecha': monthly.index.astype(str),
+        'Monto': monthly['Neto'].to_numpy()
+    })
+    fig_line = px.line(
+        monthly_summary,
+        x='Fecha',
+        y='Monto',
+        title=f"Tendencia de Flujo de Caja - {company}",
+        markers=True
+    )
+    fig_line.update_traces(line_color=theme['primary'], marker_color=theme['secondary'])
+    if by_company is not None:
+        for name in by_company.columns:
+            fig_line.add_trace(go.Scatter(
+                x=by_company.index.astype(str),
+                y=by_company[name].to_numpy(),
+                mode='lines+markers',
+                name=name,
+                line=dict(color=get_company_theme(name)['primary'], dash='dot')
+            ))
+    fig_line.update_layout(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)'
+    )
+    return fig_line
+
+
+# Función para el gráfico de donut de ingresos vs gastos
+def proportion_figure(total_income, total_expenses, company):
+    fig_donut = go.Figure(data=[go.Pie(
+        labels=['Ingresos', 'Gastos'],
+        values=[total_income, total_expenses],
+        hole=0.6,
+        marker_colors=['#10b981', '#ef4444'],
+        textinfo='label+percent',
+        textposition='inside'
+    )])
+    fig_donut.update_layout(
+        title=f"Proporción Ingresos vs Gastos - {company}",
+        showlegend=True,
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    return fig_donut
+
+
+# Función para el gráfico de barras verticales por categoría de gasto
+def expense_category_figure(category_data, company):
+    fig_expenses = px.bar(
+        category_data,
+        x='Categoría',
+        y='Monto',
+        title=f"Categorías de Gastos - {company}",
+        color='Categoría',
+        color_discrete_sequence=EXPENSE_COLORS,
+        text=category_data['Monto'].apply(lambda x: f"${x:,.0f}")
+    )
+    fig_expenses.update_traces(textposition='outside')
+    fig_expenses.update_layout(
+        xaxis_title="Categoría",
+        yaxis_title="Monto Total ($)",
+        showlegend=False,
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        xaxis={'tickangle': 45}
+    )
+    return fig_expenses
+
+
+# Función para el gráfico de barras horizontales por categoría de gasto
+def expense_bars_figure(category_data, company):
+    fig_bars = px.bar(
+        category_data.sort_values('Monto', ascending=True),
+        x='Monto',
+        y='Categoría',
+        orientation='h',
+        title=f"Gastos por Categoría - {company}",
+        color='Monto',
+        color_continuous_scale='Reds'
+    )
+    fig_bars.update_layout(
+        xaxis_title="Monto ($)",
+        yaxis_title="Categoría",
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)'
+    )
+    return fig_bars
+
+
+# Función para obtener los constructores de las figuras del reporte (se construyen solo las que se piden)
+def report_figures(type_data, monthly, kpis, category_data, company, theme, by_company=None):
+    figures = {
+        'por_tipo': lambda: type_figure(type_data, company),
+        'tendencia': lambda: trend_figure(monthly, company, theme, by_company),
+        'proporcion': lambda: proportion_figure(kpis['Ingresos'], kpis['Gastos'], company)
+    }
+    if not category_data.empty:
+        figures['gastos_categoria'] = lambda: expense_category_figure(category_data, company)
+        figures['gastos_barras'] = lambda: expense_bars_figure(category_data, company)
+    return figures
+
+
+# Función para obtener el total de un tipo en la tabla por tipo (0 si no hay transacciones de ese tipo)
+def type_total(type_data, tipo):
+    values = type_data.loc[type_data['Tipo'] == tipo, 'Monto']
+    return values.iloc[0] if len(values) else 0
+
+
+# Función para obtener la firma de un mes a partir de sus transacciones: cantidad y suma de los hashes de cada fila
+# (descripción, tipo, monto y fecha). Corregir una descripción cambia la firma aunque los totales sigan iguales;
+# la suma no depende del orden de las filas dentro del día.
+def month_signature(df, month):
+    period = pd.Period(month, 'M')
+    month_df = ledger_store.date_slice(df, period.start_time, period.end_time)
+    hashes = pd.util.hash_pandas_object(month_df[SIGNATURE_COLUMNS], index=False).to_numpy()
+    return [len(month_df), format(int(hashes.sum(dtype='uint64')), '016x')]
+
+
+# Función para saber si un reporte sigue vigente: mismo formato, mismas transacciones del mes (firma) y mismas reglas
+# de categorías de gastos (con otras reglas el desglose por categoría del reporte ya no corresponde)
+def report_current(report, df):
+    return (
+        report.get('format') == REPORT_FORMAT
+        and report.get('rules_hash') == GASTO_REPORTE_RULES_HASH
+        and report['signature'] == month_signature(df, report['month'])
+    )
+
+
+# Función para saber si un rango de fechas es exactamente un mes cerrado (acotado a las fechas del ledger).
+# Devuelve el mes ('YYYY-MM') o None; el mes en curso nunca está cerrado.
+def closed_month(start, end, min_date, max_date, today=None):
+    period = pd.Period(start, 'M')
+    if period >= pd.Period(today or date.today(), 'M'):
+        return None
+    first = max(period.start_time.date(), min_date)
+    last = min(period.end_time.date(), max_date)
+    return str(period) if (start, end) == (first, last) else None
+
+
+# Función para calcular el reporte de una empresa y un mes a partir de su ledger
+def build_month_report(company, month, df):
+    period = pd.Period(month, 'M')
+    month_df = ledger_store.date_slice(df, period.start_time, period.end_time)
+    cube = build_cube(month_df)
+    kpis = frame_kpis(month_df)
+    expenses = month_df[month_df['Monto'] < 0]
+    expenses_df = expenses.assign(Categoría=categorize_expenses(expenses['Descripción']))
+    type_data = type_totals(month_df)
+    category_data = expense_categories(expenses_df)
+    figures = report_figures(
+        type_data, monthly_totals(cube), kpis, category_data, company, get_company_theme(company)
+    )
+    summary = expense_summary(expenses_df) if not expenses_df.empty else None
+    return {
+        'company': company,
+        'month': month,
+        'generated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'format': REPORT_FORMAT,
+        'signature': month_signature(month_df, month),
+        'rules_hash': GASTO_REPORTE_RULES_HASH,
+        'kpis': {name: float(value) for name, value in kpis.items()},
+        'type_totals': {tipo: float(type_total(type_data, tipo)) for tipo in ('Ingreso', 'Gasto')},
+        'figures': {name: json.loads(pio.to_json(build(), validate=False)) for name, build in figures.items()},
+        'summary': None if summary is None else summary.to_dict(orient='split', index=False)
+    }
+
+
+# Función para obtener la ruta base (sin extensión) del reporte de una empresa y un mes
+def report_path(company, month, reports_dir=None):
+    slug = company.lower().replace(' ', '_')
+    return os.path.join(reports_dir or REPORTS_DIR, f"{slug}_{month}")
+
+
+# Función para armar el HTML del reporte (figuras como JSON de Plotly; plotly.js desde CDN o embebido)
+def report_html(report, offline=False, static_figures=None):
+    kpis = report['kpis']
+    metrics = [
+        ("💰 Total Ingresos", f"${report['type_totals']['Ingreso']:,.0f}"),
+        ("💸 Total Gastos", f"${report['type_totals']['Gasto']:,.0f}"),
+        ("💵 Ingresos Netos", f"${kpis['Saldo']:,.0f}"),
+        ("💰 Margen de Ganancia", f"{kpis['Margen']:.1f}%"),
+        ("📊 Ratio de Gastos", f"{kpis['Ratio de gastos']:.1f}%"),
+        ("Total Transacciones", f"{kpis['Transacciones']:,.0f}"),
+        ("Promedio Ingresos", f"${kpis['Promedio ingreso']:,.0f}"),
+        ("Promedio Gastos", f"${kpis['Promedio gasto']:,.0f}")
+    ]
+    rows = ''.join(f"<tr><th>{html.escape(label)}</th><td>{value}</td></tr>" for label, value in metrics)
+    parts = []
+    for i, name in enumerate(FIGURES):
+        if name not in report['figures']:
+            continue
+        if static_figures is not None:
+            parts.append(f'<div class="figure">{static_figures[name]}</div>')
+        else:
+            include = (True if offline else 'cdn') if i == 0 else False
+            parts.append(pio.to_html(
+                go.Figure(report['figures'][name]), full_html=False, include_plotlyjs=include,
+                div_id=f"fig_{name}", validate=False
+            ))
+    summary = report['summary']
+    summary_html = '' if summary is None else pd.DataFrame(
+        summary['data'], columns=summary['columns']
+    ).to_html(index=False, classes='summary', border=0)
+    theme = get_company_theme(report['company'])
+    title = f"Reporte {report['month']} - {report['company']}"
+    return f"""<!DOCTYPE html>
+<html lang="es">
+<head>
+<meta charset="utf-8">
+<title>{html.escape(title)}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2rem; color: #1e293b; }}
+h1 {{ color: {theme['primary']}; }}
+table {{ border-collapse: collapse; margin: 1rem 0; }}
+th, td {{ padding: 6px 12px; border-bottom: 1px solid #e2e8f0; text-align: left; }}
+.figure {{ page-break-inside: avoid; }}
+</style>
+</head>
+<body>
+<h1>{html.escape(title)}</h1>
+<p>Generado el {report['generated_at']}</p>
+<table>{rows}</table>
+{''.join(parts)}
+<h2>Resumen de Gastos por Categoría</h2>
+{summary_html}
+</body>
+</html>
+"""
+
+
+# Función para escribir el PDF del reporte (figuras estáticas en SVG; requiere kaleido y weasyprint)
+def write_report_pdf(report, path):
+    static_figures = {
+        name: pio.to_image(go.Figure(figure), format='svg').decode('utf-8')
+        for name, figure in report['figures'].items()
+    }
+    weasyprint.HTML(string=report_html(report, static_figures=static_figures)).write_pdf(path)
+
+
+# Función para escribir un archivo de texto
+def _write_text(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+# Función para guardar un reporte: JSON (para la app), HTML y opcionalmente PDF. Escrituras atómicas.
+def write_report(report, reports_dir=None, offline=False, pdf=False):
+    base = report_path(report['company'], report['month'], reports_dir)
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    outputs = [('.html', lambda path: _write_text(path, report_html(report, offline)))]
+    if pdf:
+        outputs.append(('.pdf', lambda path: write_report_pdf(report, path)))
+    # El JSON va al final: la app solo ofrece el reporte cuando ya existen sus otros archivos
+    outputs.append(('.json', lambda path: _write_text(path, json.dumps(report, ensure_ascii=False))))
+    for extension, write in outputs:
+        tmp_path = f"{base}{extension}.{os.getpid()}.tmp"
+        write(tmp_path)
+        os.replace(tmp_path, base + extension)
+    return base
+
+
+# Función para leer el reporte guardado de una empresa y un mes (None si no existe); las figuras se construyen
+# una vez por proceso y las comparten todas las sesiones
+def load_report(company, month, reports_dir=None):
+    path = report_path(company, month, reports_dir) + '.json'
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    with _reports_lock:
+        cached = _reports.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    try:
+        with open(path, encoding='utf-8') as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        return None
+    report['figures'] = {name: go.Figure(figure) for name, figure in report['figures'].items()}
+    if report['summary'] is not None:
+        report['summary'] = pd.DataFrame(report['summary']['data'], columns=report['summary']['columns'])
+    base = path[:-len('.json')]
+    report['files'] = {extension: base + extension for extension in ('.html', '.pdf') if os.path.exists(base + extension)}
+    with _reports_lock:
+        _reports[path] = (mtime, report)
+    return report
+
+
+# Función para mostrar el aviso de reporte pre-generado con las descargas de sus archivos
+def render_report_files(report):
+    st.caption(f"📄 Reporte del cierre de {report['month']} (generado el {report['generated_at']})")
+    mimes = {'.html': "text/html", '.pdf': "application/pdf"}
+    columns = st.columns(len(report['files']) or 1)
+    for column, (extension, path) in zip(columns, report['files'].items()):
+        with column, open(path, 'rb') as f:
+            st.download_button(
+                f"📥 Descargar {extension[1:].upper()}",
+                f,
+                file_name=os.path.basename(path),
+                mime=mimes[extension],
+                key=f"reporte_{extension}"
+            )
+
+
+# Función para generar los reportes de los meses cerrados; se omiten los ya generados que siguen vigentes.
+# Devuelve la lista de (empresa, mes, estado).
+def generate_reports(companies=None, months=None, reports_dir=None, force=False, offline=False, pdf=False, today=None):
+    current = pd.Period(today or date.today(), 'M')
+    results = []
+    for company in companies or list(ledger_store.CSV_FILES):
+        df = ledger_store.load_company_ledger(company)
+        if df is None or df.empty:
+            continue
+        ledger_months = df['Fecha'].dt.to_period('M').unique()
+        for period in sorted(period for period in ledger_months if period < current):
+            month = str(period)
+            if months and month not in months:
+                continue
+            existing = None if force else load_report(company, month, reports_dir)
+            if existing is not None and report_current(existing, df):
+                results.append((company, month, "sin cambios"))
+                continue
+            write_report(build_month_report(company, month, df), reports_dir, offline, pdf)
+            results.append((company, month, "generado"))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generación de reportes mensuales (meses cerrados)")
+    parser.add_argument("--company", action="append", help="empresa (por defecto, todas)")
+    parser.add_argument("--month", action="append", help="mes YYYY-MM (por defecto, todos los cerrados)")
+    parser.add_argument("--out", default=None, help=f"directorio de salida (por defecto {REPORTS_DIR})")
+    parser.add_argument("--force", action="store_true", help="regenerar aunque el mes no haya cambiado")
+    parser.add_argument("--offline", action="store_true", help="embeber plotly.js en el HTML (sin CDN)")
+    parser.add_argument("--pdf", action="store_true", help="generar también PDF (requiere kaleido y weasyprint)")
+    args = parser.parse_args()
+
+    if args.pdf and weasyprint is None:
+        parser.error("--pdf requiere weasyprint y kaleido instalados")
+    started = time.perf_counter()
+    results = generate_reports(args.company, args.month, args.out, args.force, args.offline, args.pdf)
+    for company, month, status in results:
+        print(f"{company:<20} {month}  {status}")
+    print(f"{sum(status == 'generado' for *_, status in results)} reportes generados en {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
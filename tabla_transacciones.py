@@ -0,0 +1,108 @@
+import math
+
+import streamlit as st
+
+# Tamaños de página disponibles para la tabla de transacciones
+PAGE_SIZES = [25, 50, 100, 250]
+
+INCOME_COLOR = "#10b981"
+EXPENSE_COLOR = "#ef4444"
+
+
+# Función para escapar HTML en una columna completa
+def _escape(series):
+    return (
+        series.astype(str)
+        .str.replace('&', '&amp;', regex=False)
+        .str.replace('<', '&lt;', regex=False)
+        .str.replace('>', '&gt;', regex=False)
+    )
+
+
+# Función para construir los badges de una columna en una sola pasada
+def _badges(series, colors, default_color):
+    labels = _escape(series)
+    background = series.astype(str).map(colors).fillna(default_color)
+    return (
+        '<span style="background-color: ' + background + '; color: white; padding: 4px 12px; '
+        'border-radius: 12px; font-size: 0.8em; font-weight: bold; display: inline-block; '
+        'min-width: 80px; text-align: center; white-space: nowrap;">' + labels + '</span>'
+    )
+
+
+# Función para construir las celdas de monto (color y signo) en una sola pasada
+def _amounts(series):
+    positive = series > 0
+    color = positive.map({True: INCOME_COLOR, False: EXPENSE_COLOR})
+    sign = positive.map({True: "+", False: ""})
+    value = series.abs().map('{:,.0f}'.format)
+    return '<span style="color: ' + color + '; font-weight: bold;">' + sign + '$' + value + '</span>'
+
+
+# Función para generar el HTML de una página de transacciones
+def build_table_html(page_df, columns):
+    header = ''.join(
+        f'<th style="text-align: {align}; padding: 8px;">{label}</th>'
+        for label, _, align in columns
+    )
+    cells = [
+        '<td style="text-align: ' + align + '; padding: 8px;">' + render(page_df) + '</td>'
+        for _, render, align in columns
+    ]
+    rows = '<tr style="border-bottom: 1px solid rgba(128,128,128,0.2);">' + cells[0]
+    for cell in cells[1:]:
+        rows = rows + cell
+    body = ''.join((rows + '</tr>').tolist())
+    return (
+        '<table style="width: 100%; border-collapse: collapse;">'
+        f'<thead><tr style="border-bottom: 2px solid rgba(128,128,128,0.4);">{header}</tr></thead>'
+        f'<tbody>{body}</tbody></table>'
+    )
+
+
+# Columnas estándar: descripción, tipo, fecha y monto
+def default_columns(badge_column='Tipo', badge_label="Tipo", badge_colors=None, default_badge_color="#6b7280", extra_columns=()):
+    if badge_colors is None:
+        badge_colors = {"Ingreso": INCOME_COLOR}
+    return [
+        ("Descripción", lambda df: '<strong>' + _escape(df['Descripción']) + '</strong>', "left"),
+        (badge_label, lambda df: _badges(df[badge_column], badge_colors, default_badge_color), "center"),
+        *[(label, lambda df, c=column: _escape(df[c]), "left") for label, column in extra_columns],
+        ("Fecha", lambda df: df['Fecha'].dt.strftime('%d/%m/%Y'), "center"),
+        ("Monto", lambda df: _amounts(df['Monto']), "right")
+    ]
+
+
+# Función para mostrar una tabla paginada: el costo de render depende del tamaño de página, no del ledger
+def render_transaction_table(df, key, columns=None):
+    if columns is None:
+        columns = default_columns()
+
+    total = len(df)
+    col_size, col_page, col_info = st.columns([1, 1, 2])
+
+    with col_size:
+        page_size = st.selectbox("Filas por página", PAGE_SIZES, key=f"{key}_page_size")
+
+    page_count = max(1, math.ceil(total / page_size))
+    # Si el ledger o los filtros se achicaron, volver a una página válida
+    if st.session_state.get(f"{key}_page", 1) > page_count:
+        st.session_state[f"{key}_page"] = page_count
+    with col_page:
+        page_number = st.number_input(
+            "Página", min_value=1, max_value=page_count, step=1, key=f"{key}_page"
+        )
+
+    start = (int(page_number) - 1) * page_size
+    end = min(start + page_size, total)
+
+    with col_info:
+        st.markdown(
+            f'<p style="color: #666; margin-top: 2rem;">Mostrando {start + 1 if total else 0:,}–{end:,} '
+            f'de {total:,} transacciones (página {int(page_number)} de {page_count})</p>',
+            unsafe_allow_html=True
+        )
+
+    page_df = df.iloc[start:end]
+    if not page_df.empty:
+        st.markdown(build_table_html(page_df, columns), unsafe_allow_html=True)
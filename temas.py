@@ -0,0 +1,58 @@
+import re
+
+# Temas visuales por empresa (se definen una sola vez al importar el módulo)
+COMPANY_THEMES = {
+    "W TRAVEL CHILE": {
+        "primary": "#1e3a8a",
+        "secondary": "#3b82f6", 
+        "accent": "#fbbf24",
+        "light": "#f8fafc",
+        "gradient": "linear-gradient(135deg, #1e3a8a 0%, #3b82f6 100%)",
+        "income_gradient": "linear-gradient(135deg, #059669 0%, #10b981 100%)",
+        "expense_gradient": "linear-gradient(135deg, #dc2626 0%, #ef4444 100%)",
+        "logo": "🌍"
+    },
+    "WOLF TRAVEL CHILE": {
+        "primary": "#166534",
+        "secondary": "#22c55e",
+        "accent": "#ea580c", 
+        "light": "#f0fdf4",
+        "gradient": "linear-gradient(135deg, #166534 0%, #22c55e 100%)",
+        "income_gradient": "linear-gradient(135deg, #059669 0%, #10b981 100%)",
+        "expense_gradient": "linear-gradient(135deg, #dc2626 0%, #ef4444 100%)",
+        "logo": "🐺"
+    },
+    "HELPMETRAVEL SPA": {
+        "primary": "#7c3aed",
+        "secondary": "#a855f7",
+        "accent": "#1e40af",
+        "light": "#faf5ff", 
+        "gradient": "linear-gradient(135deg, #7c3aed 0%, #a855f7 100%)",
+        "income_gradient": "linear-gradient(135deg, #059669 0%, #10b981 100%)",
+        "expense_gradient": "linear-gradient(135deg, #dc2626 0%, #ef4444 100%)",
+        "logo": "🏢"
+    },
+    "Todas las empresas": {
+        "primary": "#334155",
+        "secondary": "#64748b",
+        "accent": "#0ea5e9",
+        "light": "#f8fafc",
+        "gradient": "linear-gradient(135deg, #334155 0%, #64748b 100%)",
+        "income_gradient": "linear-gradient(135deg, #059669 0%, #10b981 100%)",
+        "expense_gradient": "linear-gradient(135deg, #dc2626 0%, #ef4444 100%)",
+        "logo": "🌐"
+    }
+}
+
+
+# Función para obtener el tema CSS según la empresa
+def get_company_theme(company):
+    return COMPANY_THEMES.get(company, COMPANY_THEMES["W TRAVEL CHILE"])
+
+
+# Función para minificar un bloque <style>: menos bytes enviados al navegador en cada rerun
+def minify_css(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};:,>])\s*', r'\1', css)
+    return css.strip()